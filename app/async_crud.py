@@ -0,0 +1,144 @@
+from datetime import date
+
+from fastapi import HTTPException, status
+from pydantic import EmailStr
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import birthdays, crud, dedupe, jobs, models, schemas, search, verification, versions
+from .passwords import password_hasher
+from .tokens import token_service
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    db_user = await get_user_by_email(db, email=user.email)
+    if db_user:
+        raise HTTPException(status_code=409, detail="Email already registered")
+    hashed_password = await password_hasher.hash(user.password)
+    db_user = models.User(email=user.email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def set_user_role(db: AsyncSession, user_id: int, role: str):
+    db_user = await get_user(db, user_id)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user.role = role
+    crud.revoke_user_tokens(db, user_id)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def authenticate_user(db: AsyncSession, user: schemas.UserLogin):
+    db_user = await get_user_by_email(db, email=user.email)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    valid, new_hash = await password_hasher.verify(user.password, db_user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    if new_hash:
+        # Legacy scheme or cost factor: upgrade transparently while we know the password.
+        db_user.hashed_password = new_hash
+        await db.commit()
+    return db_user
+
+
+async def authenticate_user_and_get_tokens(db: AsyncSession, user: schemas.UserLogin):
+    db_user = await authenticate_user(db, user)
+    return token_service.issue_pair(db_user)
+
+
+async def refresh_tokens(db: AsyncSession, claims: dict):
+    # Role and email may have changed since the refresh token was minted.
+    db_user = await get_user(db, claims["uid"])
+    if db_user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    crud.revoke_token(db, claims)
+    await db.commit()
+    return token_service.issue_pair(db_user)
+
+
+async def get_contacts(db: AsyncSession, skip: int = 0, limit: int = 100, user_id: int = None):
+    return (await db.scalars(crud.contacts_statement(skip, limit, user_id))).all()
+
+
+async def get_contacts_page(db: AsyncSession, user_id: int, cursor: str | None = None, limit: int = 100):
+    contacts = (await db.scalars(crud.contacts_page_statement(user_id, cursor, limit))).all()
+    return crud.split_contacts_page(list(contacts), user_id, limit)
+
+
+async def create_contact(db: AsyncSession, contact: schemas.ContactCreate, user_id: int):
+    db_contact = models.Contact(**contact.dict(), owner_id=user_id,
+                                version=await versions.bump_async(db, user_id))
+    db.add(db_contact)
+    await db.commit()
+    await dedupe.refresh_async(db, user_id)
+    await db.refresh(db_contact)
+    return db_contact
+
+
+async def get_contact(db: AsyncSession, contact_id: int, user_id: int):
+    return await db.scalar(select(models.Contact).where(
+        models.Contact.id == contact_id, models.Contact.owner_id == user_id))
+
+
+async def update_contact(db: AsyncSession, contact_id: int, contact: schemas.ContactUpdate, user_id: int):
+    db_contact = await get_contact(db, contact_id, user_id)
+    if not db_contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    for field, value in contact.dict(exclude_unset=True).items():
+        setattr(db_contact, field, value)
+    db_contact.version = await versions.bump_async(db, db_contact.owner_id)
+    await db.commit()
+    await dedupe.refresh_async(db, db_contact.owner_id)
+    await db.refresh(db_contact)
+    return db_contact
+
+
+async def delete_contact(db: AsyncSession, contact_id: int, user_id: int):
+    db_contact = await get_contact(db, contact_id, user_id)
+    if not db_contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    db.add(versions.tombstone(db_contact.id, db_contact.owner_id,
+                              await versions.bump_async(db, db_contact.owner_id)))
+    await db.delete(db_contact)
+    await db.commit()
+    await dedupe.refresh_async(db, db_contact.owner_id)
+    return db_contact
+
+
+async def search_contacts(db: AsyncSession, query: str, user_id: int, skip: int = 0, limit: int = 100):
+    statement = search.search_statement(db.bind.dialect.name, query, user_id, skip, limit)
+    if statement is None:
+        return []
+    return (await db.scalars(statement)).all()
+
+
+async def get_contacts_with_upcoming_birthdays(db: AsyncSession, user_id: int, days: int = 7, today: date | None = None):
+    statement = birthdays.upcoming_statement(user_id, days, today)
+    return [] if statement is None else (await db.scalars(statement)).all()
+
+
+async def send_verification_email(email: EmailStr, db: AsyncSession):
+    user = await get_user_by_email(db, email)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    token = verification.issue(db, user.id)
+    # Delivered by the email worker (python -m app.worker) once this commits.
+    jobs.enqueue_verification_email(db, email, token)
+    await db.commit()
@@ -0,0 +1,185 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import AsyncIterator
+
+from fastapi import HTTPException, UploadFile, status
+
+from .metrics import timed
+from .settings import settings
+
+MAX_FILE_SIZE = 1 * 1024 * 1024  # 1 MB
+AVATAR_SIZE = settings.avatar_size
+STORAGE_BACKEND = settings.avatar_storage
+LOCAL_ROOT = settings.avatar_local_root
+LOCAL_URL = settings.avatar_local_url
+READ_CHUNK_SIZE = 64 * 1024
+# Decompression-bomb guard: a 1 MB PNG can still expand to gigapixels.
+MAX_IMAGE_PIXELS = 40_000_000
+
+MAGIC_NUMBERS = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+}
+PIL_FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG"}
+
+
+# Pillow and the pool are set up on the first upload, not at import.
+@lru_cache(maxsize=None)
+def _pillow():
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image, ImageOps
+
+
+# Pillow releases the GIL while decoding and resampling, so threads scale here.
+@lru_cache(maxsize=None)
+def _executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.avatar_workers, thread_name_prefix="avatar")
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    for magic, content_type in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return content_type
+    return None
+
+
+def _too_large():
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File size too large")
+
+
+async def read_limited(chunks: AsyncIterator[bytes], limit: int = MAX_FILE_SIZE) -> bytes:
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > limit:
+            raise _too_large()
+    return bytes(body)
+
+
+async def _upload_chunks(file: UploadFile):
+    while chunk := await file.read(READ_CHUNK_SIZE):
+        yield chunk
+
+
+async def read_upload(file: UploadFile, limit: int = MAX_FILE_SIZE) -> bytes:
+    # file.size is None for chunked uploads, so only trust it to reject early.
+    if file.size is not None and file.size > limit:
+        raise _too_large()
+    return await read_limited(_upload_chunks(file), limit)
+
+
+def check_content_length(header: str | None, limit: int = MAX_FILE_SIZE):
+    if header is not None and header.isdigit() and int(header) > limit:
+        raise _too_large()
+
+
+def _resize(data: bytes, content_type: str) -> tuple[bytes, str]:
+    Image, ImageOps = _pillow()
+    with Image.open(BytesIO(data), formats=[PIL_FORMATS[content_type]]) as image:
+        # open() only reads the header; Pillow itself raises at twice the limit.
+        if image.width * image.height > Image.MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(f"Image has {image.width * image.height} pixels")
+        # JPEG can decode straight at a reduced scale, skipping most of the pixels.
+        image.draft("RGB", (AVATAR_SIZE * 2, AVATAR_SIZE * 2))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = ImageOps.fit(image.convert("RGBA" if has_alpha else "RGB"),
+                             (AVATAR_SIZE, AVATAR_SIZE), Image.LANCZOS)
+        out = BytesIO()
+        if has_alpha:
+            image.save(out, "PNG", optimize=True)
+            return out.getvalue(), "image/png"
+        image.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        return out.getvalue(), "image/jpeg"
+
+
+async def process_avatar(data: bytes) -> tuple[bytes, str]:
+    content_type = sniff_image_type(data[:16])
+    if content_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type")
+    Image, _ = _pillow()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor(), _resize, data, content_type)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image")
+
+
+class AvatarStorage(ABC):
+    @abstractmethod
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        ...
+
+
+class CloudinaryStorage(AvatarStorage):
+    def __init__(self):
+        import cloudinary
+        import cloudinary.uploader
+
+        cloudinary.config(
+            cloud_name=settings.cloudinary_cloud_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret
+        )
+        self._cloudinary = cloudinary
+
+    def _upload(self, key: str, data: bytes) -> str:
+        result = self._cloudinary.uploader.upload(
+            BytesIO(data), public_id=key, overwrite=True, resource_type="image")
+        return result["secure_url"]
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        try:
+            return await asyncio.to_thread(self._upload, key, data)
+        except self._cloudinary.exceptions.Error as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error uploading file: {e}")
+
+
+class LocalStorage(AvatarStorage):
+    EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png"}
+
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, name: str, data: bytes):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        name = f"{key}.{self.EXTENSIONS[content_type]}"
+        await asyncio.to_thread(self._write, name, data)
+        return f"{self.base_url}/{name}"
+
+
+_storage: AvatarStorage | None = None
+
+
+def get_storage() -> AvatarStorage:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(LOCAL_ROOT, LOCAL_URL)
+        else:
+            _storage = CloudinaryStorage()
+    return _storage
+
+
+async def store_avatar(user_id: int, data: bytes, storage: AvatarStorage | None = None) -> str:
+    with timed("avatar_process"):
+        processed, content_type = await process_avatar(data)
+    with timed("avatar_upload"):
+        return await (storage or get_storage()).save(f"avatar_{user_id}", processed, content_type)
@@ -0,0 +1,183 @@
+from collections import Counter
+
+from fastapi import HTTPException, status
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import dedupe, models, schemas, stats, versions
+from .settings import settings
+
+MAX_OPERATIONS = settings.batch_max_operations
+
+contacts = models.Contact.__table__
+CONTACT_COLUMNS = [contacts.c[name] for name in schemas.Contact.__fields__]
+# Writes name the owner as well as the id, so a partitioned table only
+# touches the owners' partitions. executemany of UPDATE_STATEMENT takes its
+# SET clause from the parameter keys.
+UPDATE_STATEMENT = update(contacts).where(contacts.c.id == bindparam("target_id"),
+                                          contacts.c.owner_id == bindparam("target_owner_id"))
+
+
+def delete_statement(owner_ids, ids):
+    return delete(contacts).where(contacts.c.owner_id.in_(list(owner_ids)), contacts.c.id.in_(list(ids)))
+
+
+def check_batch_size(count: int):
+    if count > MAX_OPERATIONS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {MAX_OPERATIONS} operations per batch")
+
+
+def _result(index: int, code: int, contact_id: int | None = None, detail: str | None = None, contact: dict | None = None) -> dict:
+    return {"index": index, "id": contact_id, "status": code, "detail": detail, "contact": contact}
+
+
+# One IN query for every target; the rows carry owner_id, which is all the
+# can_edit_contact/can_delete_contact rules look at. Only admins look beyond
+# their own contacts, so other owners' ids read as missing, exactly like the
+# single-contact endpoints.
+def resolve_statement(user, ids):
+    statement = select(contacts.c.id, contacts.c.owner_id, contacts.c.birthday, contacts.c.additional_data).where(
+        contacts.c.id.in_(list(ids)))
+    if user.role != "admin":
+        statement = statement.where(contacts.c.owner_id == user.id)
+    return statement
+
+
+async def _resolve(db: AsyncSession, user, ids) -> dict:
+    return {row.id: row for row in await db.execute(resolve_statement(user, ids))}
+
+
+# (owner_id, email) -> contact id; emails are unique per owner (uq_contacts_owner_email).
+async def _email_owners(db: AsyncSession, owner_ids, emails) -> dict[tuple[int, str], int]:
+    rows = await db.execute(select(contacts.c.owner_id, contacts.c.email, contacts.c.id).where(
+        contacts.c.owner_id.in_(set(owner_ids)), contacts.c.email.in_(emails)))
+    return {(row.owner_id, row.email): row.id for row in rows}
+
+
+def _check_target(row, contact_id: int, seen: set, allowed) -> tuple[int, str] | None:
+    if row is None or not allowed(row):
+        return status.HTTP_404_NOT_FOUND, "Contact not found"
+    if contact_id in seen:
+        return status.HTTP_409_CONFLICT, "Contact appears more than once in the batch"
+    return None
+
+
+def _write_values(contact) -> dict:
+    values = contact.dict(exclude={"id"})
+    values.update(models.contact_derived_values(values))
+    return values
+
+
+async def _bump_owners(db: AsyncSession, owner_ids) -> dict[int, int]:
+    # Fixed order so two admin batches touching the same owners can't deadlock.
+    return {owner_id: await versions.bump_async(db, owner_id) for owner_id in sorted(set(owner_ids))}
+
+
+async def _apply(db: AsyncSession, statement, params=None, tombstones=(), counts=None) -> list:
+    # Everything accepted goes in one transaction; a constraint violation
+    # from a concurrent writer leaves nothing applied.
+    try:
+        result = await db.execute(statement, params) if params else await db.execute(statement)
+        rows = [dict(row._mapping) for row in result] if result.returns_rows else []
+        if tombstones:
+            await db.execute(insert(versions.tombstones), list(tombstones))
+        if counts:
+            await stats.record_async(db, counts)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Batch conflicts with a concurrent change; nothing was applied")
+    return rows
+
+
+async def create_contacts(db: AsyncSession, user, items: list[schemas.ContactCreate]) -> list[dict]:
+    check_batch_size(len(items))
+    email_owners = await _email_owners(db, [user.id], [item.email for item in items])
+    results, rows = [], []
+    for index, item in enumerate(items):
+        if (user.id, item.email) in email_owners:
+            results.append(_result(index, status.HTTP_409_CONFLICT, detail="Email already used by another contact"))
+            continue
+        email_owners[user.id, item.email] = None
+        results.append(_result(index, status.HTTP_201_CREATED))
+        rows.append({**_write_values(item), "owner_id": user.id})
+    if rows:
+        version = await versions.bump_async(db, user.id)
+        for row in rows:
+            row["version"] = version
+        # Multi-row VALUES with RETURNING: one statement for the whole batch.
+        counts = Counter()
+        for row in rows:
+            counts.update(stats.contact_changes(user.id, row["birthday"]))
+        inserted = await _apply(db, insert(contacts).values(rows).returning(*CONTACT_COLUMNS), counts=counts)
+        await dedupe.refresh_async(db, user.id)
+        created = {row["email"]: row for row in inserted}
+        for result, item in zip(results, items):
+            if result["status"] == status.HTTP_201_CREATED:
+                result["contact"] = created[item.email]
+                result["id"] = result["contact"]["id"]
+    return results
+
+
+async def update_contacts(db: AsyncSession, user, items: list[schemas.ContactBatchUpdate]) -> list[dict]:
+    check_batch_size(len(items))
+    existing = await _resolve(db, user, [item.id for item in items])
+    email_owners = await _email_owners(db, [row.owner_id for row in existing.values()], [item.email for item in items])
+    results, params, seen = [], [], set()
+    for index, item in enumerate(items):
+        row = existing.get(item.id)
+        error = _check_target(row, item.id, seen, user.can_edit_contact)
+        if error is None and email_owners.get((row.owner_id, item.email), item.id) != item.id:
+            error = status.HTTP_409_CONFLICT, "Email already used by another contact"
+        if error is not None:
+            results.append(_result(index, error[0], item.id, detail=error[1]))
+            continue
+        seen.add(item.id)
+        email_owners[row.owner_id, item.email] = item.id
+        values = _write_values(item)
+        if "additional_data" not in item.__fields_set__:
+            # Omitted means unchanged; executemany needs the same keys in every row.
+            values["additional_data"] = row.additional_data
+        params.append({"target_id": item.id, **values})
+        contact = {**item.dict(), "owner_id": row.owner_id, "additional_data": values["additional_data"]}
+        results.append(_result(index, status.HTTP_200_OK, item.id, contact=contact))
+    if params:
+        owner_versions = await _bump_owners(db, (existing[p["target_id"]].owner_id for p in params))
+        counts = Counter()
+        for p in params:
+            row = existing[p["target_id"]]
+            p["version"] = owner_versions[row.owner_id]
+            p["target_owner_id"] = row.owner_id
+            counts.update(stats.contact_changes(row.owner_id, row.birthday, -1))
+            counts.update(stats.contact_changes(row.owner_id, p["birthday"]))
+        await _apply(db, UPDATE_STATEMENT, params, counts=counts)
+        for owner_id in owner_versions:
+            await dedupe.refresh_async(db, owner_id)
+    return results
+
+
+async def delete_contacts(db: AsyncSession, user, ids: list[int]) -> list[dict]:
+    check_batch_size(len(ids))
+    existing = await _resolve(db, user, ids)
+    results, seen = [], set()
+    for index, contact_id in enumerate(ids):
+        error = _check_target(existing.get(contact_id), contact_id, seen, user.can_delete_contact)
+        if error is not None:
+            results.append(_result(index, error[0], contact_id, detail=error[1]))
+            continue
+        seen.add(contact_id)
+        results.append(_result(index, status.HTTP_200_OK, contact_id))
+    if seen:
+        owner_versions = await _bump_owners(db, (existing[contact_id].owner_id for contact_id in seen))
+        graves = [{"contact_id": contact_id, "owner_id": existing[contact_id].owner_id,
+                   "version": owner_versions[existing[contact_id].owner_id]} for contact_id in seen]
+        counts = Counter()
+        for contact_id in seen:
+            counts.update(stats.contact_changes(existing[contact_id].owner_id, existing[contact_id].birthday, -1))
+        await _apply(db, delete_statement(owner_versions, seen), tombstones=graves, counts=counts)
+        for owner_id in owner_versions:
+            await dedupe.refresh_async(db, owner_id)
+    return results
@@ -0,0 +1,92 @@
+from calendar import isleap
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import and_, case, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+DEFAULT_WINDOW_DAYS = 7
+FEB_28, FEB_29 = 228, 229
+
+
+def upcoming_ranges(today: date, days: int) -> list[tuple[int, int]]:
+    # Inclusive birthday_ordinal ranges covering [today, today + days).
+    if days <= 0:
+        return []
+    if days >= 366:
+        return [(101, 1231)]
+    last = today + timedelta(days=days - 1)
+    start, end = models.birthday_ordinal(today), models.birthday_ordinal(last)
+    # In common years Feb 29 birthdays are celebrated on Feb 28.
+    if end == FEB_28 and not isleap(last.year):
+        end = FEB_29
+    if start <= end and last.year == today.year:
+        return [(start, end)]
+    return [(start, 1231), (101, end)]
+
+
+def _window_filter(today: date, days: int):
+    ranges = upcoming_ranges(today, days)
+    if not ranges:
+        return None
+    return or_(*(models.Contact.birthday_ordinal.between(low, high) for low, high in ranges))
+
+
+def _days_until_order(today: date):
+    start = models.birthday_ordinal(today)
+    # Birthdays still ahead this year come before the ones after New Year.
+    return (case((models.Contact.birthday_ordinal >= start, 0), else_=1),
+            models.Contact.birthday_ordinal, models.Contact.id)
+
+
+def upcoming_statement(user_id: int, days: int = DEFAULT_WINDOW_DAYS, today: date | None = None):
+    today = today or date.today()
+    window = _window_filter(today, days)
+    if window is None:
+        return None
+    return select(models.Contact).where(
+        and_(models.Contact.owner_id == user_id, window)).order_by(*_days_until_order(today))
+
+
+def all_users_upcoming_statement(days: int = DEFAULT_WINDOW_DAYS, today: date | None = None):
+    today = today or date.today()
+    window = _window_filter(today, days)
+    if window is None:
+        return None
+    return select(models.Contact).where(window).order_by(
+        models.Contact.owner_id, *_days_until_order(today))
+
+
+def get_upcoming_birthdays(db: Session, user_id: int, days: int = DEFAULT_WINDOW_DAYS, today: date | None = None):
+    statement = upcoming_statement(user_id, days, today)
+    return [] if statement is None else db.scalars(statement).all()
+
+
+# Single query for the daily reminder job, grouped by owner.
+def get_upcoming_birthdays_for_all_users(db: Session, days: int = DEFAULT_WINDOW_DAYS, today: date | None = None) -> dict[int, list]:
+    statement = all_users_upcoming_statement(days, today)
+    grouped = defaultdict(list)
+    if statement is not None:
+        for contact in db.scalars(statement.execution_options(yield_per=1000)):
+            grouped[contact.owner_id].append(contact)
+    return dict(grouped)
+
+
+def backfill_birthday_ordinals(db: Session, batch_size: int = 5000) -> int:
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(models.Contact.id, models.Contact.owner_id, models.Contact.birthday).where(
+                models.Contact.id > last_id).order_by(models.Contact.id).limit(batch_size)).all()
+        if not rows:
+            break
+        db.bulk_update_mappings(models.Contact, [
+            {"id": contact_id, "owner_id": owner_id, "birthday_ordinal": models.birthday_ordinal(birthday)}
+            for contact_id, owner_id, birthday in rows])
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
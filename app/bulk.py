@@ -0,0 +1,241 @@
+import codecs
+import csv
+import io
+import json
+from collections import Counter, deque
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import dedupe, models, schemas, stats, versions
+
+CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 2000
+# Keeps the import report bounded for files that are mostly garbage.
+MAX_REPORTED_ERRORS = 1000
+# A quoted CSV field may span lines, but not without limit.
+MAX_QUOTED_RECORD_SIZE = 64 * 1024
+
+EXPORT_FIELDS = list(schemas.Contact.__fields__)
+DATA_INDEX = EXPORT_FIELDS.index("additional_data")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Incremental, so a character split across chunks survives; a bad byte
+    # becomes U+FFFD and fails validation of its own row only.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+def _ends_in_quotes(line: str, quoted: bool) -> bool:
+    # Same rules as the csv module: a quote opens a field only at its start
+    # (O"Brien is literal) and "" inside a quoted field is an escaped quote.
+    field_start = not quoted
+    index = 0
+    while index < len(line):
+        char = line[index]
+        if quoted:
+            if char == '"':
+                if line.startswith('"', index + 1):
+                    index += 1
+                else:
+                    quoted = False
+        elif char == '"' and field_start:
+            quoted = True
+        field_start = char == "," and not quoted
+        index += 1
+    return quoted
+
+
+# Raw CSV records: a line, or several when a quoted field holds newlines.
+# None stands for a record whose quote isn't closed within
+# MAX_QUOTED_RECORD_SIZE characters (or by the end of the input).
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[str | None]:
+    replay = deque()
+    pending, quoted, size = [], False, 0
+    while True:
+        line = replay.popleft() if replay else await anext(lines, None)
+        if line is None:
+            if not pending:
+                return
+        else:
+            pending.append(line)
+            size += len(line)
+            quoted = _ends_in_quotes(line, quoted)
+            if not quoted:
+                yield "".join(pending)
+                pending, size = [], 0
+                continue
+            if size <= MAX_QUOTED_RECORD_SIZE:
+                continue
+        # Give up on the record and resync on its second line, so one stray
+        # quote can't swallow the rest of the file.
+        yield None
+        replay.extendleft(reversed(pending[1:]))
+        pending, quoted, size = [], False, 0
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[dict | str]:
+    header = None
+    async for record in _csv_records(lines):
+        if record is None:
+            yield f"Quoted field not closed within {MAX_QUOTED_RECORD_SIZE} characters"
+            continue
+        if not record.strip():
+            continue
+        try:
+            values = next(csv.reader([record]))
+        except csv.Error as e:
+            yield f"Invalid CSV: {e}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        record = dict(zip(header, values))
+        # additional_data travels as a JSON cell; empty means none.
+        raw = record.pop("additional_data", "")
+        if raw:
+            try:
+                record["additional_data"] = json.loads(raw)
+            except ValueError as e:
+                yield f"Invalid additional_data JSON: {e}"
+                continue
+        yield record
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[dict | str]:
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            # Reported as a per-row error by import_contacts.
+            yield f"Invalid JSON: {e}"
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row: int, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "detail": detail})
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _insert_values(contact: schemas.ContactCreate, user_id: int) -> dict:
+    values = {**contact.dict(), "owner_id": user_id}
+    values.update(models.contact_derived_values(values))
+    return values
+
+
+async def _flush_chunk(db: AsyncSession, chunk: list[tuple[int, dict]], report: ImportReport):
+    if not chunk:
+        return
+    # One version per chunk: a delta client sees the chunk as a single change.
+    version = await versions.bump_async(db, chunk[0][1]["owner_id"])
+    for _, values in chunk:
+        values["version"] = version
+    inserted = [values for _, values in chunk]
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(models.Contact), inserted)
+    except IntegrityError:
+        # Isolate the offending rows; the rest of the chunk still goes in.
+        inserted = []
+        for row_number, values in chunk:
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(models.Contact), [values])
+                inserted.append(values)
+            except IntegrityError as e:
+                report.error(row_number, f"Conflicts with an existing contact: {e.orig}")
+    report.inserted += len(inserted)
+    counts = Counter()
+    for values in inserted:
+        counts.update(stats.contact_changes(values["owner_id"], values["birthday"]))
+    await stats.record_async(db, counts)
+    await db.commit()
+
+
+async def import_contacts(db: AsyncSession, user_id: int, chunks: AsyncIterator[bytes], fmt: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    lines = iter_lines(chunks)
+    records = iter_csv_records(lines) if fmt == "csv" else iter_ndjson_records(lines)
+    report = ImportReport()
+    chunk = []
+    row_number = 0
+    async for record in records:
+        row_number += 1
+        if isinstance(record, str):
+            report.error(row_number, record)
+            continue
+        try:
+            contact = schemas.ContactCreate(**record)
+        except (ValidationError, TypeError) as e:
+            report.error(row_number, e.errors() if isinstance(e, ValidationError) else str(e))
+            continue
+        chunk.append((row_number, _insert_values(contact, user_id)))
+        if len(chunk) >= chunk_size:
+            await _flush_chunk(db, chunk, report)
+            chunk = []
+    await _flush_chunk(db, chunk, report)
+    await dedupe.refresh_async(db, user_id)
+    return report.as_dict()
+
+
+def _encode_csv(rows, with_header: bool) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if with_header:
+        writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row = list(row)
+        if row[DATA_INDEX] is not None:
+            row[DATA_INDEX] = json.dumps(row[DATA_INDEX], ensure_ascii=False)
+        writer.writerow(row)
+    return out.getvalue()
+
+
+def _encode_ndjson(rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str, ensure_ascii=False) + "\n"
+        for row in rows)
+
+
+async def export_contacts(db: AsyncSession, user_id: int, fmt: str) -> AsyncIterator[str]:
+    columns = [getattr(models.Contact, name) for name in EXPORT_FIELDS]
+    statement = select(*columns).where(models.Contact.owner_id == user_id).order_by(
+        models.Contact.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    result = await db.stream(statement)
+    first = True
+    async for rows in result.partitions():
+        if fmt == "csv":
+            yield _encode_csv(rows, with_header=first)
+        else:
+            yield _encode_ndjson(rows)
+        first = False
+    if first and fmt == "csv":
+        yield _encode_csv([], with_header=True)
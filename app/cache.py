@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .settings import settings
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    id: int
+    email: str
+    role: str
+    avatar_url: str | None
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(id=user.id, email=user.email, role=user.role, avatar_url=user.avatar_url)
+
+    def can_view_contact(self, contact) -> bool:
+        return self.role == "admin" or contact.owner_id == self.id
+
+    def can_edit_contact(self, contact) -> bool:
+        return self.role == "admin" or contact.owner_id == self.id
+
+    def can_delete_contact(self, contact) -> bool:
+        return self.role == "admin" or contact.owner_id == self.id
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# Keyed by the JWT subject (the user's email). Per process: the TTL bounds how
+# long another worker can serve a snapshot after a write it did not see.
+user_cache = TTLCache(
+    maxsize=settings.user_cache_size,
+    ttl=settings.user_cache_ttl,
+)
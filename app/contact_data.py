@@ -0,0 +1,121 @@
+import json
+import re
+
+from fastapi import HTTPException, status
+from sqlalchemy import Integer, String, and_, bindparam, cast, column, exists, func, literal, select, table, type_coerce, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Contact.additional_data is a JSON object; tag=vip matches {"tags": [..., "vip", ...]}.
+TAGS_KEY = "tags"
+# Free-text payloads from before the JSON column are kept under this key.
+NOTE_KEY = "note"
+MAX_FILTERS = 10
+# Top-level keys only, and nothing that needs quoting in a JSON path.
+KEY_PATTERN = re.compile(r"[A-Za-z0-9_\-]{1,64}")
+# PostgreSQL migration: the converted payloads are staged in this column.
+STAGING_COLUMN = "additional_data_json"
+
+legacy_contacts = table("contacts", column("id", Integer), column("additional_data", String),
+                        column(STAGING_COLUMN, String))
+
+
+def _bad_filter(detail: str):
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+# ?tag=vip&tag=family&data=company:Acme -> {"company": "Acme", "tags": ["vip", "family"]}.
+# Every condition must hold; values are compared as strings.
+def parse_filters(tags: list[str], fields: list[str]) -> dict:
+    if len(tags) + len(fields) > MAX_FILTERS:
+        raise _bad_filter(f"At most {MAX_FILTERS} data filters per request")
+    document = {}
+    for field in fields:
+        key, separator, value = field.partition(":")
+        if not separator or not KEY_PATTERN.fullmatch(key) or key == TAGS_KEY:
+            raise _bad_filter(f"Invalid data filter {field!r}; expected key:value")
+        if key in document:
+            raise _bad_filter(f"Data filter key {key!r} given more than once")
+        document[key] = value
+    if tags:
+        document[TAGS_KEY] = list(dict.fromkeys(tags))
+    return document
+
+
+def filter_clause(dialect: str, document: dict):
+    data = models.Contact.additional_data
+    if dialect == "postgresql":
+        # JSONB containment, served by ix_contacts_owner_additional_data (GIN).
+        # Bound as JSON text so the statement can also be rendered for EXPLAIN.
+        return type_coerce(data, JSONB).contains(cast(literal(json.dumps(document, ensure_ascii=False), String), JSONB))
+    # JSON1: one json_extract per key, and json_each over the tag array.
+    clauses = [data[key].as_string() == value for key, value in document.items() if key != TAGS_KEY]
+    for tag in document.get(TAGS_KEY, ()):
+        elements = func.json_each(data, f"$.{TAGS_KEY}").table_valued("value")
+        clauses.append(exists(select(1).select_from(elements).where(elements.c.value == tag)))
+    return and_(*clauses)
+
+
+def apply_filters(statement, dialect: str, document: dict):
+    if statement is None or not document:
+        return statement
+    return statement.where(filter_clause(dialect, document))
+
+
+# For merges: the first document wins on conflicting keys, lists (tags) are unioned.
+def merge_documents(documents) -> dict | None:
+    merged = {}
+    for document in documents:
+        for key, value in (document or {}).items():
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(merged[key], list) and isinstance(value, list):
+                merged[key] = merged[key] + [item for item in value if item not in merged[key]]
+    return merged or None
+
+
+# Legacy payloads were opaque strings: JSON objects are kept as they are,
+# anything else is wrapped as {"note": text}.
+def to_document(raw: str | None) -> dict | None:
+    if raw is None or not raw.strip():
+        return None
+    try:
+        document = json.loads(raw)
+    except ValueError:
+        return {NOTE_KEY: raw}
+    return document if isinstance(document, dict) else {NOTE_KEY: raw}
+
+
+def _document_text(raw: str | None) -> str | None:
+    document = to_document(raw)
+    return None if document is None else json.dumps(document, ensure_ascii=False)
+
+
+# Batched rewrite of legacy string payloads into JSON text: in place on SQLite
+# (JSON1 reads TEXT), into STAGING_COLUMN on PostgreSQL. only_pending limits
+# it to rows whose staged value is still missing; commit=False keeps every
+# batch in the caller's transaction.
+def convert_legacy_data(db: Session, batch_size: int = 5000, only_pending: bool = False, commit: bool = True) -> int:
+    postgresql = db.get_bind().dialect.name == "postgresql"
+    source = legacy_contacts.c.additional_data
+    target = legacy_contacts.c[STAGING_COLUMN] if postgresql else source
+    value = bindparam("document", type_=String)
+    statement = update(legacy_contacts).where(legacy_contacts.c.id == bindparam("target_id")).values(
+        {target: cast(value, JSONB) if postgresql else value})
+    converted = 0
+    last_id = 0
+    while True:
+        query = select(legacy_contacts.c.id, source).where(legacy_contacts.c.id > last_id, source.is_not(None))
+        if only_pending:
+            query = query.where(target.is_(None))
+        rows = db.execute(query.order_by(legacy_contacts.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        db.execute(statement, [{"target_id": row.id, "document": _document_text(row.additional_data)} for row in rows])
+        if commit:
+            db.commit()
+        converted += len(rows)
+        last_id = rows[-1].id
+    return converted
@@ -1,21 +1,15 @@
 from sqlalchemy.orm import Session
-from . import models, schemas
-from datetime import date, timedelta
-from sqlalchemy import or_
-from fastapi import HTTPException, status, BackgroundTasks
-from passlib.context import CryptContext
-from jose import jwt
-from datetime import datetime, timedelta
-from fastapi_mail import FastMail, MessageSchema
-from secrets import token_urlsafe
+from . import birthdays, dedupe, jobs, models, schemas, search, verification, versions
+from .passwords import pwd_context
+from .tokens import REFRESH_TOKEN_EXPIRE_MINUTES, token_service
+from datetime import date, datetime, timedelta
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import json
+from sqlalchemy import select, tuple_
+from fastapi import HTTPException, status
+import time
 from pydantic import EmailStr
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
-ALGORITHM = "HS256"
-SECRET_KEY = "secret_key"
-
 
 def get_user(db: Session, user_id: int):
     return db.query(models.User).get(user_id)
@@ -37,6 +31,18 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+def set_user_role(db: Session, user_id: int, role: str):
+    db_user = get_user(db, user_id)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user.role = role
+    # Access tokens embed the role, so tokens issued before the change must die.
+    revoke_user_tokens(db, user_id)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
 def authenticate_user(db: Session, user: schemas.UserCreate):
     db_user = get_user_by_email(db, email=user.email)
     if not db_user or not db_user.verify_password(user.password):
@@ -44,17 +50,82 @@ def authenticate_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
-def get_contacts(db: Session, skip: int = 0, limit: int = 100, user_id: int = None):
-    query = db.query(models.Contact)
+def authenticate_user_and_get_tokens(db: Session, user: schemas.UserLogin):
+    db_user = authenticate_user(db, user)
+    return token_service.issue_pair(db_user)
+
+
+# Both only add rows, so they work with Session and AsyncSession alike; the
+# local deny-set is updated right away, other workers pick it up on refresh.
+def revoke_token(db, claims: dict):
+    db.add(models.RevokedToken(jti=claims["jti"], expires_at=datetime.utcfromtimestamp(claims["exp"])))
+    token_service.revocations.revoke_jti(claims["jti"])
+
+
+def revoke_user_tokens(db, user_id: int):
+    now = datetime.utcnow()
+    db.add(models.RevokedToken(user_id=user_id, not_before=now,
+                               expires_at=now + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)))
+    token_service.revocations.revoke_user(user_id, time.time())
+
+
+def contacts_statement(skip: int = 0, limit: int = 100, user_id: int = None):
+    statement = select(models.Contact)
     if user_id:
-        query = query.filter(models.Contact.owner_id == user_id)
-    return query.offset(skip).limit(limit).all()
+        statement = statement.where(models.Contact.owner_id == user_id)
+    return statement.order_by(models.Contact.id).offset(skip).limit(limit)
+
+
+def get_contacts(db: Session, skip: int = 0, limit: int = 100, user_id: int = None):
+    return db.scalars(contacts_statement(skip, limit, user_id)).all()
+
+
+def encode_contact_cursor(owner_id: int, last_name: str, contact_id: int) -> str:
+    raw = json.dumps([owner_id, last_name, contact_id], separators=(",", ":"))
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_contact_cursor(cursor: str) -> tuple[int, str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        owner_id, last_name, contact_id = json.loads(urlsafe_b64decode(padded))
+        if not (isinstance(owner_id, int) and isinstance(last_name, str) and isinstance(contact_id, int)):
+            raise ValueError(cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return owner_id, last_name, contact_id
+
+
+def contacts_page_statement(user_id: int, cursor: str | None, limit: int):
+    statement = select(models.Contact).where(models.Contact.owner_id == user_id)
+    if cursor:
+        owner_id, last_name, contact_id = decode_contact_cursor(cursor)
+        if owner_id != user_id:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(
+            tuple_(models.Contact.last_name, models.Contact.id) > tuple_(last_name, contact_id))
+    return statement.order_by(models.Contact.last_name, models.Contact.id).limit(limit + 1)
+
+
+def split_contacts_page(contacts: list, user_id: int, limit: int):
+    if len(contacts) <= limit:
+        return contacts, None
+    contacts = contacts[:limit]
+    last = contacts[-1]
+    return contacts, encode_contact_cursor(user_id, last.last_name, last.id)
+
+
+def get_contacts_page(db: Session, user_id: int, cursor: str | None = None, limit: int = 100):
+    contacts = db.scalars(contacts_page_statement(user_id, cursor, limit)).all()
+    return split_contacts_page(list(contacts), user_id, limit)
 
 
 def create_contact(db: Session, contact: schemas.ContactCreate, user_id: int):
-    db_contact = models.Contact(**contact.dict(), owner_id=user_id)
+    db_contact = models.Contact(**contact.dict(), owner_id=user_id,
+                                version=versions.bump(db, user_id))
     db.add(db_contact)
     db.commit()
+    dedupe.refresh(db, user_id)
     db.refresh(db_contact)
     return db_contact
 
@@ -68,8 +139,11 @@ def update_contact(db: Session, contact_id: int, contact: schemas.ContactUpdate,
     db_contact = get_contact(db, contact_id, user_id)
     if not db_contact:
         raise HTTPException(status_code=404, detail="Contact not found")
-    db_contact.update(contact.dict(exclude_unset=True))
+    for field, value in contact.dict(exclude_unset=True).items():
+        setattr(db_contact, field, value)
+    db_contact.version = versions.bump(db, db_contact.owner_id)
     db.commit()
+    dedupe.refresh(db, db_contact.owner_id)
     db.refresh(db_contact)
     return db_contact
 
@@ -78,50 +152,30 @@ def delete_contact(db: Session, contact_id: int, user_id: int):
     db_contact = get_contact(db, contact_id, user_id)
     if not db_contact:
         raise HTTPException(status_code=404, detail="Contact not found")
+    db.add(versions.tombstone(db_contact.id, db_contact.owner_id,
+                              versions.bump(db, db_contact.owner_id)))
     db.delete(db_contact)
     db.commit()
+    dedupe.refresh(db, db_contact.owner_id)
     return db_contact
 
 
-def search_contacts(db: Session, query: str, user_id: int):
-    return db.query(models.Contact).filter(
-        models.Contact.owner_id == user_id,
-        or_(
-            models.Contact.first_name.ilike(f"%{query}%"),
-            models.Contact.last_name.ilike(f"%{query}%"),
-            models.Contact.email.ilike(f"%{query}%")
-        )
-    ).all()
-
-
-def get_contacts_with_upcoming_birthdays(db: Session, user_id: int):
-    today = date.today()
-    next_week = today + timedelta(days=7)
-    return db.query(models.Contact).filter(
-        models.Contact.owner_id == user_id,
-        models.Contact.birthday >= today,
-        models.Contact.birthday < next_week
-    ).all()
+def search_contacts(db: Session, query: str, user_id: int, skip: int = 0, limit: int = 100):
+    return search.search_contacts(db, query, user_id, skip=skip, limit=limit)
+
+
+def get_contacts_with_upcoming_birthdays(db: Session, user_id: int, days: int = 7, today: date | None = None):
+    return birthdays.get_upcoming_birthdays(db, user_id, days=days, today=today)
 
 
-def send_verification_email(email: EmailStr, db: Session, background_tasks: BackgroundTasks):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def send_verification_email(email: EmailStr, db: Session):
+    user = get_user_by_email(db, email)
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    token = token_urlsafe(32)
-    user.email_verification_token = token
+    token = verification.issue(db, user.id)
+    # Delivered by the email worker (python -m app.worker) once this commits.
+    jobs.enqueue_verification_email(db, email, token)
     db.commit()
-
-    message = MessageSchema(
-        subject="Підтвердження електронної пошти",
-        recipients=[email],
-        body=f"Для підтвердження вашої електронної пошти, будь ласка, перейдіть за посиланням: http://127.0.0.1:8000/users/verify/{token}",
-    )
-
-    fm = FastMail()
-    background_tasks.add_task(fm.send_message, message)
-
-
@@ -0,0 +1,231 @@
+from collections import defaultdict
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import contact_data, models, versions
+from .serialization import CONTACT_COLUMNS, contact_dicts
+from .settings import settings
+
+# Pairs scoring below this are not stored.
+MIN_SCORE = settings.dedupe_min_score
+# A key value shared by more contacts than this (a very common name) says
+# nothing about any one pair, and would make its block quadratic.
+MAX_BLOCK = settings.dedupe_max_block
+CHUNK_SIZE = 500
+
+contacts = models.Contact.__table__
+users = models.User.__table__
+duplicates = models.ContactDuplicate.__table__
+KEY_COLUMNS = (contacts.c.email_key, contacts.c.phone_e164, contacts.c.name_key)
+DEDUPE_COLUMNS = (contacts.c.id, contacts.c.first_name, contacts.c.last_name, contacts.c.birthday, *KEY_COLUMNS)
+
+
+def _trigrams(row) -> set:
+    name = models.normalize_search_text(" ".join(filter(None, (row.first_name, row.last_name))))
+    text = f"  {name} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def score_pair(a, b) -> tuple[float, list[str]]:
+    score, reasons = 0.0, []
+    if a.email_key and a.email_key == b.email_key:
+        score += 0.6
+        reasons.append("email")
+    if a.phone_e164 and a.phone_e164 == b.phone_e164:
+        score += 0.5
+        reasons.append("phone")
+    if a.name_key and a.name_key == b.name_key:
+        reasons.append("name")
+    # Trigram Jaccard similarity of the full names catches typos the keys miss.
+    a_grams, b_grams = _trigrams(a), _trigrams(b)
+    if a_grams and b_grams:
+        score += 0.4 * len(a_grams & b_grams) / len(a_grams | b_grams)
+    if a.birthday and a.birthday == b.birthday:
+        score += 0.1
+        reasons.append("birthday")
+    return round(min(score, 1.0), 3), reasons
+
+
+def _score_into(pairs: dict, a, b):
+    key = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+    if key not in pairs:
+        pairs[key] = score_pair(a, b)
+
+
+def _pair_block(block: list, pairs: dict):
+    if 2 <= len(block) <= MAX_BLOCK:
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                _score_into(pairs, a, b)
+
+
+def _store(db: Session, owner_id: int, pairs: dict) -> int:
+    rows = [{"owner_id": owner_id, "contact_id": contact_id, "duplicate_id": duplicate_id,
+             "score": score, "reasons": ",".join(reasons)}
+            for (contact_id, duplicate_id), (score, reasons) in pairs.items() if score >= MIN_SCORE]
+    for start in range(0, len(rows), 5000):
+        db.execute(insert(duplicates), rows[start:start + 5000])
+    return len(rows)
+
+
+def _forget(db: Session, contact_ids: list[int]):
+    for start in range(0, len(contact_ids), CHUNK_SIZE):
+        chunk = contact_ids[start:start + CHUNK_SIZE]
+        db.execute(delete(duplicates).where(
+            or_(duplicates.c.contact_id.in_(chunk), duplicates.c.duplicate_id.in_(chunk))))
+
+
+def _lock_owner(db: Session, owner_id: int):
+    # Serializes refresh/rebuild of one owner against each other and against
+    # writers, which bump contacts_version on the same row.
+    return db.execute(select(users.c.dedupe_version, users.c.contacts_version)
+                      .where(users.c.id == owner_id).with_for_update()).one()
+
+
+def _advance(db: Session, owner_id: int, version: int):
+    db.execute(update(users).where(users.c.id == owner_id, users.c.dedupe_version < version)
+               .values(dedupe_version=version))
+
+
+# Incremental: re-pairs only contacts written or deleted since the owner's
+# dedupe_version. Every write path calls it after committing.
+def refresh(db: Session, owner_id: int) -> int:
+    seen, current = _lock_owner(db, owner_id)
+    if current <= seen:
+        db.commit()
+        return 0
+    changed = db.scalars(select(contacts.c.id).where(
+        contacts.c.owner_id == owner_id, contacts.c.version > seen)).all()
+    gone = db.scalars(select(versions.tombstones.c.contact_id).where(
+        versions.tombstones.c.owner_id == owner_id, versions.tombstones.c.version > seen)).all()
+    _forget(db, [*changed, *gone])
+
+    pairs = {}
+    for start in range(0, len(changed), CHUNK_SIZE):
+        rows = db.execute(select(*DEDUPE_COLUMNS).where(
+            contacts.c.owner_id == owner_id, contacts.c.id.in_(changed[start:start + CHUNK_SIZE]))).all()
+        # One blocking query for the chunk: every contact sharing any key with it.
+        conditions = []
+        for column in KEY_COLUMNS:
+            values = {row._mapping[column.name] for row in rows} - {None}
+            if values:
+                conditions.append(column.in_(values))
+        if not conditions:
+            continue
+        blocks = defaultdict(list)
+        for candidate in db.execute(select(*DEDUPE_COLUMNS).where(contacts.c.owner_id == owner_id, or_(*conditions))):
+            for column in KEY_COLUMNS:
+                value = candidate._mapping[column.name]
+                if value is not None:
+                    blocks[column.name, value].append(candidate)
+        for row in rows:
+            for column in KEY_COLUMNS:
+                block = blocks.get((column.name, row._mapping[column.name]), ())
+                if len(block) <= MAX_BLOCK:
+                    for candidate in block:
+                        if candidate.id != row.id:
+                            _score_into(pairs, row, candidate)
+    stored = _store(db, owner_id, pairs)
+    _advance(db, owner_id, current)
+    db.commit()
+    return stored
+
+
+async def refresh_async(db, owner_id: int) -> int:
+    return await db.run_sync(refresh, owner_id)
+
+
+# Batch job over a whole address book: one ordered pass per key, streaming,
+# so memory stays proportional to the largest block plus the pairs found.
+def rebuild(db: Session, owner_id: int) -> int:
+    _, current = _lock_owner(db, owner_id)
+    db.execute(delete(duplicates).where(duplicates.c.owner_id == owner_id))
+    pairs = {}
+    for column in KEY_COLUMNS:
+        statement = select(*DEDUPE_COLUMNS).where(
+            contacts.c.owner_id == owner_id, column.is_not(None)).order_by(column, contacts.c.id)
+        block, block_value = [], None
+        for row in db.execute(statement.execution_options(yield_per=10000)):
+            value = row._mapping[column.name]
+            if value != block_value:
+                _pair_block(block, pairs)
+                block, block_value = [], value
+            block.append(row)
+        _pair_block(block, pairs)
+    stored = _store(db, owner_id, pairs)
+    db.execute(update(users).where(users.c.id == owner_id).values(dedupe_version=current))
+    db.commit()
+    return stored
+
+
+def list_duplicates(db: Session, owner_id: int, min_score: float = MIN_SCORE, limit: int = 100) -> list[dict]:
+    pairs = db.execute(select(duplicates).where(
+        duplicates.c.owner_id == owner_id, duplicates.c.score >= min_score).order_by(
+        duplicates.c.score.desc(), duplicates.c.id).limit(limit)).all()
+    ids = {contact_id for pair in pairs for contact_id in (pair.contact_id, pair.duplicate_id)}
+    rows = db.execute(select(*CONTACT_COLUMNS).where(
+        contacts.c.owner_id == owner_id, contacts.c.id.in_(ids))).all() if ids else []
+    found = {contact["id"]: contact for contact in contact_dicts(rows)}
+    return [{"score": pair.score, "reasons": pair.reasons.split(",") if pair.reasons else [],
+             "contacts": [found[pair.contact_id], found[pair.duplicate_id]]}
+            for pair in pairs if pair.contact_id in found and pair.duplicate_id in found]
+
+
+# One transaction: the kept contact takes over missing fields and data of the
+# others, which are deleted (with tombstones, so delta clients see it).
+def merge(db: Session, owner_id: int, keep_id: int, merge_ids: list[int]) -> models.Contact:
+    merge_ids = [contact_id for contact_id in dict.fromkeys(merge_ids) if contact_id != keep_id]
+    if not merge_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nothing to merge")
+    found = {contact.id: contact for contact in db.scalars(
+        select(models.Contact).where(models.Contact.id.in_([keep_id, *merge_ids]),
+                                     models.Contact.owner_id == owner_id).with_for_update())}
+    if len(found) != len(merge_ids) + 1:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+
+    keep = found[keep_id]
+    others = [found[contact_id] for contact_id in merge_ids]
+    for other in others:
+        for field in ("phone_number", "birthday"):
+            if getattr(keep, field) is None:
+                setattr(keep, field, getattr(other, field))
+    keep.additional_data = contact_data.merge_documents(
+        [contact.additional_data for contact in (keep, *others)])
+
+    version = versions.bump(db, owner_id)
+    keep.version = version
+    for other in others:
+        db.add(versions.tombstone(other.id, owner_id, version))
+        db.delete(other)
+    db.commit()
+    refresh(db, owner_id)
+    db.refresh(keep)
+    return keep
+
+
+async def merge_async(db, owner_id: int, keep_id: int, merge_ids: list[int]) -> models.Contact:
+    return await db.run_sync(merge, owner_id, keep_id, merge_ids)
+
+
+# Backfill for rows written before email_key/name_key existed.
+def backfill_keys(db: Session, batch_size: int = 5000) -> int:
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(models.Contact.id, models.Contact.owner_id, models.Contact.first_name,
+                   models.Contact.last_name, models.Contact.email)
+            .where(models.Contact.id > last_id).order_by(models.Contact.id).limit(batch_size)).all()
+        if not rows:
+            break
+        db.bulk_update_mappings(models.Contact, [
+            {"id": row.id, "owner_id": row.owner_id, "email_key": models.email_key(row.email),
+             "name_key": models.name_key(row.first_name, row.last_name)}
+            for row in rows])
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
@@ -0,0 +1,94 @@
+import random
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .settings import settings
+
+MAX_ATTEMPTS = settings.email_max_attempts
+BACKOFF_BASE_SECONDS = settings.email_backoff_base
+BACKOFF_MAX_SECONDS = settings.email_backoff_max
+VERIFICATION_URL = settings.verification_url
+
+
+# Only adds the row: it commits together with the caller's transaction, so a
+# job exists if and only if the write that needed it does.
+def enqueue_email(db, recipient: str, subject: str, body: str) -> models.EmailJob:
+    job = models.EmailJob(recipient=recipient, subject=subject, body=body)
+    db.add(job)
+    return job
+
+
+def enqueue_verification_email(db, email: str, token: str) -> models.EmailJob:
+    return enqueue_email(
+        db, email,
+        subject="Підтвердження електронної пошти",
+        body=f"Для підтвердження вашої електронної пошти, будь ласка, перейдіть за посиланням: {VERIFICATION_URL.format(token=token)}",
+    )
+
+
+def _claimable(now: datetime):
+    return (
+        models.EmailJob.status == "pending",
+        models.EmailJob.run_after <= now,
+        or_(models.EmailJob.locked_until.is_(None), models.EmailJob.locked_until < now),
+    )
+
+
+def claim_batch(db: Session, worker_id: str, limit: int = 50, lease_seconds: int = 60, now: datetime | None = None) -> list[models.EmailJob]:
+    now = now or datetime.utcnow()
+    lease = f"{worker_id}:{uuid4().hex}"
+    # SKIP LOCKED lets concurrent workers on Postgres pick disjoint rows; the guarded
+    # UPDATE below is what actually decides ownership on every backend.
+    candidates = db.scalars(
+        select(models.EmailJob.id).where(*_claimable(now)).order_by(
+            models.EmailJob.run_after, models.EmailJob.id).limit(limit).with_for_update(skip_locked=True)
+    ).all()
+    if not candidates:
+        db.commit()
+        return []
+    db.execute(
+        update(models.EmailJob).where(models.EmailJob.id.in_(candidates), *_claimable(now)).values(
+            locked_by=lease, locked_until=now + timedelta(seconds=lease_seconds)
+        ).execution_options(synchronize_session=False))
+    db.commit()
+    return db.scalars(select(models.EmailJob).where(
+        models.EmailJob.locked_by == lease).order_by(models.EmailJob.id)).all()
+
+
+def backoff_delay(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+# Every write back names the claim's lease: once a lease has run out and
+# another worker re-claimed the job, the old worker's update matches nothing
+# instead of overwriting the new owner's state.
+def _update_leased(db: Session, lease: str, jobs: list[models.EmailJob], **values):
+    if jobs:
+        db.execute(update(models.EmailJob).where(
+            models.EmailJob.id.in_([job.id for job in jobs]), models.EmailJob.locked_by == lease
+        ).values(**values).execution_options(synchronize_session=False))
+
+
+def mark_sent(db: Session, lease: str, jobs: list[models.EmailJob]):
+    _update_leased(db, lease, jobs, status="sent", locked_by=None, locked_until=None, last_error=None)
+
+
+# Hands unsent jobs back before their lease runs out, for any worker to claim.
+def release(db: Session, lease: str, jobs: list[models.EmailJob]):
+    _update_leased(db, lease, jobs, locked_by=None, locked_until=None)
+
+
+def mark_failed(db: Session, lease: str, job: models.EmailJob, error: str, now: datetime | None = None):
+    now = now or datetime.utcnow()
+    attempts = job.attempts + 1
+    values = {"attempts": attempts, "last_error": error[:1000], "locked_by": None, "locked_until": None}
+    if attempts >= MAX_ATTEMPTS:
+        values["status"] = "dead"
+    else:
+        values["run_after"] = now + timedelta(seconds=backoff_delay(attempts))
+    _update_leased(db, lease, [job], **values)
@@ -1,72 +1,92 @@
-import cloudinary.uploader
-from dotenv import load_dotenv
-import os
-from fastapi import Depends, FastAPI, HTTPException, status, BackgroundTasks, File, UploadFile, Request
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Literal
+from fastapi import APIRouter, Body, Depends, FastAPI, HTTPException, status, File, UploadFile, Request, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from datetime import timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from fastapi.responses import Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from pydantic import EmailStr
 
-from . import crud, models, schemas
-from database import SessionLocal, engine
+from . import async_crud, avatars, batch, birthdays, bulk, contact_data, crud, dedupe, metrics, phones, schemas, search, stats, verification, versions
+from .cache import UserSnapshot, user_cache
+from .passwords import password_hasher
+from .ratelimit import RateLimiter, storage_from_url
+from .serialization import ContactsJSONResponse, contact_dicts, select_contact_rows
+from .settings import settings
+from .tokens import TokenError, load_revocations, token_service
+from database import AsyncSessionLocal, SessionLocal, async_engine, engine, replica_engines, replica_router
 
-load_dotenv()
-
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES"))
-ALGORITHM = os.getenv("ALGORITHM")
-SECRET_KEY = os.getenv("SECRET_KEY")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("EMAIL_USERNAME"),
-    MAIL_PASSWORD=os.getenv("EMAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("EMAIL_USERNAME"),
-    MAIL_PORT=int(os.getenv("EMAIL_PORT")),
-    MAIL_SERVER=os.getenv("EMAIL_HOST"),
-    MAIL_TLS=True,
-    MAIL_SSL=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-)
+# Rate-limit callers by user when they present a valid token, so clients
+# behind one proxy don't share a bucket.
+def rate_limit_identity(request: Request):
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        claims = token_service.verify(token)
+    except TokenError:
+        return None
+    return claims.get("uid", claims["sub"])
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Per client on /token/ and /token/refresh; load tests raise it via the environment.
+LOGIN_RATE_LIMIT = settings.rate_limit_login
 
-app = FastAPI()
-models.Base.metadata.create_all(bind=engine)
+limiter = RateLimiter(
+    storage_from_url(settings.rate_limit_storage),
+    default=settings.rate_limit_default,
+    identify=rate_limit_identity,
+)
 
+router = APIRouter()
 
 origins = [
     "*"
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-limiter = Limiter(key_func=get_remote_address, default_limits=["10/minute"])
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-MAX_FILE_SIZE = 1 * 1024 * 1024  # 1 MB
 
-ALLOWED_FILE_TYPES = ["image/jpeg", "image/png"]
+# The schema is not touched here: run `python -m app.manage bootstrap` once
+# per deployment instead of paying for catalog queries on every worker boot.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    token_service.revocations.loader = load_revocations(SessionLocal)
+    tasks = [asyncio.create_task(token_service.revocations.refresh_forever())]
+    if replica_engines:
+        tasks.append(asyncio.create_task(replica_router.check_forever(settings.db_replica_health_interval)))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        password_hasher.shutdown()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(dependencies=[Depends(limiter)], lifespan=lifespan)
+    if settings.avatar_storage == "local":
+        app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_root, check_dir=False), name="avatars")
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Outermost, so the timing covers CORS and every dependency.
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(async_engine.sync_engine)
+    for replica in replica_engines:
+        metrics.instrument_engine(replica)
+    app.include_router(router)
+    return app
 
 
 def get_db():
@@ -77,82 +97,288 @@ def get_db():
         db.close()
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
-    except JWTError:
+        claims = token_service.verify(token)
+    except TokenError:
         raise credentials_exception
-    user = crud.get_user_by_email(db, email=token_data.email)
+    email = claims["sub"]
+    snapshot = user_cache.get(email)
+    if snapshot is not None:
+        return snapshot
+    if "uid" in claims and "role" in claims:
+        # Signed claims are enough; role changes revoke the token instead.
+        return UserSnapshot(id=claims["uid"], email=email, role=claims["role"], avatar_url=None)
+    user = await async_crud.get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
-    return user
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.set(email, snapshot)
+    return snapshot
+
+
+# Read-only endpoints: a replica unless the user wrote moments ago.
+def get_read_db(current_user: UserSnapshot = Depends(get_current_user)):
+    db = replica_router.session(current_user.id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Contact writes: always the primary, and the writer's next reads stick to it.
+async def get_write_db(current_user: UserSnapshot = Depends(get_current_user)):
+    replica_router.mark_written(current_user.id)
+    async with AsyncSessionLocal() as db:
+        yield db
+    # Again once committed, so the window runs from the end of the write.
+    replica_router.mark_written(current_user.id)
+
+
+async def get_current_admin(current_user: UserSnapshot = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Admin privileges required")
+    return current_user
+
 
+@router.get("/metrics", include_in_schema=False)
+@limiter.exempt
+def read_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
-@app.post("/users/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+
+@router.post("/users/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return await async_crud.create_user(db=db, user=user)
 
 
-@app.post("/users/send_verification_email/")
-async def send_verification_email_endpoint(email: schemas.EmailSchema, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=email.email)
+@router.post("/users/send_verification_email/")
+async def send_verification_email_endpoint(email: schemas.EmailSchema, db: AsyncSession = Depends(get_async_db)):
+    user = await async_crud.get_user_by_email(db, email=email.email)
     if user is None or user.is_verified:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Invalid email or already verified")
-    crud.send_verification_email(email.email, db, background_tasks)
+    await async_crud.send_verification_email(email.email, db)
     return {"message": "Verification email sent"}
 
 
-@app.get("/users/verify/{token}")
-async def verify_email(token: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(
-        models.User.email_verification_token == token).first()
-    if user is None or user.is_verified:
+@router.get("/users/verify/{token}")
+async def verify_email(token: str, db: AsyncSession = Depends(get_async_db)):
+    if await verification.consume_async(db, token) is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Invalid token or already verified")
-    user.is_verified = True
-    db.commit()
     return {"message": "Email verified"}
 
 
-@app.post("/token/", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_user_and_get_tokens(db, schemas.UserLogin(
+@router.post("/token/", response_model=schemas.Token)
+@limiter.limit(LOGIN_RATE_LIMIT)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    tokens = await async_crud.authenticate_user_and_get_tokens(db, schemas.UserLogin(
         email=form_data.username, password=form_data.password))
+    return tokens
+
+
+@router.post("/token/refresh", response_model=schemas.Token)
+@limiter.limit(LOGIN_RATE_LIMIT)
+async def refresh_access_token(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    try:
+        claims = token_service.verify(body.refresh_token, token_type="refresh")
+    except TokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Could not validate credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return await async_crud.refresh_tokens(db, claims)
+
+
+async def _save_avatar(db: AsyncSession, user_id: int, content: bytes):
+    url = await avatars.store_avatar(user_id, content)
+    user = await async_crud.get_user(db, user_id)
+    user.avatar_url = url
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-@app.post("/users/avatar", response_model=schemas.User)
-async def upload_avatar(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    if file.size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File size too large")
+@router.post("/users/avatar", response_model=schemas.User)
+async def upload_avatar(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
+    content = await avatars.read_upload(file)
+    return await _save_avatar(db, current_user.id, content)
 
-    if file.content_type not in ALLOWED_FILE_TYPES:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type")
 
-    try:
-        result = cloudinary.uploader.upload(file.file)
-    except cloudinary.exceptions.CloudinaryError as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error uploading file: {e}")
+# Raw image body instead of multipart: the size limit applies while the body streams in.
+@router.put("/users/avatar", response_model=schemas.User)
+async def replace_avatar(request: Request, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
+    avatars.check_content_length(request.headers.get("content-length"))
+    content = await avatars.read_limited(request.stream())
+    return await _save_avatar(db, current_user.id, content)
 
-    current_user.avatar_url = result["secure_url"]
-    db.commit()
-    db.refresh(current_user)
 
-    return current_user
+@router.put("/users/{user_id}/role", response_model=schemas.User)
+async def set_user_role(user_id: int, role: schemas.UserRole, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_admin)):
+    return await async_crud.set_user_role(db, user_id, role.role)
+
+
+# Served from app.stats counters: a fixed number of rows per metric, however
+# many users and contacts there are.
+@router.get("/users/me/stats", response_model=schemas.ContactStats)
+def read_my_stats(db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return stats.owner_stats(db, current_user.id)
+
+
+@router.get("/admin/stats", response_model=schemas.SiteStats)
+def read_site_stats(db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_admin)):
+    return stats.site_stats(db)
+
+
+@router.get("/admin/stats/users/{user_id}", response_model=schemas.ContactStats)
+def read_user_stats(user_id: int, db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_admin)):
+    return stats.owner_stats(db, user_id)
+
+
+@router.get("/admin/stats/top-users", response_model=list[schemas.OwnerContactCount])
+def read_top_users(limit: int = Query(default=10, ge=1, le=100), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_admin)):
+    return stats.top_owners(db, limit)
+
+
+# List endpoints read plain column rows and encode them directly; the
+# response_model is kept for the OpenAPI schema only.
+#
+# Every contact read carries the owner's contacts_version as a weak ETag, and
+# a matching If-None-Match is answered with 304 before the list query runs.
+# The version is read first, so a concurrent write can only leave the ETag
+# older than the body (the next poll refetches), never newer. render() gets
+# that version for bodies that report it.
+def conditional_contacts(request: Request, db: Session, user_id: int, render, *variant):
+    version = versions.get_versions(db, user_id).contacts_version
+    etag = versions.etag(user_id, version, *variant)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if versions.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return ContactsJSONResponse(render(version), headers=headers)
+
+
+# ?tag=vip&data=company:Acme narrows a listing to contacts whose additional_data
+# holds every given tag and key/value; the database evaluates it.
+def contact_data_filters(tag: list[str] = Query(default=[]), data: list[str] = Query(default=[], description="key:value")):
+    return contact_data.parse_filters(tag, data)
+
+
+@router.get("/contacts/", response_model=list[schemas.Contact], response_class=ContactsJSONResponse)
+def read_contacts(request: Request, skip: int = 0, limit: int = Query(default=100, le=500), filters: dict = Depends(contact_data_filters), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    def render(version):
+        statement = crud.contacts_statement(skip=skip, limit=limit, user_id=current_user.id)
+        return contact_dicts(select_contact_rows(
+            db, contact_data.apply_filters(statement, db.get_bind().dialect.name, filters)))
+    return conditional_contacts(request, db, current_user.id, render)
+
+
+@router.get("/contacts/page/", response_model=schemas.ContactPage, response_class=ContactsJSONResponse)
+def read_contacts_page(request: Request, cursor: str | None = None, limit: int = Query(default=100, le=500), filters: dict = Depends(contact_data_filters), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    def render(version):
+        statement = crud.contacts_page_statement(current_user.id, cursor, limit)
+        rows = select_contact_rows(db, contact_data.apply_filters(statement, db.get_bind().dialect.name, filters))
+        rows, next_cursor = crud.split_contacts_page(rows, current_user.id, limit)
+        return {"items": contact_dicts(rows), "next_cursor": next_cursor}
+    return conditional_contacts(request, db, current_user.id, render)
+
+
+@router.get("/contacts/changes/", response_model=schemas.ContactChanges, response_class=ContactsJSONResponse)
+def read_contact_changes(request: Request, since: int = Query(ge=0), limit: int = Query(default=100, ge=1, le=500), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    floor = versions.get_versions(db, current_user.id).contacts_version_floor
+    if since and since < floor:
+        raise HTTPException(status_code=status.HTTP_410_GONE,
+                            detail=f"Changes before version {floor} are no longer kept; reload with since=0")
+
+    # A page ends on a version boundary; "version" is the last one it covers,
+    # so the client passes it as the next since while "more" is true.
+    def render(version):
+        until, more = versions.changes_until(db, current_user.id, since, limit)
+        changed = select_contact_rows(db, versions.changed_statement(current_user.id, since, until))
+        return {"version": version if until is None else until, "more": more, "changed": contact_dicts(changed),
+                "deleted": versions.deleted_ids(db, current_user.id, since, until)}
+    return conditional_contacts(request, db, current_user.id, render)
+
+
+@router.get("/contacts/search/", response_model=list[schemas.Contact], response_class=ContactsJSONResponse)
+def search_contacts(request: Request, q: str, skip: int = 0, limit: int = Query(default=100, le=500), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    def render(version):
+        statement = search.search_statement(db.get_bind().dialect.name, q, current_user.id, skip, limit)
+        return contact_dicts(select_contact_rows(db, statement))
+    return conditional_contacts(request, db, current_user.id, render)
+
+
+@router.get("/contacts/birthdays/", response_model=list[schemas.Contact], response_class=ContactsJSONResponse)
+def read_upcoming_birthdays(request: Request, days: int = Query(default=7, ge=1, le=366), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    today = date.today()
+
+    def render(version):
+        return contact_dicts(select_contact_rows(db, birthdays.upcoming_statement(current_user.id, days=days, today=today)))
+    # The window moves with the date even when no contact changes.
+    return conditional_contacts(request, db, current_user.id, render, today.strftime("%Y%m%d"))
+
+
+@router.get("/contacts/duplicates/", response_model=list[schemas.ContactDuplicate], response_class=ContactsJSONResponse)
+def read_contact_duplicates(min_score: float = Query(default=dedupe.MIN_SCORE, ge=0, le=1), limit: int = Query(default=100, le=500), db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return ContactsJSONResponse(dedupe.list_duplicates(db, current_user.id, min_score, limit))
+
+
+@router.post("/contacts/merge", response_model=schemas.Contact)
+async def merge_contacts(body: schemas.ContactMerge, db: AsyncSession = Depends(get_write_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return await dedupe.merge_async(db, current_user.id, body.keep_id, body.merge_ids)
+
+
+# Caller ID: every number of the request is resolved by one query.
+@router.post("/contacts/phone-lookup", response_model=schemas.PhoneLookupResponse, response_class=ContactsJSONResponse)
+def lookup_phone_numbers(body: schemas.PhoneLookup, db: Session = Depends(get_read_db), current_user: UserSnapshot = Depends(get_current_user)):
+    phones.check_lookup_size(len(body.numbers))
+    return ContactsJSONResponse({"results": phones.lookup(db, current_user.id, body.numbers)})
+
+
+# Per-item results; only items that pass their checks are written, all in one transaction.
+@router.post("/contacts/batch", response_model=schemas.ContactBatchResponse)
+async def create_contacts_batch(contacts: list[schemas.ContactCreate], db: AsyncSession = Depends(get_write_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return {"results": await batch.create_contacts(db, current_user, contacts)}
+
+
+@router.put("/contacts/batch", response_model=schemas.ContactBatchResponse)
+async def update_contacts_batch(contacts: list[schemas.ContactBatchUpdate], db: AsyncSession = Depends(get_write_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return {"results": await batch.update_contacts(db, current_user, contacts)}
+
+
+@router.post("/contacts/batch/delete", response_model=schemas.ContactBatchResponse)
+async def delete_contacts_batch(ids: list[int] = Body(...), db: AsyncSession = Depends(get_write_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return {"results": await batch.delete_contacts(db, current_user, ids)}
+
+
+@router.post("/contacts/import")
+async def import_contacts(request: Request, fmt: Literal["csv", "ndjson"] = Query(default="ndjson", alias="format"), db: AsyncSession = Depends(get_write_db), current_user: UserSnapshot = Depends(get_current_user)):
+    return await bulk.import_contacts(db, current_user.id, request.stream(), fmt)
+
+
+@router.get("/contacts/export")
+async def export_contacts(fmt: Literal["csv", "ndjson"] = Query(default="ndjson", alias="format"), current_user: UserSnapshot = Depends(get_current_user)):
+    async def body():
+        # Own session: it has to outlive the dependency scope while the response streams.
+        async with AsyncSessionLocal() as db:
+            async for chunk in bulk.export_contacts(db, current_user.id, fmt):
+                yield chunk
+
+    return StreamingResponse(body(), media_type=bulk.MEDIA_TYPES[fmt])
+
+
+app = create_app()
@@ -0,0 +1,222 @@
+"""Maintenance commands: ``python -m app.manage <command>``."""
+import argparse
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateIndex
+
+from database import SessionLocal, engine
+from . import birthdays, contact_data, dedupe, models, partitions, phones, search, stats, verification, versions
+from .settings import settings
+
+
+def ensure_column(column, indexes=()):
+    # create_all() never alters existing tables; add columns introduced since.
+    table = column.table
+    existing = {c["name"] for c in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=engine.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.server_default is not None:
+                # Existing rows get the default, so NOT NULL holds right away.
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+            conn.execute(text(ddl))
+        existing_indexes = {i["name"] for i in inspect(conn).get_indexes(table.name)}
+        for index in indexes:
+            if index.name not in existing_indexes:
+                conn.execute(CreateIndex(index))
+
+
+def _table_index(table, name):
+    return next(index for index in table.indexes if index.name == name)
+
+
+# Run once per deployment (and after model changes) before starting the app.
+def bootstrap(args):
+    models.Base.metadata.create_all(bind=engine)
+    print(f"schema ready: {len(models.Base.metadata.tables)} tables")
+
+
+def backfill_search(args):
+    ensure_column(models.Contact.__table__.c.search_document)
+    with SessionLocal() as db:
+        print(f"search documents rebuilt: {search.rebuild_search_documents(db, args.batch_size)}")
+
+
+def backfill_birthdays(args):
+    table = models.Contact.__table__
+    ensure_column(table.c.birthday_ordinal, [
+        _table_index(table, "ix_contacts_owner_birthday_ordinal"),
+        _table_index(table, "ix_contacts_birthday_ordinal"),
+    ])
+    with SessionLocal() as db:
+        print(f"birthday ordinals backfilled: {birthdays.backfill_birthday_ordinals(db, args.batch_size)}")
+
+
+def backfill_phones(args):
+    table = models.Contact.__table__
+    ensure_column(table.c.phone_e164, [_table_index(table, "ix_contacts_owner_phone_e164")])
+    ensure_column(table.c.phone_reversed, [_table_index(table, "ix_contacts_owner_phone_reversed")])
+    with SessionLocal() as db:
+        print(f"phone numbers normalized: {phones.backfill_phone_numbers(db, args.batch_size)}")
+
+
+def add_dedupe(args):
+    ensure_column(models.User.__table__.c.dedupe_version)
+    table = models.Contact.__table__
+    # The email was unique across all owners; now it is unique per owner.
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_contacts_email"))
+    ensure_column(table.c.email, [_table_index(table, "uq_contacts_owner_email")])
+    ensure_column(table.c.email_key, [_table_index(table, "ix_contacts_owner_email_key")])
+    ensure_column(table.c.name_key, [_table_index(table, "ix_contacts_owner_name_key")])
+    models.ContactDuplicate.__table__.create(bind=engine, checkfirst=True)
+    with SessionLocal() as db:
+        print(f"dedupe keys backfilled: {dedupe.backfill_keys(db, args.batch_size)}")
+
+
+def find_duplicates(args):
+    with SessionLocal() as db:
+        owners = [args.owner] if args.owner else db.scalars(select(models.User.id).order_by(models.User.id)).all()
+        for owner_id in owners:
+            print(f"owner {owner_id}: {dedupe.rebuild(db, owner_id)} duplicate pairs")
+
+
+# additional_data was an opaque string. SQLite keeps the TEXT column and only
+# rewrites its values as JSON objects. PostgreSQL fills a jsonb staging column
+# in batches while the app keeps running; a trigger re-queues rows written in
+# the meantime, and only those are converted under the lock of the final swap.
+def convert_additional_data(args):
+    if engine.dialect.name != "postgresql":
+        with SessionLocal() as db:
+            print(f"additional_data converted: {contact_data.convert_legacy_data(db, args.batch_size)}")
+        return
+    columns = {c["name"]: c["type"] for c in inspect(engine).get_columns("contacts")}
+    if not isinstance(columns["additional_data"], JSONB):
+        _swap_additional_data(args.batch_size)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+    name = "ix_contacts_owner_additional_data"
+    partitions.create_index_online(engine, name, False, models.POSTGRESQL_CONTACT_INDEXES[name])
+    print("additional_data is jsonb and indexed")
+
+
+def _swap_additional_data(batch_size: int):
+    staging = contact_data.STAGING_COLUMN
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE contacts ADD COLUMN IF NOT EXISTS {staging} jsonb"))
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION contacts_additional_data_pending() RETURNS trigger AS $$ "
+            f"BEGIN NEW.{staging} := NULL; RETURN NEW; END $$ LANGUAGE plpgsql"))
+        conn.execute(text("DROP TRIGGER IF EXISTS contacts_additional_data_pending ON contacts"))
+        conn.execute(text(
+            "CREATE TRIGGER contacts_additional_data_pending BEFORE INSERT OR UPDATE OF additional_data "
+            "ON contacts FOR EACH ROW EXECUTE FUNCTION contacts_additional_data_pending()"))
+    with SessionLocal() as db:
+        print(f"additional_data staged: {contact_data.convert_legacy_data(db, batch_size, only_pending=True)}")
+    with SessionLocal() as db:
+        # Readers keep going; writers wait for the stragglers and the swap.
+        db.execute(text("LOCK TABLE contacts IN SHARE ROW EXCLUSIVE MODE"))
+        pending = contact_data.convert_legacy_data(db, batch_size, only_pending=True, commit=False)
+        db.execute(text("DROP TRIGGER contacts_additional_data_pending ON contacts"))
+        db.execute(text("DROP FUNCTION contacts_additional_data_pending()"))
+        db.execute(text("ALTER TABLE contacts DROP COLUMN additional_data"))
+        db.execute(text(f"ALTER TABLE contacts RENAME COLUMN {staging} TO additional_data"))
+        db.commit()
+    print(f"additional_data swapped to jsonb, {pending} rows caught up under lock")
+
+
+# Contact indexes all lead with owner_id now. The single-column ones go: no
+# query uses them without owner_id, and the primary key already covers id.
+def add_owner_indexes(args):
+    table = models.Contact.__table__
+    retired = ("ix_contacts_id", "ix_contacts_first_name", "ix_contacts_last_name", "ix_contacts_search_document_trgm")
+    if engine.dialect.name != "postgresql":
+        ensure_column(table.c.owner_id, [_table_index(table, "ix_contacts_owner_id_id")])
+        with engine.begin() as conn:
+            for name in retired:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        print("owner indexes ready")
+        return
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+        partitioned = partitions.is_partitioned(conn)
+    specs = partitions.contact_index_specs()
+    for name in ("ix_contacts_owner_id_id", "ix_contacts_owner_search_document_trgm"):
+        partitions.create_index_online(engine, name, *specs[name])
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in retired:
+            conn.execute(text(f"DROP INDEX {'' if partitioned else 'CONCURRENTLY '}IF EXISTS {name}"))
+    print("owner indexes ready")
+
+
+def partition_contacts(args):
+    if args.partitions < 2:
+        raise SystemExit("set --partitions (or DB_CONTACT_PARTITIONS) to 2 or more")
+    print(f"contacts copied: {partitions.partition_contacts(engine, args.partitions, args.batch_size)}")
+
+
+def add_contact_versions(args):
+    ensure_column(models.User.__table__.c.contacts_version)
+    ensure_column(models.User.__table__.c.contacts_version_floor)
+    table = models.Contact.__table__
+    ensure_column(table.c.version, [_table_index(table, "ix_contacts_owner_version")])
+    models.ContactTombstone.__table__.create(bind=engine, checkfirst=True)
+    print("contact versions ready")
+
+
+def purge_tombstones(args):
+    with SessionLocal() as db:
+        print(f"tombstones purged: {versions.purge_tombstones(db, batch_size=args.batch_size)}")
+
+
+def add_email_verification(args):
+    ensure_column(models.User.__table__.c.is_verified)
+    models.EmailVerificationToken.__table__.create(bind=engine, checkfirst=True)
+    print("email verification tokens ready")
+
+
+def purge_verification_tokens(args):
+    with SessionLocal() as db:
+        print(f"verification tokens purged: {verification.purge_expired(db, batch_size=args.batch_size)}")
+
+
+# Creates the counters on first run and fills them from the tables; with
+# STATS_RECONCILE_INTERVAL set it keeps correcting drift, e.g. as a service.
+def reconcile_stats(args):
+    models.StatCounter.__table__.create(bind=engine, checkfirst=True)
+    stats.reconcile_forever(SessionLocal, args.batch_size)
+
+
+COMMANDS = {
+    "bootstrap": bootstrap,
+    "backfill-search": backfill_search,
+    "backfill-birthdays": backfill_birthdays,
+    "backfill-phones": backfill_phones,
+    "add-contact-versions": add_contact_versions,
+    "purge-tombstones": purge_tombstones,
+    "add-email-verification": add_email_verification,
+    "add-dedupe": add_dedupe,
+    "convert-additional-data": convert_additional_data,
+    "add-owner-indexes": add_owner_indexes,
+    "partition-contacts": partition_contacts,
+    "find-duplicates": find_duplicates,
+    "purge-verification-tokens": purge_verification_tokens,
+    "reconcile-stats": reconcile_stats,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--owner", type=int, help="limit find-duplicates to one user id")
+    parser.add_argument("--partitions", type=int, default=settings.db_contact_partitions,
+                        help="hash partitions for partition-contacts")
+    args = parser.parse_args(argv)
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
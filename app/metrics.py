@@ -0,0 +1,260 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Same statement this many times in one request is reported as a likely N+1.
+N_PLUS_ONE_THRESHOLD = settings.metrics_n_plus_one_threshold
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (last one is +Inf), then the running sum.
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        self.observe_many([(labels, value)])
+
+    def observe_many(self, samples):
+        buckets = self.buckets
+        with self._lock:
+            for labels, value in samples:
+                series = self._series.get(labels)
+                if series is None:
+                    series = self._series[labels] = [0] * (len(buckets) + 1) + [0.0]
+                series[bisect_left(buckets, value)] += 1
+                series[-1] += value
+
+    def time(self, *labels) -> Timer:
+        return Timer(self, labels)
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Called before rendering, e.g. to fold buffered samples in.
+        self.before_collect = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        for hook in self.before_collect:
+            hook()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return ("\n".join(lines) + "\n").encode()
+
+
+registry = Registry()
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"))
+REQUEST_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per request.", ("route",), COUNT_BUCKETS)
+REQUEST_QUERY_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL per request.", ("route",))
+N_PLUS_ONE = registry.counter(
+    "db_n_plus_one_total", "Requests that repeated one statement N_PLUS_ONE_THRESHOLD times or more.", ("route",))
+OPERATION_SECONDS = registry.histogram(
+    "operation_duration_seconds", "Password hashing, token verification and avatar work.", ("operation",))
+
+
+def timed(operation: str) -> Timer:
+    return OPERATION_SECONDS.time(operation)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements: dict[str, int] = {}
+
+
+# Set by the middleware; threadpool endpoints and AsyncSession greenlets
+# inherit the context, so the engine hooks find the same object.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+# The start time lives on the execution context, which a failed statement
+# simply drops; nothing is left behind on the connection.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None and context is not None:
+        context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    if stats is None:
+        return
+    started = getattr(context, "metrics_started", None)
+    if started is not None:
+        stats.query_seconds += time.perf_counter() - started
+    stats.queries += 1
+    stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+
+def instrument_engine(engine):
+    # Takes a sync Engine; pass AsyncEngine.sync_engine for async ones.
+    from sqlalchemy import event
+
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def route_label(scope) -> str:
+    # Route templates, never raw paths, so label cardinality stays bounded.
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+# The request path only appends one tuple; the histograms are updated in bulk
+# on scrape, or inline once this many samples are waiting.
+MAX_PENDING_REQUESTS = 50_000
+_pending_requests = deque()
+
+
+_flush_lock = threading.Lock()
+
+
+def flush_request_samples():
+    with _flush_lock:
+        samples = [_pending_requests.popleft() for _ in range(len(_pending_requests))]
+    REQUEST_SECONDS.observe_many([((method, route, code), elapsed) for method, route, code, elapsed, _, _ in samples])
+    REQUEST_QUERIES.observe_many([((route,), queries) for _, route, _, _, queries, _ in samples])
+    REQUEST_QUERY_SECONDS.observe_many([((route,), seconds) for _, route, _, _, _, seconds in samples])
+
+
+registry.before_collect.append(flush_request_samples)
+
+
+def _record(scope, status_code: int, elapsed: float, stats: RequestStats):
+    route = route_label(scope)
+    _pending_requests.append((scope["method"], route, status_code, elapsed, stats.queries, stats.query_seconds))
+    if len(_pending_requests) >= MAX_PENDING_REQUESTS:
+        flush_request_samples()
+    if stats.queries >= N_PLUS_ONE_THRESHOLD:
+        statement, count = max(stats.statements.items(), key=lambda item: item[1])
+        if count >= N_PLUS_ONE_THRESHOLD:
+            N_PLUS_ONE.inc(route)
+            logger.warning("possible N+1 on %s %s: %d executions of %s",
+                           scope["method"], route, count, " ".join(statement.split())[:200])
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            _record(scope, status_code, elapsed, stats)
@@ -1,9 +1,14 @@
-from sqlalchemy import Boolean, Column, Integer, String, Date, ForeignKey
-from sqlalchemy.orm import relationship
-from passlib.context import CryptContext
-from database import Base
+import unicodedata
+from datetime import datetime
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import phonenumbers
+from sqlalchemy import Boolean, Column, Integer, JSON, String, Date, DateTime, Float, ForeignKey, DDL, Index, event, false, inspect
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session, object_session, relationship
+from database import Base
+from .cache import user_cache
+from .passwords import pwd_context
+from .settings import settings
 
 
 class User(Base):
@@ -15,6 +20,13 @@ class User(Base):
     contacts = relationship("Contact", back_populates="owner")
     avatar_url = Column(String, nullable=True)
     role = Column(String, default="user")
+    is_verified = Column(Boolean, nullable=False, default=False, server_default=false())
+    # Bumped by every contact write of this owner; served as the ETag of contact reads.
+    contacts_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Tombstones up to this version have been purged; older ?since= can't be answered.
+    contacts_version_floor = Column(Integer, nullable=False, default=0, server_default="0")
+    # contacts_version up to which app.dedupe has looked for duplicates.
+    dedupe_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     def verify_password(self, plain_password):
         return pwd_context.verify(plain_password, self.hashed_password)
@@ -29,16 +41,328 @@ class User(Base):
         return self.role == "admin" or contact.owner_id == self.id
 
 
+# Cached UserSnapshots are dropped once a write to the user row commits
+# (avatar upload, email verification, role change, ...).
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _queue_user_cache_invalidation(mapper, connection, target):
+    emails = {target.email, *inspect(target).attrs.email.history.deleted}
+    session = object_session(target)
+    if session is None:
+        for email in emails:
+            user_cache.invalidate(email)
+    else:
+        session.info.setdefault("user_cache_invalidations", set()).update(emails)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_user_cache(session):
+    for email in session.info.pop("user_cache_invalidations", ()):
+        user_cache.invalidate(email)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_user_cache_invalidations(session, previous_transaction):
+    session.info.pop("user_cache_invalidations", None)
+
+
+# Hash partitions of contacts by owner_id; PostgreSQL only.
+CONTACT_PARTITIONS = settings.db_contact_partitions if settings.database_url.startswith("postgresql") else 0
+
+
+# Every query of this table filters by owner_id, so every index leads with it
+# (except the daily birthday job's). When partitioned, owner_id joins the
+# primary key as PostgreSQL requires. The mapper always identifies rows by
+# (id, owner_id), so the ORM's own UPDATE/DELETE/refresh statements name the
+# owner's partition, however and whenever the table was partitioned.
 class Contact(Base):
     __tablename__ = "contacts"
 
-    id = Column(Integer, primary_key=True, index=True)
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
-    email = Column(String, unique=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    # Unique per owner (uq_contacts_owner_email): two users may know the same person.
+    email = Column(String)
     phone_number = Column(String)
     birthday = Column(Date)
-    additional_data = Column(String, nullable=True)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    # Free-form JSON object (tags, company, ...); filtered in the database by
+    # app.contact_data. None is stored as SQL NULL, not JSON null.
+    additional_data = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"),
+                             nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=bool(CONTACT_PARTITIONS))
     owner = relationship("User", back_populates="contacts")
+    # Lowercased "first last email" used by app.search; kept in sync below.
+    search_document = Column(String, nullable=False, default="")
+    # month * 100 + day of birthday, so "upcoming" is an index range scan.
+    birthday_ordinal = Column(Integer, nullable=True)
+    # Owner's contacts_version at the last write of this row.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # phone_number in E.164 (None when it doesn't parse), and its digits
+    # reversed so "ends with" becomes an index prefix scan.
+    phone_e164 = Column(String(16), nullable=True)
+    phone_reversed = Column(String(15), nullable=True)
+    # Blocking keys for app.dedupe: canonical email and a phonetic name code.
+    email_key = Column(String, nullable=True)
+    name_key = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Offset listing: WHERE owner_id = ? ORDER BY id.
+        Index("ix_contacts_owner_id_id", "owner_id", "id"),
+        # Serves keyset pagination: WHERE owner_id = ? AND (last_name, id) > (?, ?).
+        Index("ix_contacts_owner_last_name_id", "owner_id", "last_name", "id"),
+        Index("ix_contacts_owner_birthday_ordinal", "owner_id", "birthday_ordinal"),
+        # The daily reminder job scans one ordinal range across all owners.
+        Index("ix_contacts_birthday_ordinal", "birthday_ordinal"),
+        Index("ix_contacts_owner_version", "owner_id", "version"),
+        Index("ix_contacts_owner_phone_e164", "owner_id", "phone_e164"),
+        # text_pattern_ops: LIKE 'prefix%' uses the index under any collation.
+        Index("ix_contacts_owner_phone_reversed", "owner_id", "phone_reversed",
+              postgresql_ops={"phone_reversed": "text_pattern_ops"}),
+        Index("uq_contacts_owner_email", "owner_id", "email", unique=True),
+        Index("ix_contacts_owner_email_key", "owner_id", "email_key"),
+        Index("ix_contacts_owner_name_key", "owner_id", "name_key"),
+        {"postgresql_partition_by": "HASH (owner_id)"} if CONTACT_PARTITIONS else {},
+    )
+    __mapper_args__ = {"primary_key": [id, owner_id]}
+
+
+class ContactTombstone(Base):
+    __tablename__ = "contact_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    contact_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("ix_contact_tombstones_owner_version", "owner_id", "version"),
+    )
+
+
+# Candidate duplicate pairs, contact_id < duplicate_id, maintained by app.dedupe.
+class ContactDuplicate(Base):
+    __tablename__ = "contact_duplicates"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    contact_id = Column(Integer, nullable=False)
+    duplicate_id = Column(Integer, nullable=False, index=True)
+    score = Column(Float, nullable=False)
+    # Comma-separated: email, phone, name, birthday.
+    reasons = Column(String, nullable=False, default="")
+
+    __table_args__ = (
+        Index("uq_contact_duplicates_pair", "contact_id", "duplicate_id", unique=True),
+        Index("ix_contact_duplicates_owner_score", "owner_id", "score"),
+    )
+
+
+# Precomputed aggregates kept by app.stats: scope is an owner's user id, or 0
+# for the whole site, whose rows are spread over `slot`s so concurrent
+# writers don't queue on one row. A metric's value is the sum of its slots.
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+
+    scope = Column(Integer, primary_key=True, autoincrement=False)
+    metric = Column(String(32), primary_key=True)
+    # "" for plain totals; a month "1".."12", or "verified"/"unverified".
+    bucket = Column(String(16), primary_key=True, default="")
+    slot = Column(Integer, primary_key=True, autoincrement=False, default=0)
+    value = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Largest address books: WHERE metric = ? AND bucket = '' ORDER BY value DESC.
+        Index("ix_stat_counters_metric_bucket_value", "metric", "bucket", "value"),
+    )
+
+
+class EmailJob(Base):
+    __tablename__ = "email_jobs"
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    # pending -> sent, or dead once max attempts are exhausted.
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_email_jobs_status_run_after", "status", "run_after"),
+        Index("ix_email_jobs_locked_by", "locked_by"),
+    )
+
+
+class EmailVerificationToken(Base):
+    __tablename__ = "email_verification_tokens"
+
+    id = Column(Integer, primary_key=True)
+    # sha256 hex of the emailed token; the unique index is the lookup path.
+    token_hash = Column(String(64), nullable=False, unique=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)
+    # Either a single token (jti) or every token of a user issued before not_before.
+    jti = Column(String, unique=True, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    not_before = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+def normalize_search_text(value: str | None) -> str:
+    if not value:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", value).casefold().split())
+
+
+def build_search_document(first_name, last_name, email) -> str:
+    return " ".join(filter(None, (normalize_search_text(first_name),
+                                  normalize_search_text(last_name),
+                                  normalize_search_text(email))))
+
+
+# Columns derived from user input. Core bulk INSERT/UPDATE bypasses the mapper
+# events below, so callers writing dicts merge these in themselves.
+CONTACT_DERIVED_SOURCES = ("first_name", "last_name", "email", "birthday", "phone_number")
+# Mailboxes that ignore dots in the local part.
+DOTLESS_EMAIL_DOMAINS = {"gmail.com", "googlemail.com"}
+# Soundex-style consonant classes for Latin and Cyrillic, so "Smith", "Smyth"
+# and "Сміт" share a code. Other letters only separate repeats.
+PHONETIC_CLASSES = {
+    letter: code
+    for letters, code in (("bfpvбпфв", "1"), ("cgjkqsxzгґжзкхцчшщс", "2"), ("dtдт", "3"),
+                          ("lл", "4"), ("mnмн", "5"), ("rр", "6"))
+    for letter in letters
+}
+# Numbers written without a country code are read as numbers of this region.
+PHONE_DEFAULT_REGION = settings.phone_default_region
+
+
+def birthday_ordinal(day) -> int | None:
+    return day.month * 100 + day.day if day else None
+
+
+def normalize_phone(value: str | None, region: str = PHONE_DEFAULT_REGION) -> str | None:
+    if not value:
+        return None
+    try:
+        number = phonenumbers.parse(value, region)
+    except phonenumbers.NumberParseException:
+        return None
+    # Local-only lengths are rejected: the area code they lack would be guessed.
+    if phonenumbers.is_possible_number_with_reason(number) != phonenumbers.ValidationResult.IS_POSSIBLE:
+        return None
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def reversed_phone_digits(e164: str | None) -> str | None:
+    return e164[:0:-1] if e164 else None
+
+
+# "John.Doe+work@GMail.com" -> "johndoe@gmail.com"
+def email_key(email: str | None) -> str | None:
+    if not email or "@" not in email:
+        return None
+    local, _, domain = normalize_search_text(email).rpartition("@")
+    local = local.partition("+")[0]
+    if domain in DOTLESS_EMAIL_DOMAINS:
+        local = local.replace(".", "")
+    return f"{local}@{domain}" if local else None
+
+
+def phonetic_code(word: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", word.casefold())
+    code, last = "", None
+    for char in decomposed:
+        if not char.isalpha():
+            continue
+        digit = PHONETIC_CLASSES.get(char)
+        if digit and digit != last:
+            code += digit
+        last = digit
+    return code[:4]
+
+
+# Codes of every name word, sorted, so swapped first/last names still match.
+def name_key(first_name: str | None, last_name: str | None) -> str | None:
+    words = f"{first_name or ''} {last_name or ''}".split()
+    codes = sorted(filter(None, (phonetic_code(word) for word in words)))
+    return " ".join(codes) or None
+
+
+def contact_derived_values(values) -> dict:
+    phone_e164 = normalize_phone(values.get("phone_number"))
+    return {
+        "search_document": build_search_document(
+            values.get("first_name"), values.get("last_name"), values.get("email")),
+        "birthday_ordinal": birthday_ordinal(values.get("birthday")),
+        "phone_e164": phone_e164,
+        "phone_reversed": reversed_phone_digits(phone_e164),
+        "email_key": email_key(values.get("email")),
+        "name_key": name_key(values.get("first_name"), values.get("last_name")),
+    }
+
+
+@event.listens_for(Contact, "before_insert")
+@event.listens_for(Contact, "before_update")
+def _update_derived_columns(mapper, connection, target):
+    source = {name: getattr(target, name) for name in CONTACT_DERIVED_SOURCES}
+    for name, value in contact_derived_values(source).items():
+        setattr(target, name, value)
+
+
+# PostgreSQL-only GIN indexes, owner-leading like the rest: trigrams so that
+# LIKE '%q%' is served by the index, and JSONB containment (@>) for
+# app.contact_data. btree_gin supplies the owner_id operator class.
+POSTGRESQL_CONTACT_INDEXES = {
+    "ix_contacts_owner_search_document_trgm": "USING gin (owner_id, search_document gin_trgm_ops)",
+    "ix_contacts_owner_additional_data": "USING gin (owner_id, additional_data jsonb_path_ops)",
+}
+
+
+def contact_partition_ddl(parent: str, modulus: int) -> list[str]:
+    # Partitions keep their contacts_p<n> names whatever the parent is called.
+    return [f"CREATE TABLE IF NOT EXISTS contacts_p{remainder} PARTITION OF {parent} "
+            f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})" for remainder in range(modulus)]
+
+
+for _extension in ("pg_trgm", "btree_gin"):
+    event.listen(Contact.__table__, "before_create", DDL(
+        f"CREATE EXTENSION IF NOT EXISTS {_extension}").execute_if(dialect="postgresql"))
+for _statement in contact_partition_ddl("contacts", CONTACT_PARTITIONS):
+    event.listen(Contact.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+for _name, _spec in POSTGRESQL_CONTACT_INDEXES.items():
+    event.listen(Contact.__table__, "after_create", DDL(
+        f"CREATE INDEX IF NOT EXISTS {_name} ON contacts {_spec}").execute_if(dialect="postgresql"))
 
+# SQLite: external-content FTS5 table with the trigram tokenizer, synced by triggers.
+for _statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "search_document, content='contacts', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, search_document) VALUES (new.id, new.search_document); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, search_document) "
+    "VALUES ('delete', old.id, old.search_document); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE OF search_document ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, search_document) "
+    "VALUES ('delete', old.id, old.search_document); "
+    "INSERT INTO contacts_fts(rowid, search_document) VALUES (new.id, new.search_document); END",
+):
+    event.listen(Contact.__table__, "after_create",
+                 DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Contact.__table__, "before_drop", DDL(
+    "DROP TABLE IF EXISTS contacts_fts").execute_if(dialect="sqlite"))
@@ -0,0 +1,157 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from . import models
+
+contacts = models.Contact.__table__
+# Built next to the live table while rows are copied; renamed at the swap.
+STAGING_TABLE = "contacts_partitioned"
+STAGING_SUFFIX = "_partitioned"
+# The old heap is kept under this name until it is dropped by hand.
+RETIRED_SUFFIX = "_unpartitioned"
+MIRROR = "contacts_partition_mirror"
+
+
+def _check_postgresql(engine):
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("contacts can only be partitioned on PostgreSQL")
+
+
+def is_partitioned(conn, table: str = contacts.name) -> bool:
+    return bool(conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE relname = :table"),
+                             {"table": table}).scalar())
+
+
+def partitions_of(conn, table: str = contacts.name) -> list[str]:
+    return list(conn.execute(text(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:table AS regclass) ORDER BY child.relname"), {"table": table}).scalars())
+
+
+# name -> (unique, "ON <table>" remainder) for every index of the model.
+def contact_index_specs() -> dict[str, tuple[bool, str]]:
+    specs = {}
+    for index in contacts.indexes:
+        ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        specs[index.name] = (bool(index.unique), ddl.partition(f" ON {contacts.name} ")[2])
+    for name, spec in models.POSTGRESQL_CONTACT_INDEXES.items():
+        specs[name] = (False, spec)
+    return specs
+
+
+# Without blocking writes: CONCURRENTLY on a plain table. A partitioned parent
+# can't build concurrently, so its index is created ON ONLY the parent and
+# each partition's is built concurrently and attached.
+def create_index_online(engine, name: str, unique: bool, spec: str, table: str = contacts.name):
+    create = "CREATE UNIQUE INDEX" if unique else "CREATE INDEX"
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not is_partitioned(conn, table):
+            conn.execute(text(f"{create} CONCURRENTLY IF NOT EXISTS {name} ON {table} {spec}"))
+            return
+        conn.execute(text(f"{create} IF NOT EXISTS {name} ON ONLY {table} {spec}"))
+        for partition in partitions_of(conn, table):
+            child = f"{name}_{partition.rpartition('_')[2]}"
+            conn.execute(text(f"{create} CONCURRENTLY IF NOT EXISTS {child} ON {partition} {spec}"))
+            conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+
+def create_partitions(engine, modulus: int, table: str = contacts.name) -> list[str]:
+    _check_postgresql(engine)
+    with engine.begin() as conn:
+        for statement in models.contact_partition_ddl(table, modulus):
+            conn.execute(text(statement))
+        return partitions_of(conn, table)
+
+
+# Step 1: an empty partitioned twin with every index, and a trigger that
+# mirrors each write to the live table into it from now on.
+def prepare(engine, modulus: int):
+    _check_postgresql(engine)
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(STAGING_TABLE):
+            # LIKE ... INCLUDING DEFAULTS shares contacts_id_seq and keeps the column order.
+            conn.execute(text(f"CREATE TABLE {STAGING_TABLE} (LIKE {contacts.name} INCLUDING DEFAULTS) "
+                              "PARTITION BY HASH (owner_id)"))
+            conn.execute(text(f"ALTER TABLE {STAGING_TABLE} ADD PRIMARY KEY (id, owner_id)"))
+            conn.execute(text(f"ALTER TABLE {STAGING_TABLE} ADD FOREIGN KEY (owner_id) REFERENCES users (id)"))
+        for statement in models.contact_partition_ddl(STAGING_TABLE, modulus):
+            conn.execute(text(statement))
+        # Built on empty tables, so instant; the copy then maintains them.
+        for name, (unique, spec) in contact_index_specs().items():
+            create = "CREATE UNIQUE INDEX" if unique else "CREATE INDEX"
+            conn.execute(text(f"{create} IF NOT EXISTS {name}{STAGING_SUFFIX} ON {STAGING_TABLE} {spec}"))
+
+        columns = [column["name"] for column in inspect(conn).get_columns(contacts.name)]
+        assignments = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns)
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {MIRROR}() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP <> 'INSERT' THEN DELETE FROM {STAGING_TABLE} WHERE id = OLD.id AND owner_id = OLD.owner_id; END IF; "
+            f"IF TG_OP <> 'DELETE' AND NEW.owner_id IS NOT NULL THEN INSERT INTO {STAGING_TABLE} SELECT (NEW).* "
+            f"ON CONFLICT (id, owner_id) DO UPDATE SET {assignments}; END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql"))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {MIRROR} ON {contacts.name}"))
+        conn.execute(text(f"CREATE TRIGGER {MIRROR} AFTER INSERT OR UPDATE OR DELETE ON {contacts.name} "
+                          f"FOR EACH ROW EXECUTE FUNCTION {MIRROR}()"))
+
+
+# Step 2: existing rows in id order, one short transaction per batch. FOR
+# SHARE makes a concurrent update or delete of a batch row wait for the batch
+# (or be seen by it), so a stale copy never lands after the mirrored write.
+def copy_rows(engine, batch_size: int = 5000, report=print) -> int:
+    copied = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            upper = conn.execute(text(
+                f"SELECT max(id) FROM (SELECT id FROM {contacts.name} WHERE id > :last_id "
+                "ORDER BY id LIMIT :batch_size) AS batch"), {"last_id": last_id, "batch_size": batch_size}).scalar()
+            if upper is None:
+                break
+            copied += conn.execute(text(
+                f"INSERT INTO {STAGING_TABLE} SELECT * FROM (SELECT * FROM {contacts.name} "
+                "WHERE id > :last_id AND id <= :upper AND owner_id IS NOT NULL FOR SHARE) AS batch "
+                "ON CONFLICT DO NOTHING"), {"last_id": last_id, "upper": upper}).rowcount
+        last_id = upper
+        report(f"copied up to id {last_id}")
+    return copied
+
+
+# Step 3: one short ACCESS EXCLUSIVE transaction of renames. The old heap
+# stays as contacts_unpartitioned (its indexes suffixed likewise).
+def swap(engine):
+    retired = f"{contacts.name}{RETIRED_SUFFIX}"
+    with engine.begin() as conn:
+        conn.execute(text(f"LOCK TABLE {contacts.name} IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text(f"DROP TRIGGER {MIRROR} ON {contacts.name}"))
+        conn.execute(text(f"DROP FUNCTION {MIRROR}()"))
+        sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{contacts.name}', 'id')")).scalar()
+        old_indexes = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+                                   {"table": contacts.name}).scalars().all()
+        conn.execute(text(f"ALTER TABLE {contacts.name} RENAME TO {retired}"))
+        for name in old_indexes:
+            conn.execute(text(f"ALTER INDEX {name} RENAME TO {name}{RETIRED_SUFFIX}"))
+        conn.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO {contacts.name}"))
+        for name in contact_index_specs():
+            conn.execute(text(f"ALTER INDEX {name}{STAGING_SUFFIX} RENAME TO {name}"))
+        conn.execute(text(f"ALTER INDEX {STAGING_TABLE}_pkey RENAME TO {contacts.name}_pkey"))
+        conn.execute(text(f"ALTER TABLE {contacts.name} RENAME CONSTRAINT {STAGING_TABLE}_owner_id_fkey "
+                          f"TO {contacts.name}_owner_id_fkey"))
+        # Otherwise dropping the old table would drop the id sequence with it.
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {contacts.name}.id"))
+
+
+# Online migration of an existing contacts table; returns the rows copied.
+def partition_contacts(engine, modulus: int, batch_size: int = 5000, report=print) -> int:
+    _check_postgresql(engine)
+    with engine.connect() as conn:
+        if is_partitioned(conn):
+            report(f"{contacts.name} is already partitioned")
+            return 0
+    prepare(engine, modulus)
+    copied = copy_rows(engine, batch_size, report)
+    swap(engine)
+    report(f"{contacts.name} now has {modulus} hash partitions; "
+           f"drop {contacts.name}{RETIRED_SUFFIX} once the app is verified")
+    return copied
@@ -0,0 +1,73 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .metrics import timed
+from .settings import settings
+
+# Hashes below min_rounds are reported by needs_update and upgraded on login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__min_rounds=12)
+
+
+# Module-level so they can be pickled into a process pool.
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor: str = "thread", max_workers: int | None = None, max_pending: int | None = None):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown password hashing executor: {executor}")
+        self.executor_kind = executor
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # bcrypt calls beyond this are rejected with 503 instead of queueing forever.
+        self.max_pending = max_pending or self.max_workers * 4
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            pool = ProcessPoolExecutor if self.executor_kind == "process" else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.max_workers)
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy, retry shortly",
+                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        with timed("password_hash"):
+            return await self._run(_hash, password)
+
+    # Returns (valid, new_hash); new_hash is set when the stored hash is outdated.
+    async def verify(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        with timed("password_verify"):
+            return await self._run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    executor=settings.password_hash_executor,
+    max_workers=settings.password_hash_workers or None,
+    max_pending=settings.password_hash_max_pending or None,
+)
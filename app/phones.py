@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from fastapi import HTTPException, status
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .serialization import CONTACT_COLUMNS, contact_dicts
+from .settings import settings
+
+MAX_NUMBERS = settings.phone_lookup_max_numbers
+# Shorter fragments match too many contacts to identify a caller.
+MIN_SUFFIX_DIGITS = 7
+
+contacts = models.Contact.__table__
+
+
+def check_lookup_size(count: int):
+    if count > MAX_NUMBERS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {MAX_NUMBERS} numbers per lookup")
+
+
+# ("exact", e164), ("suffix", reversed digits) or (None, None) for unusable input.
+def lookup_key(number: str) -> tuple[str | None, str | None]:
+    e164 = models.normalize_phone(number)
+    if e164:
+        return "exact", e164
+    digits = "".join(char for char in number if char.isdigit())
+    if len(digits) >= MIN_SUFFIX_DIGITS:
+        return "suffix", digits[::-1]
+    return None, None
+
+
+def _suffix_filter(dialect: str, reversed_digits: str):
+    # SQLite only turns LIKE into an index range under NOCASE; GLOB is case-sensitive and does.
+    if dialect == "sqlite":
+        return contacts.c.phone_reversed.op("GLOB")(reversed_digits + "*")
+    return contacts.c.phone_reversed.startswith(reversed_digits)
+
+
+def lookup_statement(dialect: str, user_id: int, keys):
+    exact = sorted({value for kind, value in keys if kind == "exact"})
+    suffixes = sorted({value for kind, value in keys if kind == "suffix"})
+    conditions = [_suffix_filter(dialect, value) for value in suffixes]
+    if exact:
+        conditions.append(contacts.c.phone_e164.in_(exact))
+    if not conditions:
+        return None
+    return select(*CONTACT_COLUMNS, contacts.c.phone_e164, contacts.c.phone_reversed).where(
+        contacts.c.owner_id == user_id, or_(*conditions)).order_by(contacts.c.id)
+
+
+# Every number of the request is answered from one query.
+def lookup(db: Session, user_id: int, numbers: list[str]) -> list[dict]:
+    keys = [lookup_key(number) for number in numbers]
+    statement = lookup_statement(db.get_bind().dialect.name, user_id, keys)
+    rows = db.execute(statement).all() if statement is not None else []
+    by_e164 = defaultdict(list)
+    for row in rows:
+        by_e164[row.phone_e164].append(row)
+
+    results = []
+    for number, (kind, value) in zip(numbers, keys):
+        if kind == "exact":
+            matched = by_e164.get(value, [])
+        elif kind == "suffix":
+            matched = [row for row in rows if row.phone_reversed and row.phone_reversed.startswith(value)]
+        else:
+            matched = []
+        results.append({"number": number, "e164": value if kind == "exact" else None,
+                        "contacts": contact_dicts(matched)})
+    return results
+
+
+# Backfill for rows written before phone_e164 existed.
+def backfill_phone_numbers(db: Session, batch_size: int = 5000) -> int:
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(models.Contact.id, models.Contact.owner_id, models.Contact.phone_number).where(
+                models.Contact.id > last_id).order_by(models.Contact.id).limit(batch_size)).all()
+        if not rows:
+            break
+        mappings = []
+        for contact_id, owner_id, phone_number in rows:
+            phone_e164 = models.normalize_phone(phone_number)
+            # owner_id is part of the identity when contacts are partitioned.
+            mappings.append({"id": contact_id, "owner_id": owner_id, "phone_e164": phone_e164,
+                             "phone_reversed": models.reversed_phone_digits(phone_e164)})
+        db.bulk_update_mappings(models.Contact, mappings)
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
@@ -0,0 +1,217 @@
+import asyncio
+import ipaddress
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+
+from .settings import settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        count, _, unit = value.partition("/")
+        return cls(int(count), PERIODS[unit.strip().rstrip("s")])
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+
+# GCRA: one "theoretical arrival time" per key instead of a window of timestamps.
+# A request is allowed while it is no more than one full period ahead of now.
+def gcra(tat: float | None, rate: Rate, now: float) -> tuple[bool, float, float]:
+    tat = max(tat or now, now)
+    new_tat = tat + rate.interval
+    allow_at = new_tat - rate.period
+    if now < allow_at:
+        return False, tat, allow_at - now
+    return True, new_tat, 0.0
+
+
+class MemoryStorage:
+    def __init__(self):
+        self._tats: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    async def hit(self, key: str, rate: Rate, now: float) -> tuple[bool, float]:
+        with self._lock:
+            allowed, tat, retry_after = gcra(self._tats.get(key), rate, now)
+            self._tats[key] = tat
+            if now >= self._next_prune:
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+                self._next_prune = now + 60
+        return allowed, retry_after
+
+
+class SQLiteStorage:
+    # Shared by every worker on one host through a WAL-mode file. sqlite3 blocks,
+    # so each hit runs in a worker thread (one connection per thread). A writer
+    # that holds the lock longer than BUSY_TIMEOUT lets the request through
+    # rather than queueing it: rate limiting fails open.
+    BUSY_TIMEOUT = 0.05
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _hit(self, key: str, rate: Rate, now: float) -> tuple[bool, float]:
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            allowed, tat, retry_after = gcra(row[0] if row else None, rate, now)
+            if allowed:
+                conn.execute(
+                    "INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat", (key, tat))
+            if now >= self._next_prune:
+                # A key whose tat has passed is back to a full burst, same as no row.
+                conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+                self._next_prune = now + self.PRUNE_INTERVAL
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return True, 0.0
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+    async def hit(self, key: str, rate: Rate, now: float) -> tuple[bool, float]:
+        return await asyncio.to_thread(self._hit, key, rate, now)
+
+
+# Same algorithm as gcra() in microseconds: Lua numbers come back as integers.
+GCRA_LUA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local period = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+  return {0, allow_at - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil((new_tat - now) / 1000))
+return {1, 0}
+"""
+
+
+class RedisStorage:
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(GCRA_LUA)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisStorage":
+        import redis.asyncio
+
+        return cls(redis.asyncio.from_url(url))
+
+    async def hit(self, key: str, rate: Rate, now: float) -> tuple[bool, float]:
+        allowed, retry_after = await self._script(
+            keys=[self.prefix + key],
+            args=[int(now * 1_000_000), int(rate.interval * 1_000_000), int(rate.period * 1_000_000)])
+        return bool(allowed), int(retry_after) / 1_000_000
+
+
+def storage_from_url(url: str):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisStorage.from_url(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url[len("sqlite:///"):])
+    if url == "memory://":
+        return MemoryStorage()
+    raise ValueError(f"Unsupported rate limit storage: {url}")
+
+
+def _parse_networks(value: str):
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+TRUSTED_PROXIES = _parse_networks(settings.rate_limit_trusted_proxies)
+
+
+def _is_trusted(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(request: Request) -> str:
+    host = request.client.host if request.client else "unknown"
+    if not _is_trusted(host):
+        return host
+    # Walk X-Forwarded-For from the right: the first hop we don't run is the client.
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    for hop in reversed(forwarded):
+        if not _is_trusted(hop):
+            return hop
+    return forwarded[0] if forwarded else host
+
+
+class RateLimiter:
+    def __init__(self, storage, default: str | None = "10/minute", identify=None, clock=time.time):
+        self.storage = storage
+        self.default = Rate.parse(default) if default else None
+        # identify(request) -> stable id of an authenticated caller, or None.
+        self.identify = identify
+        self.clock = clock
+        self._routes: dict = {}
+
+    def limit(self, rate: str):
+        def decorator(endpoint):
+            self._routes[endpoint] = Rate.parse(rate)
+            return endpoint
+        return decorator
+
+    def exempt(self, endpoint):
+        self._routes[endpoint] = None
+        return endpoint
+
+    def key(self, request: Request) -> str:
+        identity = self.identify(request) if self.identify else None
+        return f"user:{identity}" if identity is not None else f"ip:{client_ip(request)}"
+
+    async def __call__(self, request: Request):
+        route = request.scope.get("route")
+        endpoint = getattr(route, "endpoint", None)
+        rate = self._routes.get(endpoint, self.default)
+        if rate is None:
+            return
+        key = f"{request.method}:{getattr(route, 'path', request.url.path)}:{self.key(request)}"
+        allowed, retry_after = await self.storage.hit(key, rate, self.clock())
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, round(retry_after)))})
@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+
+from sqlalchemy import exc, text
+
+logger = logging.getLogger(__name__)
+
+# Above this many tracked writers, expired stickiness entries are swept.
+MAX_STICKY_USERS = 100_000
+
+
+# Hands out sync Sessions for read-only work: replicas in round-robin order,
+# skipping ones that failed recently, and the primary when none are usable or
+# when the user wrote within the last sticky_seconds (read-your-writes).
+# Stickiness is per process; a read served by another worker may still lag.
+class ReplicaRouter:
+    def __init__(self, session_factory, primary, replicas=(), sticky_seconds: float = 5.0,
+                 retry_seconds: float = 30.0, max_lag_seconds: float = 0.0, clock=time.monotonic):
+        self.session_factory = session_factory
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.clock = clock
+        self._down_until: dict = {}
+        self._written: dict[int, float] = {}
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def mark_written(self, user_id: int):
+        now = self.clock()
+        with self._lock:
+            self._written[user_id] = now + self.sticky_seconds
+            if len(self._written) > MAX_STICKY_USERS:
+                self._written = {key: until for key, until in self._written.items() if until > now}
+
+    def is_sticky(self, user_id: int | None) -> bool:
+        return user_id is not None and self._written.get(user_id, 0) > self.clock()
+
+    def mark_down(self, engine):
+        if engine not in self._down_until or self._down_until[engine] <= self.clock():
+            logger.warning("read replica %s unavailable; using others for %ss", engine.url, self.retry_seconds)
+        self._down_until[engine] = self.clock() + self.retry_seconds
+
+    def mark_up(self, engine):
+        self._down_until.pop(engine, None)
+
+    def healthy_replicas(self) -> list:
+        now = self.clock()
+        return [engine for engine in self.replicas if self._down_until.get(engine, 0) <= now]
+
+    def candidates(self, user_id: int | None = None) -> list:
+        healthy = [] if self.is_sticky(user_id) else self.healthy_replicas()
+        if healthy:
+            start = next(self._turn) % len(healthy)
+            healthy = healthy[start:] + healthy[:start]
+        return healthy + [self.primary]
+
+    def session(self, user_id: int | None = None):
+        for engine in self.candidates(user_id):
+            db = self.session_factory(bind=engine)
+            if engine is self.primary:
+                return db
+            try:
+                # Checks a connection out now, so a dead replica falls through here
+                # instead of failing the request's first query.
+                db.connection()
+                return db
+            except exc.OperationalError:
+                db.close()
+                self.mark_down(engine)
+
+    def replica_lag(self, conn) -> float:
+        if conn.dialect.name != "postgresql":
+            return 0.0
+        return conn.execute(text(
+            "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)")).scalar()
+
+    def check_health(self):
+        for engine in self.replicas:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                    lag = self.replica_lag(conn) if self.max_lag_seconds else 0.0
+            except exc.DBAPIError:
+                self.mark_down(engine)
+                continue
+            if self.max_lag_seconds and lag > self.max_lag_seconds:
+                self.mark_down(engine)
+            else:
+                self.mark_up(engine)
+
+    async def check_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.check_health)
+            except Exception:
+                logger.exception("replica health check failed")
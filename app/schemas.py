@@ -1,4 +1,6 @@
 from datetime import date
+from typing import Any, Literal
+
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -8,6 +10,8 @@ class ContactBase(BaseModel):
     email: EmailStr
     phone_number: str
     birthday: date
+    # A JSON object, e.g. {"tags": ["vip"], "company": "Acme"}.
+    additional_data: dict[str, Any] | None = None
 
 
 class ContactCreate(ContactBase):
@@ -20,9 +24,66 @@ class ContactUpdate(ContactBase):
 
 class Contact(ContactBase):
     id: int
-    additional_data: str | None
     owner_id: int
 
+    class Config:
+        orm_mode = True
+
+
+class ContactChanges(BaseModel):
+    version: int
+    more: bool = False
+    changed: list[Contact]
+    deleted: list[int]
+
+
+class ContactBatchUpdate(ContactUpdate):
+    id: int
+
+
+class ContactBatchResult(BaseModel):
+    index: int
+    id: int | None
+    status: int
+    detail: str | None
+    contact: Contact | None
+
+
+class ContactBatchResponse(BaseModel):
+    results: list[ContactBatchResult]
+
+
+class PhoneLookup(BaseModel):
+    numbers: list[str]
+
+
+class PhoneLookupResult(BaseModel):
+    number: str
+    # Set when the number parsed as a full E.164 number; otherwise its digits
+    # were matched as a suffix.
+    e164: str | None
+    contacts: list[Contact]
+
+
+class PhoneLookupResponse(BaseModel):
+    results: list[PhoneLookupResult]
+
+
+class ContactDuplicate(BaseModel):
+    score: float
+    reasons: list[str]
+    contacts: list[Contact]
+
+
+class ContactMerge(BaseModel):
+    keep_id: int
+    merge_ids: list[int]
+
+
+class ContactPage(BaseModel):
+    items: list[Contact]
+    next_cursor: str | None
+
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -32,10 +93,17 @@ class UserCreate(UserBase):
     password: str = Field(min_length=8)
 
 
+class UserLogin(UserBase):
+    password: str
+
+
 class User(UserBase):
     id: int
     is_active: bool = True
 
+    class Config:
+        orm_mode = True
+
 
 class Token(BaseModel):
     access_token: str
@@ -43,10 +111,39 @@ class Token(BaseModel):
     token_type: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class TokenData(BaseModel):
     id: int | None
+    email: str | None
+
+
+class UserRole(BaseModel):
+    role: Literal["user", "admin"]
 
 
 class EmailSchema(BaseModel):
     email: str
 
+
+class ContactStats(BaseModel):
+    contacts: int
+    birthdays_by_month: dict[int, int]
+
+
+class UserCounts(BaseModel):
+    total: int
+    verified: int
+    unverified: int
+
+
+class SiteStats(ContactStats):
+    users: UserCounts
+
+
+class OwnerContactCount(BaseModel):
+    user_id: int
+    contacts: int
+
@@ -0,0 +1,71 @@
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# FTS5 trigram tokens are three characters long; shorter queries can't use the index.
+MIN_INDEXED_QUERY_LENGTH = 3
+
+contacts_fts = table("contacts_fts", column("rowid"), column("rank"))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _substring_filter(needle: str):
+    return models.Contact.search_document.like(f"%{_escape_like(needle)}%", escape="\\")
+
+
+def search_statement(dialect: str, query: str, user_id: int, skip: int = 0, limit: int = 100):
+    needle = models.normalize_search_text(query)
+    if not needle:
+        return None
+    base = select(models.Contact).where(models.Contact.owner_id == user_id)
+
+    if dialect == "postgresql":
+        # gin_trgm_ops serves LIKE '%q%'; word_similarity ranks whole-word hits first.
+        ranked = base.where(_substring_filter(needle)).order_by(
+            func.word_similarity(needle, models.Contact.search_document).desc(),
+            models.Contact.id)
+    elif dialect == "sqlite" and len(needle) >= MIN_INDEXED_QUERY_LENGTH:
+        ranked = base.join(contacts_fts, contacts_fts.c.rowid == models.Contact.id).where(
+            text("contacts_fts MATCH :match").bindparams(match=_fts_phrase(needle))
+        ).order_by(contacts_fts.c.rank, models.Contact.id)
+    else:
+        ranked = base.where(_substring_filter(needle)).order_by(
+            models.Contact.last_name, models.Contact.id)
+
+    return ranked.offset(skip).limit(limit)
+
+
+def search_contacts(db: Session, query: str, user_id: int, skip: int = 0, limit: int = 100):
+    statement = search_statement(db.get_bind().dialect.name, query, user_id, skip, limit)
+    if statement is None:
+        return []
+    return db.scalars(statement).all()
+
+
+# Backfill for rows written before search_document existed.
+def rebuild_search_documents(db: Session, batch_size: int = 1000) -> int:
+    updated = 0
+    last_id = 0
+    while True:
+        batch = db.query(models.Contact).filter(models.Contact.id > last_id).order_by(
+            models.Contact.id).limit(batch_size).all()
+        if not batch:
+            break
+        for contact in batch:
+            contact.search_document = models.build_search_document(
+                contact.first_name, contact.last_name, contact.email)
+        db.commit()
+        updated += len(batch)
+        last_id = batch[-1].id
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')"))
+        db.commit()
+    return updated
@@ -0,0 +1,50 @@
+import json
+from datetime import date
+
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Same order as schemas.Contact, so the keys come out exactly as the
+# response_model would emit them.
+CONTACT_FIELDS = tuple(schemas.Contact.__fields__)
+CONTACT_COLUMNS = [getattr(models.Contact, name) for name in CONTACT_FIELDS]
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    # Matches starlette's JSONResponse.render.
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class ContactsJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# Plain rows instead of Contact instances: no identity map, no per-object
+# Pydantic validation on the way out.
+def select_contact_rows(db: Session, statement) -> list:
+    if statement is None:
+        return []
+    return db.execute(statement.with_only_columns(*CONTACT_COLUMNS)).all()
+
+
+def contact_dicts(rows) -> list[dict]:
+    return [dict(zip(CONTACT_FIELDS, row)) for row in rows]
@@ -0,0 +1,199 @@
+"""Production server: ``python -m app.serve [--workers N] [--port 8000]``.
+
+A small pre-fork supervisor around uvicorn. The parent binds the socket,
+imports the app once (``--no-preload`` imports it in each worker instead)
+and forks the workers, which share the listening socket. On SIGTERM or
+SIGINT every worker stops accepting, finishes in-flight requests and runs
+the lifespan shutdown. Workers still running after SERVE_GRACEFUL_TIMEOUT
+are killed. A worker that dies is replaced.
+
+Each worker keeps its own /metrics registry, so a scrape sees one worker.
+"""
+import argparse
+import logging
+import math
+import os
+import signal
+import socket
+import time
+from importlib.util import find_spec
+
+from .settings import settings
+
+logger = logging.getLogger("app.serve")
+
+# Sync and async engine per worker, both against the primary.
+ENGINES_PER_WORKER = 2
+
+
+def cpu_count() -> int:
+    count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # A container CPU quota (docker --cpus) caps useful workers below the host's cores.
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def default_workers() -> int:
+    return settings.serve_workers or cpu_count()
+
+
+# Splits what Postgres allows us (minus a reserve for the email worker, manage
+# commands and psql) over every pool of every worker. Returns (pool_size, max_overflow).
+def pool_sizes(workers: int, max_connections: int = settings.db_max_connections,
+               reserved: int = settings.db_reserved_connections,
+               preferred_pool_size: int = settings.db_pool_size) -> tuple[int, int]:
+    per_engine = max(1, (max_connections - reserved) // (workers * ENGINES_PER_WORKER))
+    pool_size = min(preferred_pool_size, per_engine)
+    return pool_size, per_engine - pool_size
+
+
+def event_loop() -> str:
+    return "uvloop" if find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if find_spec("httptools") else "h11"
+
+
+def configure(workers: int):
+    # Runs before app.main/database are imported, so the engines pick these up.
+    settings.db_pool_size, settings.db_max_overflow = pool_sizes(workers)
+    if workers * ENGINES_PER_WORKER > settings.db_max_connections - settings.db_reserved_connections:
+        logger.warning("%d workers need at least %d connections; DB_MAX_CONNECTIONS allows %d",
+                       workers, workers * ENGINES_PER_WORKER,
+                       settings.db_max_connections - settings.db_reserved_connections)
+    if not settings.password_hash_workers:
+        settings.password_hash_workers = max(1, cpu_count() // workers)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(settings.serve_backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_app():
+    from .main import app
+    return app
+
+
+def _reset_inherited_pools():
+    # Nothing connects at import, but never share a pooled connection across a fork.
+    from database import async_engine, engine, replica_engines
+    for pooled in (engine, async_engine.sync_engine, *replica_engines):
+        pooled.dispose(close=False)
+
+
+def run_worker(sock: socket.socket, app):
+    import uvicorn
+
+    if app is None:
+        app = load_app()
+    else:
+        _reset_inherited_pools()
+    config = uvicorn.Config(
+        app, loop=event_loop(), http=http_protocol(), lifespan="on",
+        timeout_keep_alive=settings.serve_keep_alive,
+        timeout_graceful_shutdown=settings.serve_graceful_timeout,
+        log_level=settings.serve_log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, sock: socket.socket, workers: int, app=None):
+        self.sock = sock
+        self.workers = workers
+        self.app = app
+        self.children: dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # uvicorn installs its own handlers; until then the supervisor's must not run here.
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.sock, self.app)
+            except BaseException:
+                logger.exception("worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            logger.info("draining %d workers", len(self.children))
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap(self) -> list[int]:
+        exited = []
+        while self.children:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            if self.children.pop(pid, None) is not None:
+                exited.append(pid)
+        return exited
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        while not self.stopping:
+            for pid in self.reap():
+                if not self.stopping:
+                    logger.warning("worker %d exited; starting a replacement", pid)
+                    self.spawn()
+            time.sleep(0.2)
+
+        deadline = time.monotonic() + settings.serve_graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            logger.warning("worker %d did not drain in time; killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+        while self.children:
+            self.children.pop(os.waitpid(-1, 0)[0], None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.serve")
+    parser.add_argument("--host", default=settings.serve_host)
+    parser.add_argument("--port", type=int, default=settings.serve_port)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--no-preload", dest="preload", action="store_false", default=settings.serve_preload,
+                        help="import the app in each worker instead of once before forking")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=settings.serve_log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+
+    configure(args.workers)
+    sock = bind_socket(args.host, args.port)
+    app = load_app() if args.preload else None
+    logger.info("serving on %s:%d with %d workers (%s, %s), db pool %d+%d per engine",
+                args.host, args.port, args.workers, event_loop(), http_protocol(),
+                settings.db_pool_size, settings.db_max_overflow)
+    Supervisor(sock, args.workers, app).run()
+
+
+if __name__ == "__main__":
+    main()
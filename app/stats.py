@@ -0,0 +1,227 @@
+import random
+import time
+from collections import Counter
+
+from sqlalchemy import String, case, cast, event, func, inspect, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+from .settings import settings
+
+# Site-wide rows are spread over this many slots (see models.StatCounter).
+SLOTS = settings.stats_counter_slots
+RECONCILE_INTERVAL = settings.stats_reconcile_interval
+
+SITE = 0
+CONTACTS = "contacts"
+BIRTHDAYS = "birthdays"
+USERS = "users"
+VERIFIED = "verified"
+UNVERIFIED = "unverified"
+MONTHS = range(1, 13)
+
+counters = models.StatCounter.__table__
+contacts = models.Contact.__table__
+users = models.User.__table__
+
+
+# (scope, metric, bucket) -> delta for one contact appearing (sign=1) or
+# disappearing (sign=-1); rows without an owner aren't counted.
+def contact_changes(owner_id: int | None, birthday, sign: int = 1) -> Counter:
+    changes = Counter()
+    if owner_id is None:
+        return changes
+    for scope in (owner_id, SITE):
+        changes[scope, CONTACTS, ""] += sign
+        if birthday is not None:
+            changes[scope, BIRTHDAYS, str(birthday.month)] += sign
+    return changes
+
+
+def user_changes(is_verified: bool, sign: int = 1) -> Counter:
+    return Counter({(SITE, USERS, VERIFIED if is_verified else UNVERIFIED): sign})
+
+
+def increments_statement(dialect: str, changes: Counter):
+    # One upsert per call, rows in key order, and all site rows in the same
+    # random slot: two writers lock shared rows in the same order.
+    slot = random.randrange(SLOTS)
+    rows = [{"scope": scope, "metric": metric, "bucket": bucket, "slot": slot if scope == SITE else 0, "value": value}
+            for (scope, metric, bucket), value in sorted(changes.items()) if value]
+    if not rows:
+        return None
+    statement = (postgresql if dialect == "postgresql" else sqlite).insert(counters).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in counters.primary_key],
+        set_={"value": counters.c.value + statement.excluded.value})
+
+
+# Runs in the caller's transaction, so the counters commit or roll back with
+# the rows they count.
+def record(db: Session, changes: Counter):
+    conn = db.connection()
+    statement = increments_statement(conn.dialect.name, changes)
+    if statement is not None:
+        conn.execute(statement)
+
+
+async def record_async(db, changes: Counter):
+    conn = await db.connection()
+    statement = increments_statement(conn.dialect.name, changes)
+    if statement is not None:
+        await conn.execute(statement)
+
+
+def _before_after(state, name: str):
+    history = state.attrs[name].history
+    if not history.has_changes():
+        value = history.unchanged[0] if history.unchanged else None
+        return value, value
+    return (history.deleted[0] if history.deleted else None), (history.added[0] if history.added else None)
+
+
+def _flushed_changes(obj, sign: int) -> Counter:
+    # Loaded values only: a deleted row can't be refreshed any more.
+    values = inspect(obj).dict
+    if isinstance(obj, models.Contact):
+        return contact_changes(values.get("owner_id"), values.get("birthday"), sign)
+    if isinstance(obj, models.User):
+        return user_changes(values.get("is_verified"), sign)
+    return Counter()
+
+
+# ORM writes (app.crud, app.async_crud, app.dedupe.merge) are counted here,
+# while the flush still shows what it wrote. Core INSERT/UPDATE/DELETE
+# bypasses the session, so app.batch, app.bulk and app.verification call
+# record() themselves, like they merge in models.contact_derived_values.
+@event.listens_for(Session, "after_flush")
+def _count_flushed(session, flush_context):
+    changes = Counter()
+    for obj in session.new:
+        changes.update(_flushed_changes(obj, 1))
+    for obj in session.deleted:
+        changes.update(_flushed_changes(obj, -1))
+    for obj in session.dirty:
+        state = inspect(obj)
+        if isinstance(obj, models.Contact):
+            (old_owner, new_owner), (old_birthday, new_birthday) = (
+                _before_after(state, "owner_id"), _before_after(state, "birthday"))
+            if (old_owner, old_birthday) != (new_owner, new_birthday):
+                changes.update(contact_changes(old_owner, old_birthday, -1))
+                changes.update(contact_changes(new_owner, new_birthday, 1))
+        elif isinstance(obj, models.User):
+            old, new = _before_after(state, "is_verified")
+            if bool(old) != bool(new):
+                changes.update(user_changes(old, -1))
+                changes.update(user_changes(new, 1))
+    if changes:
+        record(session, changes)
+
+
+# Reads: a handful of primary-key rows per metric, whatever the table sizes.
+def _sums(db: Session, scope: int) -> dict[tuple[str, str], int]:
+    rows = db.execute(select(counters.c.metric, counters.c.bucket, func.sum(counters.c.value))
+                      .where(counters.c.scope == scope).group_by(counters.c.metric, counters.c.bucket))
+    return {(metric, bucket): int(total) for metric, bucket, total in rows}
+
+
+def _contact_stats(sums: dict) -> dict:
+    return {"contacts": sums.get((CONTACTS, ""), 0),
+            "birthdays_by_month": {month: sums.get((BIRTHDAYS, str(month)), 0) for month in MONTHS}}
+
+
+def owner_stats(db: Session, owner_id: int) -> dict:
+    return _contact_stats(_sums(db, owner_id))
+
+
+def site_stats(db: Session) -> dict:
+    sums = _sums(db, SITE)
+    verified, unverified = sums.get((USERS, VERIFIED), 0), sums.get((USERS, UNVERIFIED), 0)
+    return {"users": {"total": verified + unverified, "verified": verified, "unverified": unverified},
+            **_contact_stats(sums)}
+
+
+def top_owners(db: Session, limit: int = 10) -> list[dict]:
+    rows = db.execute(select(counters.c.scope, counters.c.value)
+                      .where(counters.c.metric == CONTACTS, counters.c.bucket == "", counters.c.scope != SITE)
+                      .order_by(counters.c.value.desc(), counters.c.scope).limit(limit))
+    return [{"user_id": scope, "contacts": value} for scope, value in rows]
+
+
+def _corrections(db: Session, truth, counted_metrics, scope_range) -> Counter:
+    # Truth and counters are read by one statement, i.e. one snapshot, and
+    # the difference is added rather than stored: writes committed after the
+    # snapshot moved both sides and stay counted.
+    low, high = scope_range
+    current = select(counters.c.scope, counters.c.metric, counters.c.bucket,
+                     (-func.sum(counters.c.value)).label("delta")).where(
+        counters.c.metric.in_(counted_metrics), counters.c.scope > low)
+    if high is not None:
+        current = current.where(counters.c.scope <= high)
+    current = current.group_by(counters.c.scope, counters.c.metric, counters.c.bucket)
+    diff = union_all(*truth, current).subquery()
+    rows = db.execute(select(diff.c.scope, diff.c.metric, diff.c.bucket, func.sum(diff.c.delta))
+                      .group_by(diff.c.scope, diff.c.metric, diff.c.bucket)
+                      .having(func.sum(diff.c.delta) != 0))
+    return Counter({(scope, metric, bucket): int(delta) for scope, metric, bucket, delta in rows})
+
+
+def _owner_truth(low: int, high: int | None):
+    owner = contacts.c.owner_id
+    in_range = [owner > low] if high is None else [owner > low, owner <= high]
+    month = contacts.c.birthday_ordinal // 100
+    return (
+        select(owner.label("scope"), literal(CONTACTS).label("metric"), literal("").label("bucket"),
+               func.count().label("delta")).where(*in_range).group_by(owner),
+        select(owner, literal(BIRTHDAYS), cast(month, String), func.count())
+        .where(*in_range, contacts.c.birthday_ordinal.is_not(None)).group_by(owner, month),
+    )
+
+
+def _user_truth():
+    bucket = case((users.c.is_verified, VERIFIED), else_=UNVERIFIED)
+    return (select(literal(SITE).label("scope"), literal(USERS).label("metric"), bucket.label("bucket"),
+                   func.count().label("delta")).group_by(bucket),)
+
+
+def _site_totals_diff(db: Session) -> Counter:
+    # Site counters must equal the sum of the owners' ones, which were just reconciled.
+    delta = func.sum(case((counters.c.scope == SITE, -counters.c.value), else_=counters.c.value))
+    rows = db.execute(select(counters.c.metric, counters.c.bucket, delta)
+                      .where(counters.c.metric.in_((CONTACTS, BIRTHDAYS)))
+                      .group_by(counters.c.metric, counters.c.bucket).having(delta != 0))
+    return Counter({(SITE, metric, bucket): int(value) for metric, bucket, value in rows})
+
+
+def _correct(db: Session, changes: Counter) -> int:
+    record(db, changes)
+    db.commit()
+    return len(changes)
+
+
+# Corrects drift (rows written by raw SQL, a lost update, counters added to an
+# existing database) owner range by owner range, one short transaction each.
+# Returns the number of counters that were off.
+def reconcile(db: Session, batch_size: int = 1000) -> int:
+    corrected = 0
+    last_id = 0
+    while True:
+        ids = db.scalars(select(users.c.id).where(users.c.id > last_id).order_by(users.c.id).limit(batch_size)).all()
+        high = ids[-1] if ids else None
+        # The last range is open-ended, so counters of vanished owners go to zero.
+        corrected += _correct(db, _corrections(db, _owner_truth(last_id, high), (CONTACTS, BIRTHDAYS), (last_id, high)))
+        if high is None:
+            break
+        last_id = high
+    corrected += _correct(db, _corrections(db, _user_truth(), (USERS,), (SITE - 1, SITE)))
+    return corrected + _correct(db, _site_totals_diff(db))
+
+
+def reconcile_forever(session_factory, batch_size: int = 1000, interval: float = RECONCILE_INTERVAL, report=print):
+    while True:
+        with session_factory() as db:
+            report(f"stat counters corrected: {reconcile(db, batch_size)}")
+        if not interval:
+            return
+        time.sleep(interval)
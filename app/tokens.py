@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+from uuid import uuid4
+
+from jose import JWTError, jwt
+from jose.utils import base64url_decode
+
+from .metrics import timed
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_MINUTES = settings.refresh_token_expire_minutes
+REVOCATION_REFRESH_SECONDS = settings.token_revocation_refresh
+# How long a local revocation is trusted over database snapshots that lack it;
+# far longer than a request takes to commit it.
+PENDING_GRACE = 60
+
+ALGORITHMS = ("HS256", "HS384", "HS512")
+DECODE_OPTIONS = {"require_exp": True, "require_sub": True}
+
+
+class TokenError(Exception):
+    pass
+
+
+# Headers repeat across every token signed with the same key, so picking the
+# kid out of one is cached. jose still checks the whole token, alg included.
+@lru_cache(maxsize=64)
+def _header_kid(segment: str) -> str | None:
+    try:
+        header = json.loads(base64url_decode(segment.encode()))
+    except ValueError:
+        raise TokenError("Malformed token header")
+    if not isinstance(header, dict):
+        raise TokenError("Malformed token header")
+    return header.get("kid")
+
+
+class RevocationList:
+    # Deny-set kept in memory: revoked token ids plus per-user "not before"
+    # times (role changes, logout everywhere). Refreshed from the database in
+    # the background, so verification never waits on a query.
+    def __init__(self, loader=None, refresh_interval: float = REVOCATION_REFRESH_SECONDS, clock=time.monotonic):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.jtis: frozenset[str] = frozenset()
+        self.not_before: dict[int, float] = {}
+        # Local revocations the database may not show yet: made during a load,
+        # or not committed when it ran. entry -> clock() when revoked.
+        self._pending_jtis: dict[str, float] = {}
+        self._pending_users: dict[int, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def is_revoked(self, claims: dict) -> bool:
+        if claims.get("jti") in self.jtis:
+            return True
+        not_before = self.not_before.get(claims.get("uid"))
+        return not_before is not None and claims.get("iat", 0) < not_before
+
+    def revoke_jti(self, jti: str):
+        with self._lock:
+            self.jtis = self.jtis | {jti}
+            self._pending_jtis[jti] = self.clock()
+
+    def revoke_user(self, user_id: int, not_before: float):
+        with self._lock:
+            not_before = max(not_before, self.not_before.get(user_id, 0))
+            self.not_before = {**self.not_before, user_id: not_before}
+            self._pending_users[user_id] = (not_before, self.clock())
+
+    def refresh(self):
+        if self.loader is None:
+            return
+        started = self.clock()
+        jtis, not_before = self.loader()
+        jtis, not_before = set(jtis), dict(not_before)
+        # A pending entry is kept until the database returns it, or until a load
+        # started PENDING_GRACE after it still doesn't (its transaction rolled back).
+        cutoff = started - PENDING_GRACE
+        with self._lock:
+            self._pending_jtis = {jti: revoked for jti, revoked in self._pending_jtis.items()
+                                  if jti not in jtis and revoked > cutoff}
+            self._pending_users = {
+                user_id: (value, revoked) for user_id, (value, revoked) in self._pending_users.items()
+                if not_before.get(user_id, 0) < value and revoked > cutoff}
+            jtis.update(self._pending_jtis)
+            for user_id, (value, _) in self._pending_users.items():
+                not_before[user_id] = max(value, not_before.get(user_id, 0))
+            self.jtis = frozenset(jtis)
+            self.not_before = not_before
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("token revocation refresh failed")
+            await asyncio.sleep(self.refresh_interval)
+
+
+class TokenService:
+    def __init__(self, keys: dict[str, str], active_kid: str, algorithm: str = "HS256",
+                 access_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES,
+                 refresh_minutes: int = REFRESH_TOKEN_EXPIRE_MINUTES,
+                 revocations: RevocationList | None = None, clock=time.time):
+        if active_kid not in keys:
+            raise ValueError(f"Active key id {active_kid!r} is not configured")
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unsupported algorithm {algorithm!r}")
+        self.keys = dict(keys)
+        self.active_kid = active_kid
+        self.algorithm = algorithm
+        self.access_minutes = access_minutes
+        self.refresh_minutes = refresh_minutes
+        self.revocations = revocations or RevocationList()
+        # Sets iat/exp of issued tokens; jose checks exp against the real time.
+        self.clock = clock
+
+    @classmethod
+    def from_env(cls, revocations: RevocationList | None = None) -> "TokenService":
+        # JWT_KEYS="2024-05:secret,2024-11:other"; the active kid signs, the rest only verify.
+        if settings.jwt_keys:
+            keys = dict(item.strip().split(":", 1) for item in settings.jwt_keys.split(",") if item.strip())
+            active_kid = settings.jwt_active_kid or next(iter(keys))
+        elif settings.secret_key:
+            keys = {"default": settings.secret_key}
+            active_kid = "default"
+        else:
+            raise ValueError("Set SECRET_KEY or JWT_KEYS to sign tokens")
+        return cls(keys, active_kid, algorithm=settings.algorithm, revocations=revocations)
+
+    def issue(self, user, token_type: str = "access") -> tuple[str, dict]:
+        now = self.clock()
+        minutes = self.access_minutes if token_type == "access" else self.refresh_minutes
+        claims = {
+            "sub": user.email, "uid": user.id, "role": user.role, "type": token_type,
+            "jti": uuid4().hex, "iat": now, "exp": int(now) + minutes * 60,
+        }
+        token = jwt.encode(claims, self.keys[self.active_kid], algorithm=self.algorithm,
+                           headers={"kid": self.active_kid})
+        return token, claims
+
+    def issue_pair(self, user) -> dict:
+        access_token, _ = self.issue(user, "access")
+        refresh_token, _ = self.issue(user, "refresh")
+        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+    def verify(self, token: str, token_type: str = "access") -> dict:
+        with timed("jwt_verify"):
+            return self._verify(token, token_type)
+
+    def _verify(self, token: str, token_type: str) -> dict:
+        # Tokens minted before kids existed carry none; they verify with the active key.
+        kid = _header_kid(token.split(".", 1)[0])
+        key = self.keys.get(kid or self.active_kid)
+        if key is None:
+            raise TokenError("Unknown signing key")
+        try:
+            claims = jwt.decode(token, key, algorithms=[self.algorithm], options=DECODE_OPTIONS)
+        except JWTError as e:
+            raise TokenError(str(e))
+        if claims.get("type", "access") != token_type:
+            raise TokenError("Wrong token type")
+        if self.revocations.is_revoked(claims):
+            raise TokenError("Token revoked")
+        return claims
+
+
+def load_revocations(session_factory):
+    from datetime import datetime, timezone
+
+    from sqlalchemy import select
+
+    from . import models
+
+    def loader():
+        now = datetime.utcnow()
+        with session_factory() as db:
+            rows = db.execute(select(
+                models.RevokedToken.jti, models.RevokedToken.user_id, models.RevokedToken.not_before
+            ).where(models.RevokedToken.expires_at > now)).all()
+        jtis = {jti for jti, _, _ in rows if jti}
+        not_before = {}
+        for _, user_id, revoked_at in rows:
+            if user_id is not None and revoked_at is not None:
+                not_before[user_id] = max(
+                    not_before.get(user_id, 0), revoked_at.replace(tzinfo=timezone.utc).timestamp())
+        return jtis, not_before
+
+    return loader
+
+
+token_service = TokenService.from_env()
@@ -0,0 +1,90 @@
+import hashlib
+from datetime import datetime, timedelta
+from secrets import token_urlsafe
+
+from sqlalchemy import delete, false, select, update
+from sqlalchemy.orm import Session
+
+from . import models, stats
+from .cache import user_cache
+from .settings import settings
+
+TOKEN_TTL_HOURS = settings.email_verification_ttl_hours
+
+tokens = models.EmailVerificationToken.__table__
+users = models.User.__table__
+
+
+def hash_token(token: str) -> str:
+    # Only the digest is stored: a leaked table can't be replayed as links.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# Only adds the row, like jobs.enqueue_email; the caller commits.
+def issue(db, user_id: int, now: datetime | None = None) -> str:
+    now = now or datetime.utcnow()
+    token = token_urlsafe(32)
+    db.add(models.EmailVerificationToken(
+        token_hash=hash_token(token), user_id=user_id,
+        expires_at=now + timedelta(hours=TOKEN_TTL_HOURS), created_at=now))
+    return token
+
+
+def consume_statement(token: str, now: datetime):
+    # One guarded UPDATE claims the token: of two concurrent clicks exactly one
+    # matches "used_at IS NULL", so there is nothing to race between read and write.
+    return (update(tokens)
+            .where(tokens.c.token_hash == hash_token(token),
+                   tokens.c.used_at.is_(None),
+                   tokens.c.expires_at > now)
+            .values(used_at=now)
+            .returning(tokens.c.user_id))
+
+
+# Matches nothing for an already verified user, so the stats count each user once.
+# Core bypasses the User mapper events, so the callers drop the cached user
+# (keyed by the returned email) themselves once the change commits.
+def mark_verified_statement(user_id: int):
+    return (update(users).where(users.c.id == user_id, users.c.is_verified == false())
+            .values(is_verified=True).returning(users.c.email))
+
+
+VERIFIED_CHANGES = stats.user_changes(True)
+VERIFIED_CHANGES.update(stats.user_changes(False, -1))
+
+
+# Returns the verified user's id, or None for an unknown, used or expired token.
+def consume(db: Session, token: str, now: datetime | None = None) -> int | None:
+    user_id = db.execute(consume_statement(token, now or datetime.utcnow())).scalar()
+    email = db.execute(mark_verified_statement(user_id)).scalar() if user_id is not None else None
+    if email is not None:
+        stats.record(db, VERIFIED_CHANGES)
+    db.commit()
+    if email is not None:
+        user_cache.invalidate(email)
+    return user_id
+
+
+async def consume_async(db, token: str, now: datetime | None = None) -> int | None:
+    user_id = (await db.execute(consume_statement(token, now or datetime.utcnow()))).scalar()
+    email = (await db.execute(mark_verified_statement(user_id))).scalar() if user_id is not None else None
+    if email is not None:
+        await stats.record_async(db, VERIFIED_CHANGES)
+    await db.commit()
+    if email is not None:
+        user_cache.invalidate(email)
+    return user_id
+
+
+def purge_expired(db: Session, batch_size: int = 5000, now: datetime | None = None) -> int:
+    # Used tokens expire too, so this also clears them; short batches keep locks brief.
+    now = now or datetime.utcnow()
+    purged = 0
+    while True:
+        ids = db.scalars(select(tokens.c.id).where(tokens.c.expires_at <= now)
+                         .order_by(tokens.c.expires_at).limit(batch_size)).all()
+        if not ids:
+            return purged
+        db.execute(delete(tokens).where(tokens.c.id.in_(ids)))
+        db.commit()
+        purged += len(ids)
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .settings import settings
+
+TOMBSTONE_RETENTION_DAYS = settings.contact_tombstone_retention_days
+
+users = models.User.__table__
+tombstones = models.ContactTombstone.__table__
+
+
+def bump_statement(owner_id: int):
+    # Atomic increment on the owner row; concurrent writers of one owner queue here.
+    return (update(users).where(users.c.id == owner_id)
+            .values(contacts_version=users.c.contacts_version + 1)
+            .returning(users.c.contacts_version))
+
+
+def bump(db: Session, owner_id: int) -> int:
+    return db.execute(bump_statement(owner_id)).scalar_one()
+
+
+async def bump_async(db, owner_id: int) -> int:
+    return (await db.execute(bump_statement(owner_id))).scalar_one()
+
+
+def tombstone(contact_id: int, owner_id: int, version: int) -> models.ContactTombstone:
+    return models.ContactTombstone(contact_id=contact_id, owner_id=owner_id, version=version)
+
+
+def get_versions(db: Session, user_id: int):
+    return db.execute(select(users.c.contacts_version, users.c.contacts_version_floor)
+                      .where(users.c.id == user_id)).one()
+
+
+def etag(user_id: int, version: int, *variant) -> str:
+    return 'W/"' + ".".join(str(part) for part in (user_id, version, *variant)) + '"'
+
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes don't matter.
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == tag.removeprefix("W/") for candidate in candidates)
+
+
+def changed_statement(user_id: int, since: int, until: int | None = None):
+    statement = select(models.Contact).where(models.Contact.owner_id == user_id)
+    if since:
+        statement = statement.where(models.Contact.version > since)
+    if until is not None:
+        statement = statement.where(models.Contact.version <= until)
+    return statement.order_by(models.Contact.version, models.Contact.id)
+
+
+def deleted_ids(db: Session, user_id: int, since: int, until: int | None = None) -> list[int]:
+    if not since:
+        # A full snapshot has nothing to delete on the client.
+        return []
+    statement = select(tombstones.c.contact_id).where(tombstones.c.owner_id == user_id, tombstones.c.version > since)
+    if until is not None:
+        statement = statement.where(tombstones.c.version <= until)
+    return db.scalars(statement.order_by(tombstones.c.version)).all()
+
+
+def _change_versions(db: Session, user_id: int, since: int, limit: int) -> list[int]:
+    # Versions of the next limit + 1 changes after since, rows and tombstones merged.
+    found = db.scalars(select(models.Contact.version).where(
+        models.Contact.owner_id == user_id, models.Contact.version > since
+    ).order_by(models.Contact.version).limit(limit + 1)).all()
+    if since:
+        found += db.scalars(select(tombstones.c.version).where(
+            tombstones.c.owner_id == user_id, tombstones.c.version > since
+        ).order_by(tombstones.c.version).limit(limit + 1)).all()
+    return sorted(found)[:limit + 1]
+
+
+# Upper version bound of the next page of changes (None: everything left fits)
+# and whether more follow. A page never splits a version, since batch writes
+# and imports give many rows the same one: a version bigger than the limit
+# comes whole, and so do rows older than versioning (version 0) in a since=0
+# snapshot.
+def changes_until(db: Session, user_id: int, since: int, limit: int) -> tuple[int | None, bool]:
+    found = _change_versions(db, user_id, since, limit)
+    if len(found) <= limit:
+        return None, False
+    boundary = found[limit]
+    below = [version for version in found[:limit] if version < boundary]
+    if below:
+        return below[-1], True
+    return boundary, bool(_change_versions(db, user_id, boundary, 0))
+
+
+# Drops old tombstones and raises each affected owner's floor, so clients
+# asking for changes since a purged version are told to reload instead.
+def purge_tombstones(db: Session, retention_days: int = TOMBSTONE_RETENTION_DAYS, batch_size: int = 5000) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    purged = 0
+    while True:
+        rows = db.execute(select(tombstones.c.id, tombstones.c.owner_id, tombstones.c.version)
+                          .where(tombstones.c.created_at < cutoff)
+                          .order_by(tombstones.c.id).limit(batch_size)).all()
+        if not rows:
+            return purged
+        floors = {}
+        for row in rows:
+            floors[row.owner_id] = max(floors.get(row.owner_id, 0), row.version)
+        for owner_id, floor in floors.items():
+            db.execute(update(users).where(users.c.id == owner_id).values(
+                contacts_version_floor=case(
+                    (users.c.contacts_version_floor < floor, floor),
+                    else_=users.c.contacts_version_floor)))
+        db.execute(delete(tombstones).where(tombstones.c.id.in_([row.id for row in rows])))
+        db.commit()
+        purged += len(rows)
@@ -0,0 +1,144 @@
+"""Email job worker: ``python -m app.worker``."""
+import logging
+import os
+import signal
+import smtplib
+import socket
+import ssl
+import time
+from email.message import EmailMessage
+
+from database import SessionLocal
+from . import jobs
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = settings.worker_batch_size
+POLL_INTERVAL = settings.worker_poll_interval
+LEASE_SECONDS = settings.worker_lease_seconds
+# Probe an idle connection with NOOP before reusing it.
+IDLE_CHECK_SECONDS = 30
+
+
+class SMTPSender:
+    def __init__(self, host: str, port: int, username: str | None = None, password: str | None = None,
+                 use_tls: bool = True, timeout: float = 30, reuse: bool = True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.reuse = reuse
+        self.from_address = username or f"noreply@{socket.getfqdn()}"
+        self._smtp: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    @classmethod
+    def from_env(cls) -> "SMTPSender":
+        return cls(
+            host=settings.email_host,
+            port=settings.email_port,
+            username=settings.email_username,
+            password=settings.email_password,
+            use_tls=settings.email_use_tls,
+        )
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            smtp.starttls(context=ssl.create_default_context())
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > IDLE_CHECK_SECONDS:
+            try:
+                self._smtp.noop()
+            except smtplib.SMTPException:
+                self._smtp = None
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def send(self, message: EmailMessage):
+        if "From" not in message:
+            message["From"] = self.from_address
+        try:
+            self._connection().send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            self._connection().send_message(message)
+        self._last_used = time.monotonic()
+        if not self.reuse:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+
+def build_message(job) -> EmailMessage:
+    message = EmailMessage()
+    message["To"] = job.recipient
+    message["Subject"] = job.subject
+    message.set_content(job.body)
+    return message
+
+
+def run_once(session_factory, sender: SMTPSender, worker_id: str, batch_size: int = BATCH_SIZE,
+             lease_seconds: int = LEASE_SECONDS) -> int:
+    with session_factory() as db:
+        # Taken before the claim, so it can only be earlier than the lease's end.
+        deadline = time.monotonic() + lease_seconds
+        batch = jobs.claim_batch(db, worker_id, limit=batch_size, lease_seconds=lease_seconds)
+        # One claim, one lease; read now, before anything can reload the rows.
+        lease = batch[0].locked_by if batch else None
+        sent = []
+        for index, job in enumerate(batch):
+            # A send may block for the SMTP timeout; start one only while the lease
+            # outlasts that (the first always goes, or nothing would ever be sent)
+            # and hand the rest back instead of letting another worker re-send them.
+            if index and time.monotonic() + sender.timeout > deadline:
+                jobs.release(db, lease, batch[index:])
+                break
+            try:
+                sender.send(build_message(job))
+                sent.append(job)
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning("email job %s failed: %s", job.id, e)
+                jobs.mark_failed(db, lease, job, str(e))
+        jobs.mark_sent(db, lease, sent)
+        db.commit()
+        return len(batch)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    sender = SMTPSender.from_env()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("email worker %s started", worker_id)
+    try:
+        while not stopping:
+            if run_once(SessionLocal, sender, worker_id) == 0:
+                time.sleep(POLL_INTERVAL)
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    main()
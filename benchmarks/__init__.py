@@ -0,0 +1,4 @@
+import os
+
+# app.tokens refuses to import without a signing key; benchmarks never serve real users.
+os.environ.setdefault("SECRET_KEY", "benchmark-signing-key")
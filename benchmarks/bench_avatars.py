@@ -0,0 +1,92 @@
+"""Avatar pipeline: concurrent upload throughput, event-loop lag and per-upload memory.
+
+Uses the local filesystem backend so only our own pipeline is measured.
+Run from the repository root::
+
+    python -m benchmarks.bench_avatars --uploads 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+from PIL import Image
+
+from app import avatars
+from benchmarks.common import percentile
+
+
+def sample_jpeg(width: int = 1600, height: int = 1200) -> bytes:
+    rng = random.Random(1)
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    image.paste((rng.randrange(256), 0, 0), (0, 0, width // 2, height // 2))
+    out = BytesIO()
+    image.save(out, "JPEG", quality=80)
+    return out.getvalue()
+
+
+async def chunks(data: bytes, size: int = avatars.READ_CHUNK_SIZE):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+        await asyncio.sleep(0)
+
+
+async def one_upload(storage, user_id: int, data: bytes):
+    content = await avatars.read_limited(chunks(data))
+    return await avatars.store_avatar(user_id, content, storage=storage)
+
+
+async def run(uploads: int, concurrency: int, data: bytes, storage) -> dict:
+    lag = []
+    done = asyncio.Event()
+
+    async def monitor():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag.append(time.perf_counter() - started - 0.005)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(user_id):
+        async with semaphore:
+            await one_upload(storage, user_id, data)
+
+    probe = asyncio.create_task(monitor())
+    started = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(uploads)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe
+    return {
+        "uploads_per_sec": round(uploads / elapsed, 1),
+        "loop_lag_p99_ms": round(percentile(lag, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    data = sample_jpeg()
+    print(f"input: {len(data) / 1024:.0f} KiB JPEG")
+    with tempfile.TemporaryDirectory() as root:
+        storage = avatars.LocalStorage(root, "/media/avatars")
+
+        tracemalloc.start()
+        asyncio.run(one_upload(storage, 0, data))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"per-upload peak Python allocations: {peak / 1024 / 1024:.2f} MiB")
+
+        for concurrency in sorted({1, args.concurrency}):
+            print(f"concurrency {concurrency}:", asyncio.run(run(args.uploads, concurrency, data, storage)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Batch contact endpoints vs. the per-item path, latency by batch size.
+
+For each batch size, creates, updates and deletes that many contacts once
+through ``batch`` (one IN lookup, one statement, one commit) and once
+item by item through ``async_crud`` (lookup, write, commit and refresh per
+contact), and reports wall time per operation. Run from the repository root::
+
+    python -m benchmarks.bench_batch --sizes 1,10,50,100 --repeat 5
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import async_crud, batch, models, schemas
+from app.cache import UserSnapshot
+from benchmarks.common import sqlite_engine, summarize
+from database import to_async_url
+
+USER = UserSnapshot(id=1, email="batch@example.com", role="user", avatar_url=None)
+
+
+def contacts(size: int, round_: int, suffix: str = "") -> list[dict]:
+    return [{"first_name": f"first{i}{suffix}", "last_name": "Batch", "email": f"b{round_}-{i}{suffix}@example.com",
+             "phone_number": "+380501234567", "birthday": date(1990, 1 + i % 12, 1 + i % 28)}
+            for i in range(size)]
+
+
+async def per_item(factory, size: int, round_: int) -> dict:
+    timings = {}
+    async with factory() as db:
+        started = time.perf_counter()
+        created = [await async_crud.create_contact(db, schemas.ContactCreate(**data), USER.id)
+                   for data in contacts(size, round_)]
+        timings["create"] = time.perf_counter() - started
+        started = time.perf_counter()
+        for contact, data in zip(created, contacts(size, round_, "u")):
+            await async_crud.update_contact(db, contact.id, schemas.ContactUpdate(**data), USER.id)
+        timings["update"] = time.perf_counter() - started
+        started = time.perf_counter()
+        for contact in created:
+            await async_crud.delete_contact(db, contact.id, USER.id)
+        timings["delete"] = time.perf_counter() - started
+    return timings
+
+
+async def batched(factory, size: int, round_: int) -> dict:
+    timings = {}
+    async with factory() as db:
+        started = time.perf_counter()
+        results = await batch.create_contacts(db, USER, [schemas.ContactCreate(**data) for data in contacts(size, round_)])
+        timings["create"] = time.perf_counter() - started
+        ids = [result["id"] for result in results]
+        started = time.perf_counter()
+        await batch.update_contacts(db, USER, [schemas.ContactBatchUpdate(id=contact_id, **data)
+                                               for contact_id, data in zip(ids, contacts(size, round_, "u"))])
+        timings["update"] = time.perf_counter() - started
+        started = time.perf_counter()
+        await batch.delete_contacts(db, USER, ids)
+        timings["delete"] = time.perf_counter() - started
+    return timings
+
+
+async def run(sizes: list[int], repeat: int):
+    engine, session_factory = sqlite_engine("batch.db")
+    with session_factory() as db:
+        db.add(models.User(id=USER.id, email=USER.email, hashed_password="x"))
+        db.commit()
+    async_engine = create_async_engine(to_async_url(str(engine.url)))
+    factory = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    round_ = 0
+    print(f"{'size':>6} {'path':>9} {'op':>7} {'p50 ms':>10} {'per item ms':>12}")
+    for size in sizes:
+        for name, path in (("per-item", per_item), ("batch", batched)):
+            samples = {"create": [], "update": [], "delete": []}
+            for _ in range(repeat):
+                round_ += 1
+                for op, elapsed in (await path(factory, size, round_)).items():
+                    samples[op].append(elapsed)
+            for op, values in samples.items():
+                p50 = summarize(values)["p50_ms"]
+                print(f"{size:>6} {name:>9} {op:>7} {p50:>10.2f} {p50 / size:>12.3f}")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,10,50,100")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if max(sizes) > batch.MAX_OPERATIONS:
+        parser.error(f"batch sizes are capped at BATCH_MAX_OPERATIONS={batch.MAX_OPERATIONS}")
+    asyncio.run(run(sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Upcoming-birthday query timing at scale: per user and the all-users batch.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_birthdays --contacts 1000000 --owners 100
+"""
+import argparse
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+from app import birthdays, models
+from benchmarks.common import seed_contacts, sqlite_engine, summarize, time_calls
+
+
+def legacy_upcoming(db, user_id, today):
+    next_week = today + timedelta(days=7)
+    return db.scalars(select(models.Contact).where(
+        models.Contact.owner_id == user_id,
+        models.Contact.birthday >= today,
+        models.Contact.birthday < next_week)).all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--owners", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    _, session_factory = sqlite_engine()
+    for owner_id in range(1, args.owners + 1):
+        seed_contacts(session_factory, args.contacts // args.owners, owner_id=owner_id, seed=owner_id)
+
+    today = date(2026, 12, 28)
+    with session_factory() as db:
+        cases = {
+            "legacy date compare (1 user)": lambda: legacy_upcoming(db, 1, today),
+            "ordinal range (1 user)": lambda: birthdays.get_upcoming_birthdays(db, 1, 7, today),
+            "ordinal range, 30 days (1 user)": lambda: birthdays.get_upcoming_birthdays(db, 1, 30, today),
+            "batch, all users": lambda: birthdays.get_upcoming_birthdays_for_all_users(db, 7, today),
+        }
+        print(f"{args.contacts:,} contacts across {args.owners} owners, today={today}")
+        for name, func in cases.items():
+            repeat = 3 if name.startswith("batch") else args.repeat
+            print(f"{name:<34} {summarize(time_calls(func, repeat))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Bulk import/export throughput and peak RSS.
+
+Streams synthetic NDJSON through ``bulk.import_contacts`` and the result back
+out through ``bulk.export_contacts`` without materialising either side.
+Run from the repository root::
+
+    python -m benchmarks.bench_bulk --rows 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import bulk, models
+from benchmarks.common import sqlite_engine
+from database import to_async_url
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def ndjson_body(rows: int, chunk_rows: int = 500):
+    rng = random.Random(7)
+    lines = []
+    for i in range(rows):
+        lines.append(json.dumps({
+            "first_name": f"first{i}", "last_name": f"name{rng.randrange(50000)}",
+            "email": f"bulk{i}@example.com", "phone_number": "+380501234567",
+            "birthday": f"19{rng.randrange(50, 99)}-0{rng.randrange(1, 10)}-1{rng.randrange(0, 9)}",
+        }))
+        if len(lines) == chunk_rows:
+            yield ("\n".join(lines) + "\n").encode()
+            lines.clear()
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def run(rows: int, chunk_size: int):
+    engine, session_factory = sqlite_engine()
+    with session_factory() as db:
+        db.add(models.User(id=1, email="bulk@example.com", hashed_password="x"))
+        db.commit()
+    async_engine = create_async_engine(to_async_url(str(engine.url)))
+    async_factory = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    baseline = peak_rss_mb()
+    async with async_factory() as db:
+        started = time.perf_counter()
+        report = await bulk.import_contacts(db, 1, ndjson_body(rows), "ndjson", chunk_size=chunk_size)
+        elapsed = time.perf_counter() - started
+    print(f"import: {report['inserted']} rows, {report['failed']} failed, "
+          f"{report['inserted'] / elapsed:,.0f} rows/s, peak RSS {peak_rss_mb():.1f} MB "
+          f"(baseline {baseline:.1f} MB)")
+
+    for fmt in ("ndjson", "csv"):
+        async with async_factory() as db:
+            started = time.perf_counter()
+            exported = 0
+            async for chunk in bulk.export_contacts(db, 1, fmt):
+                exported += chunk.count("\n")
+            elapsed = time.perf_counter() - started
+        print(f"export {fmt}: {exported:,} lines, {exported / elapsed:,.0f} rows/s, "
+              f"peak RSS {peak_rss_mb():.1f} MB")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=bulk.CHUNK_SIZE)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.chunk_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Duplicate detection time against address-book size.
+
+For each size, one owner gets that many synthetic contacts. A ``--dup-rate``
+share of them are near-duplicates of an earlier contact: the name has a
+typo, the email has a ``+tag`` and the phone is written in national format.
+The benchmark reports:
+
+* the time for the full ``dedupe.rebuild`` batch job;
+* recall, meaning how many of the injected duplicates it paired;
+* the median time of one incremental write (``crud.create_contact``,
+  which includes ``dedupe.refresh``);
+* the time ``refresh`` takes after a 1000-row bulk insert.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_dedupe --sizes 10000,100000,1000000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date
+
+from sqlalchemy import insert, select, update
+
+from app import crud, dedupe, models, schemas
+from benchmarks.common import sqlite_engine
+
+FIRST_NAMES = ("Олександр", "Андрій", "Іван", "Марія", "Олена", "Наталія", "Сергій", "Тетяна", "Dmytro",
+               "Anna", "John", "Michael", "Sarah", "Emma", "Olivia", "James", "Sophia", "Liam", "Noah", "Ava")
+SYLLABLES = ("ko", "va", "len", "shev", "chen", "bor", "mar", "tin", "pet", "ros", "hal", "dan",
+             "lis", "vol", "ny", "kur", "zar", "mel", "sol", "tar", "gor", "bel", "ran", "vik")
+ENDINGS = ("enko", "uk", "chuk", "sky", "ov", "ych", "ets", "son", "er", "ak")
+
+
+def surname(rng: random.Random) -> str:
+    return (rng.choice(SYLLABLES) + rng.choice(SYLLABLES) + rng.choice(ENDINGS)).capitalize()
+
+
+def typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word + word[-1]
+    index = rng.randrange(1, len(word) - 1)
+    return word[:index] + word[index + 1:]
+
+
+def contact_rows(size: int, dup_rate: float, seed: int = 42):
+    rng = random.Random(seed)
+    originals = []
+    for index in range(size):
+        if originals and rng.random() < dup_rate:
+            source = rng.choice(originals)
+            local, _, domain = source["email"].partition("@")
+            row = {**source, "last_name": typo(source["last_name"], rng),
+                   "email": f"{local}+dup{index}@{domain}", "phone_number": "0" + source["phone_number"][4:],
+                   "duplicate_of": source["index"]}
+        else:
+            first, last = rng.choice(FIRST_NAMES), surname(rng)
+            row = {"first_name": first, "last_name": last, "email": f"c{index}.{last.lower()}@example.com",
+                   "phone_number": f"+380{rng.randrange(10**9):09d}",
+                   "birthday": date(1950 + rng.randrange(60), rng.randrange(1, 13), rng.randrange(1, 29)),
+                   "duplicate_of": None}
+            originals.append({**row, "index": index})
+        row = {key: value for key, value in row.items() if key != "index"}
+        row["index"] = index
+        yield row
+
+
+def load(session_factory, size: int, dup_rate: float) -> list[tuple[int, int]]:
+    expected, batch = [], []
+    with session_factory() as db:
+        db.add(models.User(id=1, email="owner@example.com", hashed_password="x"))
+        db.commit()
+        for row in contact_rows(size, dup_rate):
+            values = {key: row[key] for key in ("first_name", "last_name", "email", "phone_number", "birthday")}
+            values.update(models.contact_derived_values(values), id=row["index"] + 1, owner_id=1, version=1)
+            batch.append(values)
+            if row["duplicate_of"] is not None:
+                expected.append((row["duplicate_of"] + 1, row["index"] + 1))
+            if len(batch) == 10000:
+                db.execute(insert(models.Contact), batch)
+                batch.clear()
+        if batch:
+            db.execute(insert(models.Contact), batch)
+        db.execute(update(models.User).where(models.User.id == 1).values(contacts_version=1))
+        db.commit()
+    return expected
+
+
+def run(size: int, dup_rate: float, writes: int) -> dict:
+    _, factory = sqlite_engine(f"dedupe-{size}.db")
+    expected = load(factory, size, dup_rate)
+    with factory() as db:
+        started = time.perf_counter()
+        pairs = dedupe.rebuild(db, 1)
+        rebuild_seconds = time.perf_counter() - started
+        found = set(db.execute(select(models.ContactDuplicate.contact_id, models.ContactDuplicate.duplicate_id)).all())
+        recall = sum(pair in found for pair in expected) / len(expected) if expected else 1.0
+
+        samples = []
+        for index in range(writes):
+            contact = schemas.ContactCreate(first_name="Write", last_name=f"Probe{index}", email=f"probe{index}@example.com",
+                                            phone_number=f"+38067{index:07d}", birthday=date(1990, 1, 1))
+            started = time.perf_counter()
+            crud.create_contact(db, contact, user_id=1)
+            samples.append(time.perf_counter() - started)
+
+        bulk = []
+        for row in contact_rows(1000, dup_rate, seed=7):
+            values = {key: row[key] for key in ("first_name", "last_name", "email", "phone_number", "birthday")}
+            values["email"] = f"bulk-{values['email']}"
+            values.update(models.contact_derived_values(values), owner_id=1, version=10**6)
+            bulk.append(values)
+        db.execute(insert(models.Contact), bulk)
+        db.execute(update(models.User).where(models.User.id == 1).values(contacts_version=10**6))
+        db.commit()
+        started = time.perf_counter()
+        dedupe.refresh(db, 1)
+        refresh_seconds = time.perf_counter() - started
+    return {
+        "contacts": size,
+        "pairs": pairs,
+        "rebuild_s": round(rebuild_seconds, 3),
+        "recall": round(recall, 3),
+        "write_p50_ms": round(statistics.median(samples) * 1000, 2),
+        "refresh_1000_ms": round(refresh_seconds * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dup-rate", type=float, default=0.02)
+    parser.add_argument("--writes", type=int, default=50)
+    args = parser.parse_args()
+    for size in (int(size) for size in args.sizes.split(",")):
+        print(run(size, args.dup_rate, args.writes), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Email queue throughput against a local aiosmtpd sink.
+
+Compares the worker's persistent SMTP connection with a fresh connection per
+message. Run from the repository root::
+
+    python -m benchmarks.bench_email_queue --messages 2000
+"""
+import argparse
+import time
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+from app import jobs, models, worker
+from benchmarks.common import sqlite_engine
+
+
+def run(messages: int, batch_size: int, reuse: bool, port: int) -> float:
+    _, session_factory = sqlite_engine(f"email-{reuse}.db")
+    with session_factory() as db:
+        for i in range(messages):
+            jobs.enqueue_email(db, f"user{i}@example.com", "Benchmark", "Hello")
+        db.commit()
+
+    sender = worker.SMTPSender("127.0.0.1", port, use_tls=False, reuse=reuse)
+    started = time.perf_counter()
+    while worker.run_once(session_factory, sender, "bench", batch_size):
+        pass
+    elapsed = time.perf_counter() - started
+    sender.close()
+    with session_factory() as db:
+        assert db.query(models.EmailJob).filter(models.EmailJob.status == "sent").count() == messages
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=worker.BATCH_SIZE)
+    args = parser.parse_args()
+
+    controller = Controller(Sink(), hostname="127.0.0.1", port=0)
+    controller.start()
+    port = controller.server.sockets[0].getsockname()[1]
+    try:
+        for reuse in (False, True):
+            rate = run(args.messages, args.batch_size, reuse, port)
+            label = "persistent connection" if reuse else "connection per message"
+            print(f"{label:<24} {rate:,.0f} messages/s")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
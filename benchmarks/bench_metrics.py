@@ -0,0 +1,83 @@
+"""Instrumentation overhead per request and per SQL statement.
+
+Calls a bare ASGI app directly (no server, no HTTP client) with and without
+``MetricsMiddleware`` and runs ``SELECT 1`` on engines with and without
+the query hooks; the difference is the cost of the instrumentation. The
+request figure is split into what the request itself pays and the
+amortised cost of folding samples into histograms when /metrics is scraped.
+Run from the repository root::
+
+    python -m benchmarks.bench_metrics --requests 200000 --queries 50000
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+
+from app import metrics
+
+SCOPE = {"type": "http", "method": "GET", "route": SimpleNamespace(path="/bench")}
+
+
+async def bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def per_request_seconds(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(SCOPE), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def per_query_seconds(engine, queries: int, stats: metrics.RequestStats | None) -> float:
+    token = metrics.current_request.set(stats)
+    try:
+        with engine.connect() as conn:
+            statement = text("SELECT 1")
+            started = time.perf_counter()
+            for _ in range(queries):
+                conn.execute(statement)
+            return (time.perf_counter() - started) / queries
+    finally:
+        metrics.current_request.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=50_000)
+    args = parser.parse_args()
+
+    bare = asyncio.run(per_request_seconds(bare_app, args.requests))
+    # Keep the buffered samples out of the request loop, then time folding them in.
+    metrics.MAX_PENDING_REQUESTS = args.requests + 1
+    wrapped = asyncio.run(per_request_seconds(metrics.MetricsMiddleware(bare_app), args.requests))
+    started = time.perf_counter()
+    metrics.flush_request_samples()
+    flush = (time.perf_counter() - started) / args.requests
+    print(f"request: bare {bare * 1e6:.2f} us, instrumented {wrapped * 1e6:.2f} us, "
+          f"overhead {(wrapped - bare) * 1e6:.2f} us on the request path "
+          f"+ {flush * 1e6:.2f} us folded in at scrape time")
+
+    plain = per_query_seconds(create_engine("sqlite://"), args.queries, None)
+    hooked_engine = create_engine("sqlite://")
+    metrics.instrument_engine(hooked_engine)
+    hooked = per_query_seconds(hooked_engine, args.queries, metrics.RequestStats())
+    print(f"query:   plain {plain * 1e6:.2f} us, instrumented {hooked * 1e6:.2f} us, "
+          f"overhead {(hooked - plain) * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Contact listing latency: OFFSET/LIMIT vs. keyset cursors, first and deep pages.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_pagination --page-size 100 --deep-page 10000
+"""
+import argparse
+
+from app import crud, models
+from benchmarks.common import seed_contacts, sqlite_engine, summarize, time_calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--deep-page", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    contacts = args.page_size * (args.deep_page + 1)
+    _, session_factory = sqlite_engine()
+    seed_contacts(session_factory, contacts)
+
+    with session_factory() as db:
+        # Cursor pointing at the last row of the page just before the deep page.
+        boundary = db.query(models.Contact).filter(models.Contact.owner_id == 1).order_by(
+            models.Contact.last_name, models.Contact.id).offset(
+                args.page_size * (args.deep_page - 1) - 1).first()
+        deep_cursor = crud.encode_contact_cursor(1, boundary.last_name, boundary.id)
+
+        cases = {
+            ("offset", 1): lambda: crud.get_contacts(db, skip=0, limit=args.page_size, user_id=1),
+            ("offset", args.deep_page): lambda: crud.get_contacts(
+                db, skip=args.page_size * (args.deep_page - 1), limit=args.page_size, user_id=1),
+            ("keyset", 1): lambda: crud.get_contacts_page(db, 1, limit=args.page_size),
+            ("keyset", args.deep_page): lambda: crud.get_contacts_page(
+                db, 1, cursor=deep_cursor, limit=args.page_size),
+        }
+        print(f"{contacts} contacts, page size {args.page_size}")
+        print(f"{'mode':<8} {'page':>7} {'p50 ms':>9} {'p99 ms':>9}")
+        for (mode, page), func in cases.items():
+            stats = summarize(time_calls(func, args.repeat))
+            print(f"{mode:<8} {page:>7} {stats['p50_ms']:>9} {stats['p99_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
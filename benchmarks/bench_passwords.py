@@ -0,0 +1,68 @@
+"""Login throughput: bcrypt inline on the event loop vs. the PasswordHasher pool.
+
+While logins run, a probe coroutine measures how long unrelated work waits
+for the loop. Run from the repository root::
+
+    python -m benchmarks.bench_passwords --logins 64
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.passwords import PasswordHasher, pwd_context
+from benchmarks.common import percentile
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run(mode: str, logins: int, workers: int, hashed: str) -> dict:
+    lag = []
+    stop = asyncio.Event()
+    hasher = None if mode == "inline" else PasswordHasher(mode, max_workers=workers, max_pending=logins)
+
+    async def login():
+        if hasher is None:
+            return pwd_context.verify_and_update("correct horse", hashed)
+        return await hasher.verify("correct horse", hashed)
+
+    monitor = asyncio.create_task(probe(lag, stop))
+    if hasher is not None:
+        await hasher.verify("warm up", hashed)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    if hasher is not None:
+        hasher.shutdown()
+
+    cores = 1 if hasher is None else min(workers, os.cpu_count() or 1)
+    return {
+        "logins_per_sec": round(logins / elapsed, 2),
+        "logins_per_sec_per_core": round(logins / elapsed / cores, 2),
+        "loop_lag_p99_ms": round(percentile(lag, 99) * 1000, 1),
+        "loop_lag_max_ms": round(max(lag, default=0.0) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    hashed = pwd_context.hash("correct horse")
+    for mode in ("inline", "thread", "process"):
+        print(mode, asyncio.run(run(mode, args.logins, args.workers, hashed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Caller-ID lookups per second against a large contacts table.
+
+Seeds ``--contacts`` rows (see ``benchmarks.seed``) unless ``--skip-seed``
+is given. It then times ``app.phones.lookup`` for one owner with batches of
+known numbers, given in national format (exact E.164 match) and as their
+last seven digits (suffix match on the reversed-digit index). The query
+plan for each kind is printed so the index use is visible. Run from the
+repository root::
+
+    python -m benchmarks.bench_phones --contacts 10000000 --database-url sqlite:////tmp/phones.db
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from app import models, phones
+from benchmarks import seed
+from benchmarks.common import summarize, time_calls
+
+
+def sample_numbers(db: Session, owner_id: int, count: int) -> list[str]:
+    stored = db.scalars(select(models.Contact.phone_e164).where(
+        models.Contact.owner_id == owner_id, models.Contact.phone_e164.is_not(None)).limit(count)).all()
+    # "+380501234567" -> "0501234567", as a caller's number usually arrives.
+    return ["0" + number[4:] for number in stored]
+
+
+def explain(db: Session, statement) -> str:
+    dialect = db.get_bind().dialect.name
+    prefix = "EXPLAIN QUERY PLAN" if dialect == "sqlite" else "EXPLAIN"
+    compiled = statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+    return "\n".join("    " + " ".join(str(part) for part in row) for row in db.execute(text(f"{prefix} {compiled}")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--batch-sizes", default="1,100,500")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'phones.db')}"
+    engine = create_engine(url)
+    if not args.skip_seed:
+        print("seeded", seed.seed(engine, args.users, args.contacts), flush=True)
+
+    rng = random.Random(42)
+    with Session(engine) as db:
+        owner_id = 1
+        known = sample_numbers(db, owner_id, max(int(size) for size in args.batch_sizes.split(",")))
+        dialect = engine.dialect.name
+        for kind, numbers in (("exact", known), ("suffix", [number[-7:] for number in known])):
+            keys = [phones.lookup_key(number) for number in numbers[:1]]
+            print(f"{kind} plan:\n{explain(db, phones.lookup_statement(dialect, owner_id, keys))}")
+            for size in (int(size) for size in args.batch_sizes.split(",")):
+                batch = numbers[:size]
+                samples = time_calls(lambda: phones.lookup(db, owner_id, rng.sample(batch, len(batch))), args.repeat)
+                stats = summarize(samples)
+                rate = len(batch) * len(samples) / sum(samples)
+                print(f"{kind:<7} batch {len(batch):>4}: {rate:>12,.0f} numbers/s  "
+                      f"p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Per-request overhead of each rate-limit storage backend.
+
+Times ``RateLimiter.__call__`` (key derivation + storage round trip) on a
+generous limit so every call is allowed. Run from the repository root::
+
+    python -m benchmarks.bench_ratelimit --calls 20000 --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from app.ratelimit import MemoryStorage, RateLimiter, RedisStorage, SQLiteStorage
+
+
+def fake_request(i: int):
+    route = SimpleNamespace(endpoint=None, path="/contacts/")
+    return SimpleNamespace(
+        scope={"route": route}, method="GET", url=SimpleNamespace(path="/contacts/"),
+        client=SimpleNamespace(host=f"192.0.2.{i % 200}"), headers={})
+
+
+async def measure(limiter: RateLimiter, calls: int) -> float:
+    requests = [fake_request(i) for i in range(calls)]
+    started = time.perf_counter()
+    for request in requests:
+        await limiter(request)
+    return (time.perf_counter() - started) / calls * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    backends = {
+        "memory": MemoryStorage(),
+        "sqlite": SQLiteStorage(os.path.join(tempfile.mkdtemp(), "ratelimit.db")),
+    }
+    if args.redis_url:
+        backends["redis"] = RedisStorage.from_url(args.redis_url)
+    else:
+        try:
+            import fakeredis
+            backends["redis (fakeredis)"] = RedisStorage(fakeredis.aioredis.FakeRedis())
+        except ImportError:
+            pass
+
+    for name, storage in backends.items():
+        limiter = RateLimiter(storage, default="1000000/second")
+        print(f"{name:<18} {asyncio.run(measure(limiter, args.calls)):8.1f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Contact search latency: legacy ILIKE scan vs. the indexed search subsystem.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_search --contacts 200000
+"""
+import argparse
+
+from sqlalchemy import or_
+
+from app import models, search
+from benchmarks.common import seed_contacts, sqlite_engine, summarize, time_calls
+
+# Name pools of different sizes give queries with very different result-set sizes.
+SURNAMES = {"rareson": 0.0005, "smithers": 0.005, "johnson": 0.05, "brown": 0.2}
+
+
+def pick_surname(rng):
+    roll = rng.random()
+    cumulative = 0.0
+    for surname, share in SURNAMES.items():
+        cumulative += share
+        if roll < cumulative:
+            return surname
+    return None
+
+
+def legacy_search(db, query, user_id):
+    return db.query(models.Contact).filter(
+        models.Contact.owner_id == user_id,
+        or_(
+            models.Contact.first_name.ilike(f"%{query}%"),
+            models.Contact.last_name.ilike(f"%{query}%"),
+            models.Contact.email.ilike(f"%{query}%")
+        )
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contacts", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    _, session_factory = sqlite_engine()
+    seed_contacts(session_factory, args.contacts, last_name=pick_surname)
+
+    print(f"{'query':<10} {'matches':>8} {'mode':<8} {'p50 ms':>9} {'p99 ms':>9}")
+    with session_factory() as db:
+        for surname in SURNAMES:
+            matches = len(legacy_search(db, surname, 1))
+            modes = {
+                "ilike": lambda: legacy_search(db, surname, 1),
+                "indexed": lambda: search.search_contacts(db, surname, 1, limit=args.limit),
+            }
+            for mode, func in modes.items():
+                stats = summarize(time_calls(func, args.repeat))
+                print(f"{surname:<10} {matches:>8} {mode:<8} {stats['p50_ms']:>9} {stats['p99_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Contact list serialization: ORM + Pydantic vs. column rows + fast encoder.
+
+Times the full read path for one list response, query included, at several
+result sizes. Each call uses a fresh session so ORM hydration is counted.
+Run from the repository root::
+
+    python -m benchmarks.bench_serialization --sizes 100,1000,10000
+"""
+import argparse
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import crud, schemas, serialization
+from benchmarks.common import seed_contacts, sqlite_engine, summarize, time_calls
+
+
+def orm_pydantic(session_factory, limit: int) -> bytes:
+    # What a response_model endpoint does: validate each object, encode, dump.
+    with session_factory() as db:
+        contacts = db.scalars(crud.contacts_statement(limit=limit, user_id=1)).all()
+        return JSONResponse(jsonable_encoder([schemas.Contact.from_orm(c) for c in contacts])).body
+
+
+def column_rows(session_factory, limit: int) -> bytes:
+    with session_factory() as db:
+        rows = serialization.select_contact_rows(db, crud.contacts_statement(limit=limit, user_id=1))
+        return serialization.ContactsJSONResponse(serialization.contact_dicts(rows)).body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    _, session_factory = sqlite_engine()
+    seed_contacts(session_factory, max(sizes))
+    encoder = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+    print(f"fast path encoder: {encoder}")
+    print(f"{'rows':>7} {'path':<14} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in sizes:
+        assert orm_pydantic(session_factory, size) == column_rows(session_factory, size)
+        for name, func in (("orm+pydantic", orm_pydantic), ("column rows", column_rows)):
+            stats = summarize(time_calls(lambda: func(session_factory, size), args.repeat))
+            print(f"{size:>7} {name:<14} {stats['p50_ms']:>9} {stats['p99_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
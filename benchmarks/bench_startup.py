@@ -0,0 +1,130 @@
+"""Cold-start cost: importing the app, first request, and uvicorn readiness.
+
+Every sample runs in a fresh interpreter so module caches never carry over.
+It measures three things:
+
+* ``import app.main`` on its own.
+* Import plus lifespan startup plus the first authenticated ``/contacts/``
+  request over ASGI.
+* The time from spawning uvicorn until ``/metrics`` first returns 200.
+
+The schema is bootstrapped once up front, as ``python -m app.manage
+bootstrap`` does in deployment. The time a ``create_all`` against that ready
+database takes is printed too, for comparison with the old bootstrap on
+import. Run from the repository root::
+
+    python -m benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import app.main
+print(time.perf_counter() - started)
+"""
+
+FIRST_REQUEST_SNIPPET = """
+import asyncio, time
+from types import SimpleNamespace
+started = time.perf_counter()
+import httpx
+from app.main import app, lifespan, token_service
+
+async def first_request():
+    token, _ = token_service.issue(SimpleNamespace(id=1, email="bench@example.com", role="user"))
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/contacts/", headers={"Authorization": f"Bearer {token}"})
+            response.raise_for_status()
+
+asyncio.run(first_request())
+print(time.perf_counter() - started)
+"""
+
+SEED_USER_SNIPPET = """
+from app import models
+from database import SessionLocal
+with SessionLocal() as db:
+    db.merge(models.User(id=1, email="bench@example.com", hashed_password="x"))
+    db.commit()
+print(0)
+"""
+
+CREATE_ALL_SNIPPET = """
+import time
+from database import Base, engine
+started = time.perf_counter()
+Base.metadata.create_all(bind=engine)
+print(time.perf_counter() - started)
+"""
+
+
+def run_snippet(snippet: str, env: dict) -> float:
+    result = subprocess.run([sys.executable, "-c", snippet], env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def uvicorn_ready(env: dict, port: int) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"], env=env)
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/metrics").status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving")
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name: str, samples: list[float]):
+    print(f"{name:<28} median {statistics.median(samples) * 1000:>9.1f} ms   "
+          f"min {min(samples) * 1000:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--skip-uvicorn", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="contacts-startup-")
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        "AVATAR_STORAGE": "local",
+        "AVATAR_LOCAL_ROOT": os.path.join(workdir, "avatars"),
+        "JWT_KEYS": "bench:benchmark-signing-key",
+        "JWT_ACTIVE_KID": "bench",
+    }
+    subprocess.run([sys.executable, "-m", "app.manage", "bootstrap"], env=env, check=True)
+    run_snippet(SEED_USER_SNIPPET, env)
+
+    report("import app.main", [run_snippet(IMPORT_SNIPPET, env) for _ in range(args.repeat)])
+    report("import + first request", [run_snippet(FIRST_REQUEST_SNIPPET, env) for _ in range(args.repeat)])
+    report("create_all (schema ready)", [run_snippet(CREATE_ALL_SNIPPET, env) for _ in range(args.repeat)])
+    if not args.skip_uvicorn:
+        report("uvicorn spawn to ready", [uvicorn_ready(env, args.port) for _ in range(args.repeat)])
+
+
+if __name__ == "__main__":
+    main()
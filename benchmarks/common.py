@@ -0,0 +1,82 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from database import Base
+
+BATCH_SIZE = 10000
+
+
+def sqlite_engine(name: str = "bench.db"):
+    path = os.path.join(tempfile.mkdtemp(prefix="contacts-bench-"), name)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def contact_row(index: int, owner_id: int, rng: random.Random, last_name: str | None = None) -> dict:
+    first_name = f"first{index}"
+    last_name = last_name or f"name{rng.randrange(50000)}"
+    email = f"user{owner_id}-{index}@example.com"
+    row = {
+        "first_name": first_name, "last_name": last_name, "email": email,
+        "phone_number": f"+380{rng.randrange(10**9):09d}",
+        "birthday": date(1950 + rng.randrange(60), rng.randrange(1, 13), rng.randrange(1, 29)),
+        "owner_id": owner_id,
+    }
+    row.update(models.contact_derived_values(row))
+    return row
+
+
+def seed_contacts(session_factory, contacts: int, owner_id: int = 1, last_name=None, seed: int = 42):
+    """Bulk-insert ``contacts`` synthetic rows for one owner.
+
+    ``last_name`` is an optional ``callable(rng) -> str | None`` used to shape
+    result-set sizes; ``None`` falls back to a wide random surname pool.
+    """
+    rng = random.Random(seed)
+    with session_factory() as db:
+        if db.get(models.User, owner_id) is None:
+            db.add(models.User(id=owner_id, email=f"owner{owner_id}@example.com", hashed_password="x"))
+            db.commit()
+        rows = []
+        for index in range(contacts):
+            rows.append(contact_row(index, owner_id, rng, last_name(rng) if last_name else None))
+            if len(rows) == BATCH_SIZE:
+                db.execute(insert(models.Contact), rows)
+                rows.clear()
+        if rows:
+            db.execute(insert(models.Contact), rows)
+        db.commit()
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def time_calls(func, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples) -> dict:
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+    }
@@ -0,0 +1,58 @@
+"""Regression check between two ``benchmarks.suite`` result files.
+
+A scenario regresses when its RPS drops, or its p95 latency rises, by more
+than ``--threshold`` (a fraction), when it issues more SQL queries per
+request than before, or when it starts returning errors. Exits with status 1
+on any regression, so it can gate CI. Run from the repository root::
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def regressions(baseline: dict, current: dict, threshold: float) -> list[str]:
+    found = []
+    for scenario, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(scenario)
+        if after is None:
+            continue
+        if after["rps"] < before["rps"] * (1 - threshold):
+            found.append(f"{scenario}: rps {before['rps']} -> {after['rps']}")
+        if after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            found.append(f"{scenario}: p95 {before['p95_ms']} ms -> {after['p95_ms']} ms")
+        if (before["queries_per_request"] is not None and after["queries_per_request"] is not None
+                and after["queries_per_request"] > before["queries_per_request"]):
+            found.append(f"{scenario}: queries/request {before['queries_per_request']} -> "
+                         f"{after['queries_per_request']}")
+        if after["errors"] and not before["errors"]:
+            found.append(f"{scenario}: {after['errors']} errors (none before)")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"{'scenario':<10} {'rps':>19} {'p95 ms':>21} {'queries/req':>13}")
+    for scenario, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(scenario, {})
+        print(f"{scenario:<10} {before.get('rps', '-'):>9} -> {after['rps']:<7} "
+              f"{before.get('p95_ms', '-'):>9} -> {after['p95_ms']:<9} "
+              f"{before.get('queries_per_request', '-')!s:>5} -> {after['queries_per_request']!s:<5}")
+    found = regressions(baseline, current, args.threshold)
+    for line in found:
+        print(f"REGRESSION {line}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
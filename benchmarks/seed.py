@@ -0,0 +1,123 @@
+"""Synthetic users and contacts at benchmark scale (10k to 10M contacts).
+
+Users are ``bench<i>@example.com`` with id ``i + 1`` and share one bcrypt
+hash of ``PASSWORD``, so seeding never waits on bcrypt. Contacts are spread
+round-robin over the users with birthdays across the whole year. SQLite
+gets batched executemany INSERTs; Postgres gets COPY. The same ``--seed``
+always produces the same data. Run from the repository root::
+
+    python -m benchmarks.seed --users 1000 --contacts 1000000 --database-url sqlite:////tmp/bench.db
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+
+from app import models
+from app.passwords import pwd_context
+from database import Base
+
+PASSWORD = "benchmark-password"
+BATCH_SIZE = 20000
+CONTACT_COLUMNS = ("first_name", "last_name", "email", "phone_number", "birthday",
+                   "owner_id", "search_document", "birthday_ordinal", "phone_e164", "phone_reversed",
+                   "email_key", "name_key")
+# Small surname pool so searches and name-ordered pages hit many rows.
+SURNAMES = 5000
+
+
+def user_email(index: int) -> str:
+    return f"bench{index}@example.com"
+
+
+def iter_contact_rows(users: int, contacts: int, seed: int = 42):
+    rng = random.Random(seed)
+    for index in range(contacts):
+        row = {
+            "first_name": f"first{index % 10000}",
+            "last_name": f"name{rng.randrange(SURNAMES)}",
+            "email": f"c{index}@example.com",
+            "phone_number": f"+380{rng.randrange(10**9):09d}",
+            "birthday": date(1950 + rng.randrange(60), rng.randrange(1, 13), rng.randrange(1, 29)),
+            "owner_id": index % users + 1,
+        }
+        row.update(models.contact_derived_values(row))
+        yield row
+
+
+def _batches(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_contacts(engine, rows, batch_size: int):
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for batch in _batches(rows, batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([row[column] for column in CONTACT_COLUMNS])
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY contacts ({', '.join(CONTACT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def seed(engine, users: int, contacts: int, seed: int = 42, batch_size: int = BATCH_SIZE) -> dict:
+    Base.metadata.create_all(bind=engine)
+    hashed_password = pwd_context.hash(PASSWORD)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for batch in _batches(({"id": i + 1, "email": user_email(i), "hashed_password": hashed_password,
+                                "role": "user"} for i in range(users)), batch_size):
+            conn.execute(insert(models.User), batch)
+    users_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rows = iter_contact_rows(users, contacts, seed)
+    if engine.dialect.name == "postgresql":
+        _copy_contacts(engine, rows, batch_size)
+        with engine.begin() as conn:
+            # The explicit user ids leave the serial sequence behind.
+            conn.exec_driver_sql("SELECT setval('users_id_seq', (SELECT max(id) FROM users))")
+    else:
+        with engine.begin() as conn:
+            for batch in _batches(rows, batch_size):
+                conn.execute(insert(models.Contact), batch)
+    contacts_seconds = time.perf_counter() - started
+    return {
+        "users": users, "contacts": contacts,
+        "users_seconds": round(users_seconds, 3),
+        "contacts_seconds": round(contacts_seconds, 3),
+        "contacts_per_second": round(contacts / contacts_seconds) if contacts_seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    engine = create_engine(args.database_url)
+    print(seed(engine, args.users, args.contacts, args.seed, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
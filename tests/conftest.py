@@ -0,0 +1,4 @@
+import os
+
+# app.tokens refuses to import without a signing key.
+os.environ.setdefault("SECRET_KEY", "test-signing-key")
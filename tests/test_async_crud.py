@@ -0,0 +1,57 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import async_crud, models, schemas
+from database import Base
+
+
+class TestAsyncCRUD(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = sessionmaker(
+            bind=self.engine, class_=AsyncSession, expire_on_commit=False)()
+        self.user = models.User(
+            id=1, email="test@example.com", role="user", hashed_password="hashed_password")
+        self.session.add(self.user)
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_get_user_by_email(self):
+        user = await async_crud.get_user_by_email(self.session, "test@example.com")
+        self.assertEqual(user.id, self.user.id)
+
+    async def test_contact_round_trip(self):
+        contact_data = schemas.ContactCreate(first_name="Alice", last_name="Johnson",
+                                             email="alice@example.com", phone_number="5555555555", birthday=date(2000, 12, 25))
+        contact = await async_crud.create_contact(self.session, contact_data, user_id=self.user.id)
+        found = await async_crud.search_contacts(self.session, "johnson", self.user.id)
+        self.assertEqual([c.id for c in found], [contact.id])
+        await async_crud.delete_contact(self.session, contact.id, self.user.id)
+        self.assertEqual(await async_crud.get_contacts(self.session, user_id=self.user.id), [])
+
+    async def test_contact_pages_follow_id_order(self):
+        ids = []
+        for index, last_name in enumerate(("Zed", "Young", "Xu", "White")):
+            contact_data = schemas.ContactCreate(first_name="Ann", last_name=last_name,
+                                                 email=f"{last_name.lower()}@example.com",
+                                                 phone_number="5555555555", birthday=date(2000, 12 - index, 1))
+            ids.append((await async_crud.create_contact(self.session, contact_data, user_id=self.user.id)).id)
+        # Left to the planner, SQLite walks another owner index and returns them backwards.
+        await self.session.execute(text("DROP INDEX ix_contacts_owner_id_id"))
+        pages = [await async_crud.get_contacts(self.session, skip=skip, limit=2, user_id=self.user.id)
+                 for skip in (0, 2)]
+        self.assertEqual([contact.id for page in pages for contact in page], ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import tempfile
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from fastapi import HTTPException, status
+from PIL import Image
+
+from app import avatars
+
+
+def image_bytes(fmt: str, size=(800, 600), mode="RGB") -> bytes:
+    out = BytesIO()
+    Image.new(mode, size, "red").save(out, fmt)
+    return out.getvalue()
+
+
+async def chunks(data: bytes, size: int = 4096):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestAvatars(unittest.TestCase):
+
+    def test_sniff_ignores_declared_content_type(self):
+        self.assertEqual(avatars.sniff_image_type(image_bytes("PNG")), "image/png")
+        self.assertEqual(avatars.sniff_image_type(image_bytes("JPEG")), "image/jpeg")
+        self.assertIsNone(avatars.sniff_image_type(b"GIF89a..."))
+
+    def test_stream_over_limit_is_rejected(self):
+        with self.assertRaises(HTTPException) as exc:
+            asyncio.run(avatars.read_limited(chunks(b"x" * 10_000), limit=5_000))
+        self.assertEqual(exc.exception.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_non_image_is_rejected(self):
+        with self.assertRaises(HTTPException) as exc:
+            asyncio.run(avatars.process_avatar(b"<html>not an image</html>"))
+        self.assertEqual(exc.exception.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_avatar_is_resized_and_stored_locally(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = avatars.LocalStorage(root, "/media/avatars")
+            url = asyncio.run(avatars.store_avatar(7, image_bytes("JPEG"), storage=storage))
+            self.assertEqual(url, "/media/avatars/avatar_7.jpg")
+            with Image.open(f"{root}/avatar_7.jpg") as stored:
+                self.assertEqual(stored.size, (avatars.AVATAR_SIZE, avatars.AVATAR_SIZE))
+
+    def test_transparent_png_stays_png(self):
+        data, content_type = asyncio.run(avatars.process_avatar(image_bytes("PNG", mode="RGBA")))
+        self.assertEqual(content_type, "image/png")
+        self.assertEqual(avatars.sniff_image_type(data), "image/png")
+
+    def test_pixels_over_the_limit_are_rejected(self):
+        avatars._pillow()
+        # Between the limit and twice it, where Pillow only warns.
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 100), self.assertRaises(HTTPException) as exc:
+            asyncio.run(avatars.process_avatar(image_bytes("PNG", size=(15, 10))))
+        self.assertEqual(exc.exception.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_storage_must_implement_save(self):
+        class Incomplete(avatars.AvatarStorage):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+if __name__ == '__main__':
+    unittest.main()
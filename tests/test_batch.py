@@ -0,0 +1,98 @@
+import unittest
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import batch, models, schemas
+from app.cache import UserSnapshot
+from database import Base
+
+
+def contact_data(name: str, **overrides) -> dict:
+    data = {"first_name": name, "last_name": "Doe", "email": f"{name.lower()}@example.com",
+            "phone_number": "1234567890", "birthday": date(1990, 1, 1)}
+    data.update(overrides)
+    return data
+
+
+class TestBatch(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = sessionmaker(
+            bind=self.engine, class_=AsyncSession, expire_on_commit=False)()
+        self.session.add_all([
+            models.User(id=1, email="test@example.com", role="user", hashed_password="x"),
+            models.User(id=2, email="other@example.com", role="user", hashed_password="x"),
+            models.Contact(id=1, owner_id=1, **contact_data("John")),
+            models.Contact(id=2, owner_id=2, **contact_data("Jane")),
+        ])
+        await self.session.commit()
+        self.user = UserSnapshot(id=1, email="test@example.com", role="user", avatar_url=None)
+        self.admin = UserSnapshot(id=3, email="admin@example.com", role="admin", avatar_url=None)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_create_reports_conflicts_per_item(self):
+        items = [schemas.ContactCreate(**contact_data("Alice")),
+                 schemas.ContactCreate(**contact_data("John")),
+                 schemas.ContactCreate(**contact_data("Alice", last_name="Again"))]
+        results = await batch.create_contacts(self.session, self.user, items)
+        self.assertEqual([r["status"] for r in results], [201, 409, 409])
+        self.assertEqual(results[0]["contact"]["owner_id"], 1)
+        created = await self.session.get(models.Contact, (results[0]["id"], 1))
+        self.assertEqual(created.birthday_ordinal, 101)
+
+    async def test_email_of_another_owner_can_be_reused(self):
+        results = await batch.create_contacts(self.session, self.user, [schemas.ContactCreate(**contact_data("Jane"))])
+        self.assertEqual([r["status"] for r in results], [201])
+
+    async def test_update_checks_ownership_and_refreshes_derived_columns(self):
+        items = [schemas.ContactBatchUpdate(id=1, **contact_data("Johnny")),
+                 schemas.ContactBatchUpdate(id=2, **contact_data("Janet")),
+                 schemas.ContactBatchUpdate(id=99, **contact_data("Nobody"))]
+        results = await batch.update_contacts(self.session, self.user, items)
+        # Another owner's contact is indistinguishable from a missing one.
+        self.assertEqual([r["status"] for r in results], [200, 404, 404])
+        self.assertEqual(results[1]["detail"], results[2]["detail"])
+        search_document = await self.session.scalar(
+            select(models.Contact.search_document).where(models.Contact.id == 1))
+        self.assertEqual(search_document, "johnny doe johnny@example.com")
+
+    async def test_update_keeps_additional_data_unless_given(self):
+        await self.session.execute(update(models.Contact).where(models.Contact.id == 1).values(
+            additional_data={"tags": ["vip"]}))
+        await self.session.commit()
+        results = await batch.update_contacts(self.session, self.user, [
+            schemas.ContactBatchUpdate(id=1, **contact_data("Johnny"))])
+        self.assertEqual(results[0]["contact"]["additional_data"], {"tags": ["vip"]})
+        results = await batch.update_contacts(self.session, self.user, [
+            schemas.ContactBatchUpdate(id=1, additional_data={"company": "Acme"}, **contact_data("Johnny"))])
+        stored = await self.session.scalar(select(models.Contact.additional_data).where(models.Contact.id == 1))
+        self.assertEqual(stored, {"company": "Acme"})
+
+    async def test_user_cannot_delete_another_owners_contact(self):
+        results = await batch.delete_contacts(self.session, self.user, [2])
+        self.assertEqual([r["status"] for r in results], [404])
+        self.assertEqual(await self.session.scalar(select(func.count(models.Contact.id))), 2)
+
+    async def test_admin_can_delete_any_contact(self):
+        results = await batch.delete_contacts(self.session, self.admin, [1, 2, 2])
+        self.assertEqual([r["status"] for r in results], [200, 200, 409])
+        self.assertEqual(await self.session.scalar(select(func.count(models.Contact.id))), 0)
+
+    async def test_rejects_oversized_batch(self):
+        with self.assertRaises(HTTPException) as exc:
+            await batch.delete_contacts(self.session, self.user, list(range(batch.MAX_OPERATIONS + 1)))
+        self.assertEqual(exc.exception.status_code, 413)
+
+
+if __name__ == '__main__':
+    unittest.main()
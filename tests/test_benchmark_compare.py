@@ -0,0 +1,26 @@
+import unittest
+
+from benchmarks.compare import regressions
+
+
+def result(rps, p95_ms, queries=2.0, errors=0) -> dict:
+    return {"rps": rps, "p95_ms": p95_ms, "queries_per_request": queries, "errors": errors}
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_within_threshold_passes(self):
+        baseline = {"scenarios": {"list": result(1000, 10.0)}}
+        current = {"scenarios": {"list": result(950, 10.5)}}
+        self.assertEqual(regressions(baseline, current, 0.10), [])
+
+    def test_reports_throughput_latency_queries_and_errors(self):
+        baseline = {"scenarios": {"list": result(1000, 10.0), "search": result(500, 20.0)}}
+        current = {"scenarios": {"list": result(800, 12.0, queries=3.0), "search": result(500, 20.0, errors=4)}}
+        found = regressions(baseline, current, 0.10)
+        self.assertEqual(len(found), 4)
+        self.assertTrue(any(line.startswith("search: 4 errors") for line in found))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import birthdays, crud, models
+from database import Base
+
+
+class TestUpcomingBirthdays(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x")])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def add_contacts(self, *birthdays, owner_id: int = 1):
+        contacts = [models.Contact(first_name="Birthday", last_name=str(i),
+                                   email=f"birthday{owner_id}-{i}@example.com", phone_number="1234567890",
+                                   birthday=birthday, owner_id=owner_id)
+                    for i, birthday in enumerate(birthdays)]
+        self.session.add_all(contacts)
+        self.session.commit()
+        return contacts
+
+    def test_window_wraps_into_january(self):
+        dec_30, jan_1, jan_2, jan_10 = self.add_contacts(
+            date(1980, 12, 30), date(1990, 1, 1), date(1975, 1, 2), date(1975, 1, 10))
+        contacts = crud.get_contacts_with_upcoming_birthdays(self.session, 1, today=date(2026, 12, 28))
+        # Calendar order across the year end, Jan 10 is outside the week.
+        self.assertEqual(contacts, [dec_30, jan_1, jan_2])
+
+    def test_feb_29_in_common_year(self):
+        leapling, _ = self.add_contacts(date(1996, 2, 29), date(1990, 3, 5))
+        contacts = crud.get_contacts_with_upcoming_birthdays(self.session, 1, days=3, today=date(2027, 2, 26))
+        self.assertEqual(contacts, [leapling])
+
+    def test_other_owners_are_excluded(self):
+        mine, = self.add_contacts(date(1980, 6, 2))
+        self.add_contacts(date(1980, 6, 2), owner_id=2)
+        self.assertEqual(crud.get_contacts_with_upcoming_birthdays(self.session, 1, today=date(2026, 6, 1)), [mine])
+
+    def test_upcoming_birthdays_for_all_users(self):
+        self.add_contacts(date(1980, 12, 30), date(1990, 1, 1), date(1990, 6, 1))
+        self.add_contacts(date(1985, 1, 3), owner_id=2)
+        grouped = birthdays.get_upcoming_birthdays_for_all_users(self.session, days=7, today=date(2026, 12, 28))
+        self.assertEqual(sorted(grouped), [1, 2])
+        self.assertEqual((len(grouped[1]), len(grouped[2])), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
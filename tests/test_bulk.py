@@ -0,0 +1,80 @@
+import unittest
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import bulk, models
+from database import Base
+
+CSV_BODY = (
+    b"first_name,last_name,email,phone_number,birthday\n"
+    b"John,Doe,johndoe@example.com,1234567890,1990-01-01\n"
+    b"Broken,Row,not-an-email,1234567890,1990-01-01\n"
+    b"\"Jane, Jr.\",Smith,janesmith@example.com,9876543210,1985-05-15\n"
+    b"John,Again,johndoe@example.com,1234567890,1990-01-01\n"
+)
+
+
+async def body(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestBulk(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = sessionmaker(
+            bind=self.engine, class_=AsyncSession, expire_on_commit=False)()
+        self.session.add(models.User(id=1, email="test@example.com", hashed_password="x"))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_import_reports_row_errors_without_aborting(self):
+        report = await bulk.import_contacts(self.session, 1, body(CSV_BODY), "csv", chunk_size=10)
+        self.assertEqual(report["inserted"], 2)
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 4])
+
+    async def test_export_round_trips_ndjson(self):
+        await bulk.import_contacts(self.session, 1, body(CSV_BODY), "csv")
+        exported = "".join([chunk async for chunk in bulk.export_contacts(self.session, 1, "ndjson")])
+        self.assertEqual(exported.count("\n"), 2)
+        self.assertIn('"first_name": "Jane, Jr."', exported)
+
+    async def test_csv_carries_additional_data_as_json(self):
+        data = (b'first_name,last_name,email,phone_number,birthday,additional_data\n'
+                b'Ann,Lee,ann@example.com,1234567890,1990-01-01,"{""tags"": [""vip""]}"\n'
+                b'Bad,Json,bad@example.com,1234567890,1990-01-01,{oops\n')
+        report = await bulk.import_contacts(self.session, 1, body(data), "csv")
+        self.assertEqual((report["inserted"], [error["row"] for error in report["errors"]]), (1, [2]))
+        exported = "".join([chunk async for chunk in bulk.export_contacts(self.session, 1, "csv")])
+        self.assertIn('"{""tags"": [""vip""]}"', exported)
+
+    async def test_stray_quote_and_bad_bytes_fail_only_their_rows(self):
+        data = (b"first_name,last_name,email,phone_number,birthday\n"
+                b'John,O"Brien,john@example.com,1234567890,1990-01-01\n'
+                b"Bad\xff,Bytes,not-an-email\xfe,1234567890,1990-01-01\n"
+                b'"Never,Closed,never@example.com,1234567890,1990-01-01\n'
+                b"Jane,Smith,jane@example.com,9876543210,1985-05-15\n")
+        report = await bulk.import_contacts(self.session, 1, body(data), "csv")
+        self.assertEqual((report["inserted"], [error["row"] for error in report["errors"]]), (2, [2, 3]))
+        exported = "".join([chunk async for chunk in bulk.export_contacts(self.session, 1, "ndjson")])
+        self.assertIn('"last_name": "O\\"Brien"', exported)
+
+    async def test_overlong_quoted_record_is_reported_and_skipped(self):
+        data = (b"first_name,last_name,email,phone_number,birthday\n"
+                b'"Open,Quote,open@example.com,1234567890,1990-01-01\n'
+                + b"filler line\n" * (bulk.MAX_QUOTED_RECORD_SIZE // 12 + 1)
+                + b"Jane,Smith,jane@example.com,9876543210,1985-05-15\n")
+        report = await bulk.import_contacts(self.session, 1, body(data, size=4096), "csv")
+        self.assertEqual(report["inserted"], 1)
+        self.assertEqual(report["errors"][0]["row"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.cache import TTLCache, UserSnapshot, user_cache
+from database import Base
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=self.clock)
+        self.snapshot = UserSnapshot(id=1, email="test@example.com", role="user", avatar_url=None)
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get("test@example.com"))
+        self.cache.set("test@example.com", self.snapshot)
+        self.assertEqual(self.cache.get("test@example.com"), self.snapshot)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_entries_expire(self):
+        self.cache.set("test@example.com", self.snapshot)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get("test@example.com"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_invalidate(self):
+        self.cache.set("test@example.com", self.snapshot)
+        self.cache.invalidate("test@example.com")
+        self.assertIsNone(self.cache.get("test@example.com"))
+
+    def test_snapshot_is_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.snapshot.role = "admin"
+
+
+class TestUserCacheInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.user = models.User(id=1, email="test@example.com", role="user", hashed_password="x")
+        self.session.add(self.user)
+        self.session.commit()
+        user_cache.set(self.user.email, UserSnapshot.from_user(self.user))
+
+    def tearDown(self):
+        user_cache.invalidate(self.user.email)
+        self.session.close()
+        self.engine.dispose()
+
+    def test_set_user_role_invalidates_cached_user(self):
+        crud.set_user_role(self.session, self.user.id, "admin")
+        self.assertIsNone(user_cache.get(self.user.email))
+
+    def test_rolled_back_change_keeps_cached_user(self):
+        self.user.role = "admin"
+        self.session.flush()
+        self.session.rollback()
+        self.assertIsNotNone(user_cache.get(self.user.email))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app import contact_data, crud, models, schemas
+from app.serialization import contact_dicts, select_contact_rows
+from database import Base
+
+
+def contact_data_for(name: str, additional_data=None) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=name, last_name="Doe", email=f"{name.lower()}@example.com",
+                                 phone_number="+380501234567", birthday=date(1990, 1, 1),
+                                 additional_data=additional_data)
+
+
+class TestContactData(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x")])
+        self.session.commit()
+        crud.create_contact(self.session, contact_data_for("Ann", {"tags": ["vip", "family"], "company": "Acme"}), 1)
+        crud.create_contact(self.session, contact_data_for("Bob", {"tags": ["vip"], "company": "Other"}), 1)
+        crud.create_contact(self.session, contact_data_for("Cid"), 1)
+        crud.create_contact(self.session, contact_data_for("Dan", {"tags": ["vip"], "company": "Acme"}), 2)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def names(self, tags=(), fields=()) -> list[str]:
+        statement = contact_data.apply_filters(
+            crud.contacts_statement(user_id=1), "sqlite", contact_data.parse_filters(list(tags), list(fields)))
+        return sorted(contact["first_name"] for contact in contact_dicts(select_contact_rows(self.session, statement)))
+
+    def test_filters_are_evaluated_in_the_database(self):
+        self.assertEqual(self.names(tags=["vip"]), ["Ann", "Bob"])
+        self.assertEqual(self.names(tags=["vip", "family"]), ["Ann"])
+        self.assertEqual(self.names(fields=["company:Acme"]), ["Ann"])
+        self.assertEqual(self.names(tags=["vip"], fields=["company:Other"]), ["Bob"])
+        self.assertEqual(self.names(tags=["missing"]), [])
+        self.assertEqual(self.names(), ["Ann", "Bob", "Cid"])
+
+    def test_rejects_malformed_filters(self):
+        for fields in (["company"], ["a b:c"], ["tags:vip"], ["k:1", "k:2"], ["k:v"] * (contact_data.MAX_FILTERS + 1)):
+            with self.assertRaises(HTTPException) as raised:
+                contact_data.parse_filters([], fields)
+            self.assertEqual(raised.exception.status_code, 400)
+
+    def test_none_is_stored_as_sql_null(self):
+        stored = self.session.execute(text(
+            "SELECT additional_data FROM contacts WHERE first_name = 'Cid'")).scalar_one()
+        self.assertIsNone(stored)
+
+    def test_legacy_strings_are_converted_in_batches(self):
+        self.session.execute(text("UPDATE contacts SET additional_data = 'call after 6pm' WHERE first_name = 'Ann'"))
+        self.session.execute(text("UPDATE contacts SET additional_data = '[1, 2]' WHERE first_name = 'Bob'"))
+        self.session.commit()
+        self.assertEqual(contact_data.convert_legacy_data(self.session, batch_size=1), 3)
+        self.session.expire_all()
+        rows = {contact.first_name: contact.additional_data for contact in crud.get_contacts(self.session, user_id=1)}
+        self.assertEqual(rows, {"Ann": {"note": "call after 6pm"}, "Bob": {"note": "[1, 2]"}, "Cid": None})
+        self.assertEqual(contact_data.convert_legacy_data(self.session), 3)
+        self.assertEqual(self.names(fields=["note:call after 6pm"]), ["Ann"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app import crud, dedupe, models, schemas
+from database import Base
+
+
+def contact_data(first_name: str, last_name: str, email: str, phone_number: str,
+                 birthday: date = date(1990, 1, 1)) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=first_name, last_name=last_name, email=email,
+                                 phone_number=phone_number, birthday=birthday)
+
+
+class TestDedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x")])
+        self.session.commit()
+        self.john = crud.create_contact(self.session, contact_data(
+            "John", "Smith", "john.smith@gmail.com", "+380501234567"), user_id=1)
+        self.jon = crud.create_contact(self.session, contact_data(
+            "Jon", "Smyth", "johnsmith+home@gmail.com", "050 123 45 67"), user_id=1)
+        self.alice = crud.create_contact(self.session, contact_data(
+            "Alice", "Brown", "alice@example.com", "+380441112233", date(1985, 5, 5)), user_id=1)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def pairs(self, owner_id: int = 1) -> list:
+        return [(entry["contacts"][0]["id"], entry["contacts"][1]["id"], entry["reasons"])
+                for entry in dedupe.list_duplicates(self.session, owner_id)]
+
+    def test_writes_find_duplicates_incrementally(self):
+        self.assertEqual(self.pairs(), [(self.john.id, self.jon.id, ["email", "phone", "name", "birthday"])])
+
+        crud.update_contact(self.session, self.jon.id, contact_data(
+            "Bob", "Green", "bob@example.com", "+380931234567", date(1970, 2, 2)), user_id=1)
+        self.assertEqual(self.pairs(), [])
+
+    def test_email_is_unique_per_owner_only(self):
+        other = crud.create_contact(self.session, contact_data(
+            "John", "Smith", "john.smith@gmail.com", "+380501234567"), user_id=2)
+        self.assertEqual(other.owner_id, 2)
+        self.assertEqual(self.pairs(owner_id=2), [])
+        self.assertEqual(len(self.pairs()), 1)
+
+    def test_rebuild_matches_incremental_result(self):
+        incremental = self.pairs()
+        self.session.execute(models.ContactDuplicate.__table__.delete())
+        self.session.commit()
+        self.assertEqual(dedupe.rebuild(self.session, 1), 1)
+        self.assertEqual(self.pairs(), incremental)
+
+    def test_merge_keeps_one_contact_in_one_transaction(self):
+        self.john.additional_data = {"tags": ["work"], "company": "Acme"}
+        self.jon.additional_data = {"tags": ["vip", "work"], "company": "Other", "met": "conference"}
+        self.session.commit()
+        kept = dedupe.merge(self.session, 1, self.john.id, [self.jon.id])
+        self.assertEqual(kept.additional_data, {"tags": ["work", "vip"], "company": "Acme", "met": "conference"})
+        self.assertIsNone(self.session.get(models.Contact, (self.jon.id, 1)))
+        self.assertEqual(self.session.scalar(select(func.count()).select_from(models.ContactTombstone)), 1)
+        self.assertEqual(self.pairs(), [])
+
+    def test_merge_rejects_foreign_contacts(self):
+        other = crud.create_contact(self.session, contact_data(
+            "Eve", "Black", "eve@example.com", "+380671234567"), user_id=2)
+        with self.assertRaises(HTTPException) as raised:
+            dedupe.merge(self.session, 1, self.john.id, [other.id])
+        self.assertEqual(raised.exception.status_code, 404)
+        self.assertIsNotNone(self.session.get(models.Contact, (other.id, 2)))
+
+    def test_keys_tolerate_formatting_and_spelling(self):
+        self.assertEqual(models.email_key("John.Smith+x@GMail.com"), "johnsmith@gmail.com")
+        self.assertEqual(models.name_key("Jon", "Smyth"), models.name_key("John", "Smith"))
+        self.assertEqual(models.name_key("Smith", "John"), models.name_key("John", "Smith"))
+
+
+if __name__ == '__main__':
+    unittest.main()
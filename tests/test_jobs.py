@@ -0,0 +1,105 @@
+import socket
+import unittest
+from datetime import datetime, timedelta
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import jobs, models, worker
+from database import Base
+
+
+class RecordingHandler(Sink):
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    # aiosmtpd's readiness check connects to the configured port, so port=0
+    # can't be handed to the Controller; pick a free port up front.
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class TestEmailJobs(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        self.handler = RecordingHandler()
+        port = free_port()
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=port)
+        self.controller.start()
+        self.sender = worker.SMTPSender("127.0.0.1", port, use_tls=False)
+
+    def tearDown(self):
+        self.sender.close()
+        self.controller.stop()
+
+    def _enqueue(self, count):
+        with self.session_factory() as db:
+            for i in range(count):
+                jobs.enqueue_email(db, f"user{i}@example.com", "Subject", "Body")
+            db.commit()
+
+    def test_worker_sends_batch_over_one_connection(self):
+        self._enqueue(3)
+        self.assertEqual(worker.run_once(self.session_factory, self.sender, "test"), 3)
+        self.assertEqual(len(self.handler.messages), 3)
+        with self.session_factory() as db:
+            statuses = {job.status for job in db.query(models.EmailJob)}
+        self.assertEqual(statuses, {"sent"})
+        self.assertEqual(worker.run_once(self.session_factory, self.sender, "test"), 0)
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        self._enqueue(2)
+        with self.session_factory() as db:
+            first = jobs.claim_batch(db, "a", limit=10)
+            second = jobs.claim_batch(db, "b", limit=10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+
+    def test_failed_job_is_retried_with_backoff(self):
+        self._enqueue(1)
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            job, = jobs.claim_batch(db, "a", now=now)
+            jobs.mark_failed(db, job.locked_by, job, "connection refused", now=now)
+            db.commit()
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.run_after, now + timedelta(seconds=jobs.BACKOFF_BASE_SECONDS * 0.5))
+            self.assertEqual(jobs.claim_batch(db, "a", now=now), [])
+
+    def test_expired_lease_cannot_overwrite_new_owner(self):
+        self._enqueue(1)
+        with self.session_factory() as db:
+            stale, = jobs.claim_batch(db, "a", lease_seconds=60)
+            lease = stale.locked_by
+            # "a" is still sending when its lease runs out and "b" takes the job.
+            fresh, = jobs.claim_batch(db, "b", now=datetime.utcnow() + timedelta(seconds=120))
+            jobs.mark_sent(db, lease, [stale])
+            jobs.mark_failed(db, lease, stale, "timed out")
+            db.commit()
+            job = db.get(models.EmailJob, fresh.id)
+            self.assertEqual((job.status, job.attempts), ("pending", 0))
+            self.assertTrue(job.locked_by.startswith("b:"))
+
+    def test_jobs_the_lease_cannot_cover_are_released(self):
+        self._enqueue(3)
+        # The SMTP timeout (30 s) outlasts a 1 s lease: only the first job goes out.
+        self.assertEqual(worker.run_once(self.session_factory, self.sender, "test", lease_seconds=1), 3)
+        self.assertEqual(len(self.handler.messages), 1)
+        with self.session_factory() as db:
+            self.assertEqual(len(jobs.claim_batch(db, "b")), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+
+
+def run_request(app, route: str, method: str = "GET"):
+    scope = {"type": "http", "method": method, "route": SimpleNamespace(path=route)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(metrics.MetricsMiddleware(app)(scope, receive, send))
+    return sent
+
+
+def query_app(engine, repeat: int):
+    async def app(scope, receive, send):
+        with engine.connect() as conn:
+            for _ in range(repeat):
+                conn.execute(text("SELECT 1"))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        metrics.instrument_engine(self.engine)
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+        lines = histogram.collect()
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{route="/a"} 3', lines)
+
+    def test_middleware_records_route_and_queries(self):
+        sent = run_request(query_app(self.engine, 2), "/test/queries")
+        self.assertEqual(sent[0]["status"], 200)
+        metrics.flush_request_samples()
+        self.assertEqual(metrics.REQUEST_SECONDS.count("GET", "/test/queries", 200), 1)
+        self.assertEqual(metrics.REQUEST_QUERIES.count("/test/queries"), 1)
+        self.assertIn(b'route="/test/queries"', metrics.registry.render())
+
+    def test_repeated_statement_is_reported_as_n_plus_one(self):
+        with self.assertLogs("app.metrics", level="WARNING") as logs:
+            run_request(query_app(self.engine, metrics.N_PLUS_ONE_THRESHOLD), "/test/n-plus-one")
+        self.assertEqual(metrics.N_PLUS_ONE.value("/test/n-plus-one"), 1)
+        self.assertIn("SELECT 1", logs.output[0])
+
+    def test_failed_statements_leave_nothing_on_the_connection(self):
+        async def app(scope, receive, send):
+            with self.engine.connect() as conn:
+                with self.assertRaises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing"))
+                conn.execute(text("SELECT 1"))
+                self.assertNotIn("metrics_started", conn.info)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        run_request(app, "/test/failed-query")
+        metrics.flush_request_samples()
+        self.assertEqual(metrics.REQUEST_QUERIES.count("/test/failed-query"), 1)
+
+    def test_queries_outside_requests_are_not_counted(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertIsNone(metrics.current_request.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from base64 import urlsafe_b64encode
+from datetime import date
+
+from fastapi import HTTPException, status
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from database import Base
+
+
+def contact_data(first_name: str, last_name: str) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=first_name, last_name=last_name,
+                                 email=f"{first_name.lower()}.{last_name.lower()}@example.com",
+                                 phone_number="1234567890", birthday=date(1990, 1, 1))
+
+
+class TestContactPages(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x")])
+        self.session.commit()
+        # Two Does: the id breaks the tie on last_name.
+        self.contacts = [crud.create_contact(self.session, contact_data(first, last), 1)
+                         for first, last in (("Zoe", "Smith"), ("John", "Doe"), ("Jane", "Doe"), ("Al", "Brown"))]
+        crud.create_contact(self.session, contact_data("Other", "Owner"), 2)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def assertInvalidCursor(self, cursor: str, user_id: int = 1):
+        with self.assertRaises(HTTPException) as exc:
+            crud.get_contacts_page(self.session, user_id, cursor=cursor)
+        self.assertEqual(exc.exception.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pages_walk_all_contacts_in_order(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = crud.get_contacts_page(self.session, 1, cursor=cursor, limit=1)
+            seen += [contact.id for contact in page]
+            if cursor is None:
+                break
+        smith, john, jane, brown = self.contacts
+        self.assertEqual(seen, [brown.id, john.id, jane.id, smith.id])
+
+    def test_last_page_has_no_cursor(self):
+        page, cursor = crud.get_contacts_page(self.session, 1, limit=4)
+        self.assertEqual(len(page), 4)
+        self.assertIsNone(cursor)
+
+    def test_cursor_of_another_owner_is_rejected(self):
+        _, cursor = crud.get_contacts_page(self.session, 1, limit=1)
+        self.assertInvalidCursor(cursor, user_id=2)
+        self.assertInvalidCursor(crud.encode_contact_cursor(2, "Doe", 1))
+
+    def test_tampered_cursor_is_rejected(self):
+        _, cursor = crud.get_contacts_page(self.session, 1, limit=1)
+        self.assertInvalidCursor(cursor[:-2])
+        self.assertInvalidCursor("not a cursor!")
+        # Well-formed JSON, wrong types.
+        self.assertInvalidCursor(urlsafe_b64encode(b'["1","Doe",1]').decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
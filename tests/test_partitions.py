@@ -0,0 +1,152 @@
+import os
+import re
+import unittest
+from datetime import date
+
+from sqlalchemy import create_engine, delete, event, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from app import batch, birthdays, contact_data, crud, models, partitions, phones, schemas, search, versions
+from app.cache import UserSnapshot
+from database import Base
+
+# A scratch PostgreSQL database with pg_trgm and btree_gin available; its
+# tables are dropped and recreated.
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+MODULUS = 8
+OWNER = 7
+
+contacts = models.Contact.__table__
+
+
+def quiet(message):
+    pass
+
+
+@unittest.skipUnless(TEST_POSTGRES_URL, "TEST_POSTGRES_URL not set")
+class TestPartitions(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine(TEST_POSTGRES_URL)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS contacts{partitions.RETIRED_SUFFIX}, "
+                              f"{partitions.STAGING_TABLE} CASCADE"))
+        Base.metadata.drop_all(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        with Session(self.engine) as db:
+            db.add_all([models.User(id=owner, email=f"user{owner}@example.com", hashed_password="x")
+                        for owner in range(1, 21)])
+            db.commit()
+            rows = []
+            for index in range(200):
+                row = {"first_name": f"first{index}", "last_name": f"name{index % 13}", "email": f"c{index}@example.com",
+                       "phone_number": f"+38050{index:07d}", "birthday": date(1990, index % 12 + 1, 10),
+                       "additional_data": {"tags": ["vip"] if index % 3 else []}, "owner_id": index % 20 + 1}
+                row.update(models.contact_derived_values(row))
+                rows.append(row)
+            db.execute(insert(contacts), rows)
+            db.commit()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def rows(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(contacts.c.id, contacts.c.first_name, contacts.c.owner_id)
+                                .order_by(contacts.c.id)).all()
+
+    def explain(self, statement) -> str:
+        if not isinstance(statement, str):
+            statement = statement.compile(dialect=self.engine.dialect, compile_kwargs={"literal_binds": True})
+        with self.engine.connect() as conn:
+            return "\n".join(conn.execute(text(f"EXPLAIN {statement}")).scalars())
+
+    # DML with bindparams can't render literal binds; inline them the driver's way.
+    def with_binds(self, statement, **binds) -> str:
+        compiled = statement.compile(dialect=self.engine.dialect)
+        with self.engine.connect() as conn:
+            cursor = conn.connection.cursor()
+            return cursor.mogrify(str(compiled), {**compiled.params, **binds}).decode()
+
+    # The SQL an ORM call sends for contacts, with its parameters inlined.
+    def contact_sql(self, action) -> list[str]:
+        sent = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if re.search(r"\bcontacts\b", statement) and not statement.startswith("INSERT") and not executemany:
+                sent.append(cursor.mogrify(statement, parameters).decode())
+        event.listen(self.engine, "before_cursor_execute", capture)
+        try:
+            with Session(self.engine) as db:
+                action(db)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", capture)
+        return sent
+
+    def test_online_migration_keeps_writes_made_while_copying(self):
+        partitions.prepare(self.engine, MODULUS)
+        with self.engine.begin() as conn:
+            conn.execute(update(contacts).where(contacts.c.id == 1).values(first_name="renamed"))
+            conn.execute(delete(contacts).where(contacts.c.id == 2))
+            conn.execute(insert(contacts).values(first_name="late", last_name="row", email="late@example.com",
+                                                 owner_id=OWNER, search_document="late row"))
+        expected = self.rows()
+        partitions.copy_rows(self.engine, batch_size=7, report=quiet)
+        partitions.swap(self.engine)
+
+        with self.engine.connect() as conn:
+            self.assertTrue(partitions.is_partitioned(conn))
+            self.assertEqual(len(partitions.partitions_of(conn)), MODULUS)
+        self.assertEqual(self.rows(), expected)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE contacts{partitions.RETIRED_SUFFIX}"))
+        with Session(self.engine) as db:
+            created = crud.create_contact(db, schemas.ContactCreate(
+                first_name="New", last_name="Contact", email="new@example.com",
+                phone_number="+380671234567", birthday=date(2000, 1, 1)), OWNER)
+            self.assertGreater(created.id, expected[-1].id)
+
+    def test_every_contact_query_prunes_to_one_partition(self):
+        self.assertEqual(partitions.partition_contacts(self.engine, MODULUS, batch_size=50, report=quiet), 200)
+        statements = {
+            "list": crud.contacts_statement(user_id=OWNER),
+            "page": crud.contacts_page_statement(OWNER, crud.encode_contact_cursor(OWNER, "name3", 5), 10),
+            "search": search.search_statement("postgresql", "name1", OWNER),
+            "birthdays": birthdays.upcoming_statement(OWNER, days=30, today=date(2024, 3, 1)),
+            "changes": versions.changed_statement(OWNER, 1),
+            "phones": phones.lookup_statement("postgresql", OWNER, [phones.lookup_key("0500000007"),
+                                                                    phones.lookup_key("0000027")]),
+            "data": contact_data.apply_filters(crud.contacts_statement(user_id=OWNER), "postgresql", {"tags": ["vip"]}),
+            "batch update": self.with_binds(batch.UPDATE_STATEMENT.values(first_name="Renamed"),
+                                            target_id=7, target_owner_id=OWNER),
+            "batch delete": batch.delete_statement([OWNER], [7, 27]),
+            "batch resolve": batch.resolve_statement(
+                UserSnapshot(id=OWNER, email="user7@example.com", role="user", avatar_url=None), [7, 27]),
+        }
+        update = schemas.ContactUpdate(first_name="Renamed", last_name="Row", email="renamed@example.com",
+                                       phone_number="+380501234567", birthday=date(1990, 1, 1))
+        orm_calls = {
+            "get": lambda db: crud.get_contact(db, 7, OWNER),
+            "update": lambda db: crud.update_contact(db, 27, update, OWNER),
+            "delete": lambda db: crud.delete_contact(db, 47, OWNER),
+        }
+        for label, action in orm_calls.items():
+            sent = self.contact_sql(action)
+            self.assertTrue(sent, label)
+            for index, sql in enumerate(sent):
+                statements[f"{label} #{index}"] = sql
+        for label, statement in statements.items():
+            with self.subTest(label):
+                plan = self.explain(statement)
+                self.assertEqual(len(set(re.findall(r"\bcontacts_p\d+\b", plan))), 1, plan)
+
+
+class TestPartitionsNeedPostgres(unittest.TestCase):
+
+    def test_refuses_other_databases(self):
+        with self.assertRaises(RuntimeError):
+            partitions.partition_contacts(create_engine("sqlite://"), MODULUS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app import passwords
+from app.passwords import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.hasher = PasswordHasher("thread", max_workers=1, max_pending=1)
+
+    async def asyncTearDown(self):
+        self.hasher.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash("password123")
+        self.assertEqual(await self.hasher.verify("password123", hashed), (True, None))
+        valid, _ = await self.hasher.verify("wrong", hashed)
+        self.assertFalse(valid)
+
+    async def test_saturated_pool_returns_503(self):
+        hashed = await self.hasher.hash("password123")
+        first = asyncio.create_task(self.hasher.verify("password123", hashed))
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as exc:
+            await self.hasher.verify("password123", hashed)
+        self.assertEqual(exc.exception.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        await first
+
+    async def test_legacy_hash_is_upgraded(self):
+        legacy = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password123")
+        valid, new_hash = await self.hasher.verify("password123", legacy)
+        self.assertTrue(valid)
+        self.assertIsNotNone(new_hash)
+        self.assertTrue(passwords.pwd_context.verify("password123", new_hash))
+
+
+if __name__ == '__main__':
+    unittest.main()
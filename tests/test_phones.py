@@ -0,0 +1,69 @@
+import unittest
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+from app import crud, models, phones, schemas
+from database import Base
+
+
+def contact_data(name: str, phone_number: str) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=name, last_name="Doe", email=f"{name.lower()}@example.com",
+                                 phone_number=phone_number, birthday=date(1990, 1, 1))
+
+
+class TestPhones(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x")])
+        self.session.commit()
+        self.john = crud.create_contact(self.session, contact_data("John", "+380 50 123 45 67"), user_id=1)
+        self.jane = crud.create_contact(self.session, contact_data("Jane", "(044) 765-43-21"), user_id=1)
+        crud.create_contact(self.session, contact_data("Other", "+380501234567"), user_id=2)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_phone_numbers_are_normalized_on_write(self):
+        self.assertEqual(self.john.phone_e164, "+380501234567")
+        self.assertEqual(self.john.phone_reversed, "765432105083")
+        self.assertEqual(self.jane.phone_e164, "+380447654321")
+
+        crud.update_contact(self.session, self.jane.id, contact_data("Jane", "not a number"), user_id=1)
+        self.assertIsNone(self.jane.phone_e164)
+        self.assertIsNone(self.jane.phone_reversed)
+
+    def test_lookup_matches_exact_numbers_within_owner(self):
+        results = phones.lookup(self.session, 1, ["0501234567", "+380447654321", "+380931112233"])
+        self.assertEqual([r["e164"] for r in results], ["+380501234567", "+380447654321", "+380931112233"])
+        self.assertEqual([[c["id"] for c in r["contacts"]] for r in results],
+                         [[self.john.id], [self.jane.id], []])
+
+    def test_lookup_matches_suffixes_and_ignores_fragments(self):
+        results = phones.lookup(self.session, 1, ["123-45-67", "45"])
+        self.assertIsNone(results[0]["e164"])
+        self.assertEqual([c["id"] for c in results[0]["contacts"]], [self.john.id])
+        self.assertEqual(results[1]["contacts"], [])
+
+    def test_lookup_size_is_limited(self):
+        with self.assertRaises(HTTPException) as raised:
+            phones.check_lookup_size(phones.MAX_NUMBERS + 1)
+        self.assertEqual(raised.exception.status_code, 413)
+
+    def test_backfill_fills_missing_columns(self):
+        self.session.execute(update(models.Contact).values(phone_e164=None, phone_reversed=None))
+        self.session.commit()
+        self.assertEqual(phones.backfill_phone_numbers(self.session, batch_size=2), 3)
+        self.session.expire_all()
+        self.assertEqual(self.session.get(models.Contact, (self.john.id, 1)).phone_reversed, "765432105083")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import ipaddress
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app import ratelimit
+from app.ratelimit import MemoryStorage, Rate, RedisStorage, SQLiteStorage
+
+try:
+    import fakeredis
+    import lupa  # noqa: F401  (fakeredis needs it for EVAL)
+except ImportError:
+    fakeredis = None
+
+
+class StorageContract:
+    def make_storage(self):
+        raise NotImplementedError
+
+    def test_allows_burst_then_rejects(self):
+        storage = self.make_storage()
+        rate = Rate.parse("3/minute")
+        results = [asyncio.run(storage.hit("k", rate, 1000.0)) for _ in range(4)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        self.assertAlmostEqual(results[-1][1], 20.0, places=3)
+
+    def test_capacity_recovers_over_time(self):
+        storage = self.make_storage()
+        rate = Rate.parse("2/second")
+        for _ in range(2):
+            asyncio.run(storage.hit("k", rate, 1000.0))
+        self.assertFalse(asyncio.run(storage.hit("k", rate, 1000.0))[0])
+        self.assertTrue(asyncio.run(storage.hit("k", rate, 1000.5))[0])
+
+    def test_keys_are_independent(self):
+        storage = self.make_storage()
+        rate = Rate.parse("1/minute")
+        self.assertTrue(asyncio.run(storage.hit("a", rate, 1000.0))[0])
+        self.assertTrue(asyncio.run(storage.hit("b", rate, 1000.0))[0])
+
+
+class TestMemoryStorage(StorageContract, unittest.TestCase):
+    def make_storage(self):
+        return MemoryStorage()
+
+
+class TestSQLiteStorage(StorageContract, unittest.TestCase):
+    def make_storage(self):
+        directory = tempfile.mkdtemp()
+        return SQLiteStorage(os.path.join(directory, "ratelimit.db"))
+
+    def test_expired_keys_are_pruned(self):
+        storage = self.make_storage()
+        rate = Rate.parse("1/second")
+        asyncio.run(storage.hit("old", rate, 1000.0))
+        asyncio.run(storage.hit("new", rate, 1000.0 + storage.PRUNE_INTERVAL))
+        keys = sqlite3.connect(storage.path).execute("SELECT key FROM rate_limits").fetchall()
+        self.assertEqual(keys, [("new",)])
+
+    def test_locked_database_fails_open(self):
+        storage = self.make_storage()
+        rate = Rate.parse("1/minute")
+        asyncio.run(storage.hit("k", rate, 1000.0))
+        writer = sqlite3.connect(storage.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            self.assertEqual(asyncio.run(storage.hit("k", rate, 1000.0)), (True, 0.0))
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+        self.assertFalse(asyncio.run(storage.hit("k", rate, 1000.0))[0])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis[lua] not installed")
+class TestRedisStorage(StorageContract, unittest.TestCase):
+    def make_storage(self):
+        return RedisStorage(fakeredis.aioredis.FakeRedis())
+
+
+class TestClientIp(unittest.TestCase):
+
+    def request(self, host, forwarded=None):
+        request = MagicMock()
+        request.client.host = host
+        request.headers = {"x-forwarded-for": forwarded} if forwarded else {}
+        return request
+
+    @patch.object(ratelimit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    def test_forwarded_for_is_used_behind_trusted_proxy(self):
+        request = self.request("10.0.0.5", "203.0.113.9, 10.0.0.7")
+        self.assertEqual(ratelimit.client_ip(request), "203.0.113.9")
+
+    @patch.object(ratelimit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    def test_forwarded_for_from_untrusted_peer_is_ignored(self):
+        request = self.request("198.51.100.1", "203.0.113.9")
+        self.assertEqual(ratelimit.client_ip(request), "198.51.100.1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.replicas import ReplicaRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+# SQLite files stand in for the primary and its replicas; each one holds its
+# own name so a query tells which database served it.
+class TestReplicaRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.engines = {}
+        for name in ("primary", "replica1", "replica2"):
+            engine = create_engine(f"sqlite:///{os.path.join(self.workdir, name + '.db')}")
+            with engine.begin() as conn:
+                conn.execute(text("CREATE TABLE server (name TEXT)"))
+                conn.execute(text("INSERT INTO server VALUES (:name)"), {"name": name})
+            self.engines[name] = engine
+        self.clock = FakeClock()
+        self.router = self.make_router(self.engines["replica1"], self.engines["replica2"])
+
+    def tearDown(self):
+        for engine in self.engines.values():
+            engine.dispose()
+
+    def make_router(self, *replicas):
+        factory = sessionmaker(autoflush=False, bind=self.engines["primary"])
+        return ReplicaRouter(factory, self.engines["primary"], replicas,
+                             sticky_seconds=5, retry_seconds=30, clock=self.clock)
+
+    def served_by(self, user_id=None, router=None) -> str:
+        with (router or self.router).session(user_id) as db:
+            return db.execute(text("SELECT name FROM server")).scalar()
+
+    def test_reads_rotate_over_replicas(self):
+        served = [self.served_by() for _ in range(4)]
+        self.assertEqual(sorted(served), ["replica1", "replica1", "replica2", "replica2"])
+        self.assertNotEqual(served[0], served[1])
+
+    def test_without_replicas_reads_use_primary(self):
+        self.assertEqual(self.served_by(router=self.make_router()), "primary")
+
+    def test_recent_writer_reads_from_primary(self):
+        self.router.mark_written(7)
+        self.assertEqual(self.served_by(7), "primary")
+        self.assertTrue(self.served_by(8).startswith("replica"))
+        self.clock.now += 6
+        self.assertTrue(self.served_by(7).startswith("replica"))
+
+    def test_unreachable_replica_falls_back_and_is_skipped(self):
+        broken = create_engine(f"sqlite:///{os.path.join(self.workdir, 'missing', 'replica.db')}")
+        router = self.make_router(broken)
+        self.assertEqual(self.served_by(router=router), "primary")
+        self.assertEqual(router.healthy_replicas(), [])
+
+        self.clock.now += 31
+        self.assertEqual(router.healthy_replicas(), [broken])
+        router.check_health()
+        self.assertEqual(router.healthy_replicas(), [])
+
+    def test_health_check_restores_replica(self):
+        self.router.mark_down(self.engines["replica1"])
+        self.assertEqual({self.served_by() for _ in range(3)}, {"replica2"})
+        self.router.check_health()
+        self.assertEqual({self.served_by() for _ in range(4)}, {"replica1", "replica2"})
+
+
+if __name__ == '__main__':
+    unittest.main()
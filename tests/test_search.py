@@ -0,0 +1,63 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas, search
+from database import Base
+
+
+def contact_data(first_name: str, last_name: str) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=first_name, last_name=last_name,
+                                 email=f"{first_name.lower()}.{last_name.lower()}@example.com",
+                                 phone_number="1234567890", birthday=date(1990, 1, 1))
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x")])
+        self.session.commit()
+        self.john = crud.create_contact(self.session, contact_data("John", "Doe"), 1)
+        self.jane = crud.create_contact(self.session, contact_data("Jane", "Smith"), 1)
+        self.johnson = crud.create_contact(self.session, contact_data("Mary", "Johnson"), 1)
+        crud.create_contact(self.session, contact_data("John", "Other"), 2)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_indexed_queries_use_fts5(self):
+        statement = search.search_statement("sqlite", "smith", 1)
+        self.assertIn("contacts_fts MATCH", str(statement))
+        self.assertNotIn("contacts_fts", str(search.search_statement("sqlite", "sm", 1)))
+
+    def test_search_is_case_insensitive(self):
+        self.assertEqual(crud.search_contacts(self.session, "SMITH", 1), [self.jane])
+
+    def test_search_matches_substrings_of_own_contacts(self):
+        found = crud.search_contacts(self.session, "john", 1)
+        self.assertEqual({contact.id for contact in found}, {self.john.id, self.johnson.id})
+
+    def test_short_query_falls_back_to_substring_scan(self):
+        self.assertEqual(crud.search_contacts(self.session, "sm", 1), [self.jane])
+
+    def test_quotes_in_query_are_literal(self):
+        self.assertEqual(crud.search_contacts(self.session, 'jo"hn', 1), [])
+
+    def test_search_is_paginated(self):
+        first_page = crud.search_contacts(self.session, "example.com", 1, limit=2)
+        second_page = crud.search_contacts(self.session, "example.com", 1, skip=2, limit=2)
+        self.assertEqual(len(first_page), 2)
+        self.assertEqual(len(second_page), 1)
+        self.assertEqual({contact.id for contact in first_page + second_page},
+                         {self.john.id, self.jane.id, self.johnson.id})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from datetime import date
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas, serialization
+from database import Base
+
+
+class TestSerialization(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=cls.engine)
+        cls.session = Session(bind=cls.engine)
+        cls.session.add_all([
+            models.User(id=1, email="test@example.com", hashed_password="x"),
+            models.Contact(id=1, first_name="Тарас", last_name="Шевченко", email="taras@example.com",
+                           phone_number="+380501234567", birthday=date(1814, 3, 9), owner_id=1),
+            models.Contact(id=2, first_name="Jane", last_name="Smith \"J\"", email="jane@example.com",
+                           phone_number="9876543210", birthday=date(1985, 5, 15),
+                           additional_data={"note": "line\n\"two\"", "tags": ["vip"]}, owner_id=1),
+        ])
+        cls.session.commit()
+
+    def orm_body(self, statement) -> bytes:
+        contacts = [schemas.Contact.from_orm(c) for c in self.session.scalars(statement).all()]
+        return JSONResponse(jsonable_encoder(contacts)).body
+
+    def test_fast_path_is_byte_identical_to_response_model(self):
+        statement = crud.contacts_statement(user_id=1)
+        rows = serialization.select_contact_rows(self.session, statement)
+        fast = serialization.ContactsJSONResponse(serialization.contact_dicts(rows)).body
+        self.assertEqual(fast, self.orm_body(statement))
+
+    def test_stdlib_fallback_is_byte_identical(self):
+        statement = crud.contacts_statement(user_id=1)
+        rows = serialization.select_contact_rows(self.session, statement)
+        orjson, serialization.orjson = serialization.orjson, None
+        try:
+            fallback = serialization.dumps(serialization.contact_dicts(rows))
+        finally:
+            serialization.orjson = orjson
+        self.assertEqual(fallback, self.orm_body(statement))
+
+    def test_missing_statement_is_empty(self):
+        self.assertEqual(serialization.select_contact_rows(self.session, None), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from app import serve
+
+
+class TestServe(unittest.TestCase):
+
+    def test_pools_stay_under_the_connection_ceiling(self):
+        for workers in (1, 2, 4, 8, 16, 45):
+            pool_size, max_overflow = serve.pool_sizes(workers, max_connections=100, reserved=10, preferred_pool_size=5)
+            total = workers * serve.ENGINES_PER_WORKER * (pool_size + max_overflow)
+            self.assertLessEqual(total, 90)
+            self.assertGreaterEqual(pool_size, 1)
+            self.assertLessEqual(pool_size, 5)
+
+    def test_single_worker_keeps_preferred_pool_size(self):
+        self.assertEqual(serve.pool_sizes(1, max_connections=100, reserved=10, preferred_pool_size=5), (5, 40))
+
+    def test_worker_count_defaults_to_available_cpus(self):
+        self.assertGreaterEqual(serve.cpu_count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import create_engine, insert, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import batch, bulk, crud, dedupe, models, schemas, stats, verification
+from app.cache import UserSnapshot
+from database import Base
+
+
+def contact_data(name: str, birthday=date(1990, 3, 1)) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=name, last_name="Doe", email=f"{name.lower()}@example.com",
+                                 phone_number="+380501234567", birthday=birthday)
+
+
+def months(**counts) -> dict:
+    return {month: counts.get(f"m{month}", 0) for month in stats.MONTHS}
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add_all([models.User(id=1, email="one@example.com", hashed_password="x"),
+                              models.User(id=2, email="two@example.com", hashed_password="x", is_verified=True)])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_orm_writes_keep_counters_in_step(self):
+        ann = crud.create_contact(self.session, contact_data("Ann"), 1)
+        bob = crud.create_contact(self.session, contact_data("Bob"), 1)
+        crud.create_contact(self.session, contact_data("Cid", birthday=date(1985, 7, 9)), 2)
+        crud.update_contact(self.session, bob.id, contact_data("Bob", birthday=date(1990, 12, 24)), 1)
+        crud.update_contact(self.session, ann.id, contact_data("Ann", birthday=date(1990, 7, 1)), 1)
+        crud.delete_contact(self.session, bob.id, 1)
+
+        self.assertEqual(stats.owner_stats(self.session, 1), {"contacts": 1, "birthdays_by_month": months(m7=1)})
+        self.assertEqual(stats.owner_stats(self.session, 2), {"contacts": 1, "birthdays_by_month": months(m7=1)})
+        self.assertEqual(stats.site_stats(self.session), {
+            "users": {"total": 2, "verified": 1, "unverified": 1},
+            "contacts": 2, "birthdays_by_month": months(m7=2)})
+        self.assertEqual(stats.reconcile(self.session), 0)
+
+    def test_merge_and_verification_are_counted(self):
+        keep = crud.create_contact(self.session, contact_data("Ann", birthday=date(1990, 1, 1)), 1)
+        other = crud.create_contact(self.session, contact_data("Anna"), 1)
+        dedupe.merge(self.session, 1, keep.id, [other.id])
+        token = verification.issue(self.session, 1)
+        self.session.commit()
+        verification.consume(self.session, token)
+
+        self.assertEqual(stats.owner_stats(self.session, 1), {"contacts": 1, "birthdays_by_month": months(m1=1)})
+        self.assertEqual(stats.site_stats(self.session)["users"], {"total": 2, "verified": 2, "unverified": 0})
+        self.assertEqual(stats.reconcile(self.session), 0)
+
+    def test_rolled_back_writes_are_not_counted(self):
+        self.session.add(models.Contact(first_name="Ann", email="ann@example.com", owner_id=1))
+        self.session.flush()
+        self.session.rollback()
+        self.assertEqual(stats.owner_stats(self.session, 1)["contacts"], 0)
+
+    def test_site_rows_are_spread_over_slots(self):
+        for index in range(40):
+            crud.create_contact(self.session, contact_data(f"Name{index}"), 1)
+        slots = self.session.execute(text("SELECT count(*) FROM stat_counters WHERE scope = 0 AND metric = 'contacts'"))
+        self.assertGreater(slots.scalar(), 1)
+        self.assertEqual(stats.site_stats(self.session)["contacts"], 40)
+
+    def test_reconcile_corrects_drift(self):
+        crud.create_contact(self.session, contact_data("Ann"), 1)
+        # Rows written behind the app's back, and a counter knocked off.
+        self.session.execute(insert(models.Contact), [
+            {"first_name": "Raw", "email": f"raw{index}@example.com", "owner_id": 2,
+             "birthday": date(1990, 5, 5), "birthday_ordinal": 505} for index in range(3)])
+        self.session.execute(update(models.User).where(models.User.id == 1).values(is_verified=True))
+        self.session.execute(text("UPDATE stat_counters SET value = value + 10 WHERE scope = 1 AND metric = 'contacts'"))
+        self.session.commit()
+
+        self.assertGreater(stats.reconcile(self.session, batch_size=1), 0)
+        self.assertEqual(stats.owner_stats(self.session, 1), {"contacts": 1, "birthdays_by_month": months(m3=1)})
+        self.assertEqual(stats.owner_stats(self.session, 2), {"contacts": 3, "birthdays_by_month": months(m5=3)})
+        self.assertEqual(stats.site_stats(self.session), {
+            "users": {"total": 2, "verified": 2, "unverified": 0},
+            "contacts": 4, "birthdays_by_month": months(m3=1, m5=3)})
+        self.assertEqual(stats.top_owners(self.session, 1), [{"user_id": 2, "contacts": 3}])
+        self.assertEqual(stats.reconcile(self.session), 0)
+
+
+async def body(text_body: str):
+    yield text_body.encode()
+
+
+class TestStatsCoreWrites(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)()
+        self.session.add(models.User(id=1, email="one@example.com", hashed_password="x"))
+        await self.session.commit()
+        self.user = UserSnapshot(id=1, email="one@example.com", role="user", avatar_url=None)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def owner_stats(self) -> dict:
+        return await self.session.run_sync(stats.owner_stats, 1)
+
+    async def test_batch_and_import_are_counted(self):
+        results = await batch.create_contacts(self.session, self.user, [contact_data("Ann"), contact_data("Bob")])
+        ann, bob = (result["id"] for result in results)
+        await batch.update_contacts(self.session, self.user, [
+            schemas.ContactBatchUpdate(id=ann, **contact_data("Ann", birthday=date(1990, 8, 8)).dict())])
+        await batch.delete_contacts(self.session, self.user, [bob])
+        # The duplicate email row is rejected and must not be counted.
+        ndjson = ('{"first_name": "Cid", "last_name": "Doe", "email": "cid@example.com", '
+                  '"phone_number": "+380501234567", "birthday": "1990-08-01"}\n'
+                  '{"first_name": "Ann", "last_name": "Doe", "email": "ann@example.com", '
+                  '"phone_number": "+380501234567", "birthday": "1990-01-01"}\n')
+        report = await bulk.import_contacts(self.session, 1, body(ndjson), "ndjson")
+
+        self.assertEqual(report["inserted"], 1)
+        self.assertEqual(await self.owner_stats(), {"contacts": 2, "birthdays_by_month": months(m8=2)})
+        self.assertEqual(await self.session.run_sync(stats.reconcile), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from jose import jwt
+
+from app import tokens
+from app.tokens import RevocationList, TokenError, TokenService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenService(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.service = TokenService({"k1": "secret-1"}, "k1", clock=self.clock)
+        self.user = SimpleNamespace(id=7, email="test@example.com", role="user")
+
+    def test_round_trip_carries_embedded_claims(self):
+        token, _ = self.service.issue(self.user)
+        claims = self.service.verify(token)
+        self.assertEqual((claims["sub"], claims["uid"], claims["role"]), ("test@example.com", 7, "user"))
+
+    def test_tampered_token_is_rejected(self):
+        token, _ = self.service.issue(self.user)
+        header, payload, signature = token.split(".")
+        forged, _ = TokenService({"k1": "other"}, "k1", clock=self.clock).issue(
+            SimpleNamespace(id=7, email="test@example.com", role="admin"))
+        with self.assertRaises(TokenError):
+            self.service.verify(f"{header}.{forged.split('.')[1]}.{signature}")
+
+    def test_expired_token_is_rejected(self):
+        self.clock.now -= self.service.access_minutes * 60 + 1
+        token, _ = self.service.issue(self.user)
+        with self.assertRaises(TokenError):
+            self.service.verify(token)
+
+    def test_refresh_token_is_not_an_access_token(self):
+        token, _ = self.service.issue(self.user, "refresh")
+        with self.assertRaises(TokenError):
+            self.service.verify(token)
+        self.assertEqual(self.service.verify(token, "refresh")["type"], "refresh")
+
+    def test_key_rotation(self):
+        old_token, _ = self.service.issue(self.user)
+        rotated = TokenService({"k1": "secret-1", "k2": "secret-2"}, "k2", clock=self.clock)
+        new_token, _ = rotated.issue(self.user)
+        self.assertEqual(rotated.verify(old_token)["uid"], 7)
+        retired = TokenService({"k2": "secret-2"}, "k2", clock=self.clock)
+        with self.assertRaises(TokenError):
+            retired.verify(old_token)
+        self.assertEqual(retired.verify(new_token)["uid"], 7)
+
+    def test_from_env_refuses_to_run_without_a_key(self):
+        with patch.object(tokens.settings, "secret_key", None), patch.object(tokens.settings, "jwt_keys", None):
+            with self.assertRaises(ValueError):
+                TokenService.from_env()
+        with patch.object(tokens.settings, "secret_key", "configured"), patch.object(tokens.settings, "jwt_keys", None):
+            self.assertEqual(TokenService.from_env().keys, {"default": "configured"})
+
+    def test_token_without_kid_verifies_with_active_key(self):
+        legacy = jwt.encode({"sub": "test@example.com", "exp": int(self.clock.now) + 60}, "secret-1", algorithm="HS256")
+        self.assertEqual(self.service.verify(legacy)["sub"], "test@example.com")
+
+    def test_revoked_jti_and_user(self):
+        token, claims = self.service.issue(self.user)
+        self.service.revocations.revoke_jti(claims["jti"])
+        with self.assertRaises(TokenError):
+            self.service.verify(token)
+
+        other_token, _ = self.service.issue(self.user)
+        self.service.revocations.revoke_user(self.user.id, self.clock.now + 1)
+        with self.assertRaises(TokenError):
+            self.service.verify(other_token)
+        self.clock.now += 2
+        fresh_token, _ = self.service.issue(self.user)
+        self.assertEqual(self.service.verify(fresh_token)["uid"], 7)
+
+    def test_refresh_replaces_deny_set_from_loader(self):
+        revocations = RevocationList(loader=lambda: ({"abc"}, {7: 10.0}))
+        revocations.refresh()
+        self.assertTrue(revocations.is_revoked({"jti": "abc"}))
+        self.assertTrue(revocations.is_revoked({"jti": "x", "uid": 7, "iat": 5}))
+        self.assertFalse(revocations.is_revoked({"jti": "x", "uid": 7, "iat": 11}))
+
+    def test_local_revocation_made_during_a_load_survives_it(self):
+        def loader():
+            # The SELECT has run; the request revoking "new" commits after it.
+            revocations.revoke_jti("new")
+            revocations.revoke_user(7, 10.0)
+            return {"old"}, {}
+
+        revocations = RevocationList(loader=loader, clock=FakeClock())
+        revocations.refresh()
+        self.assertTrue(revocations.is_revoked({"jti": "new"}))
+        self.assertTrue(revocations.is_revoked({"jti": "x", "uid": 7, "iat": 5}))
+
+        # Once the database has it, the local entry is no longer needed.
+        revocations.loader = lambda: ({"old", "new"}, {7: 10.0})
+        revocations.refresh()
+        self.assertEqual(revocations._pending_jtis, {})
+        self.assertTrue(revocations.is_revoked({"jti": "new"}))
+
+    def test_uncommitted_local_revocation_expires(self):
+        clock = FakeClock()
+        revocations = RevocationList(loader=lambda: (set(), {}), clock=clock)
+        revocations.revoke_jti("rolled-back")
+        revocations.refresh()
+        self.assertTrue(revocations.is_revoked({"jti": "rolled-back"}))
+        clock.now += tokens.PENDING_GRACE + 1
+        revocations.refresh()
+        self.assertFalse(revocations.is_revoked({"jti": "rolled-back"}))
+
+    def test_token_cannot_choose_another_algorithm(self):
+        other = TokenService({"k1": "secret-1"}, "k1", algorithm="HS512", clock=self.clock)
+        token, _ = other.issue(self.user)
+        with self.assertRaises(TokenError):
+            self.service.verify(token)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app import models, verification
+from app.cache import UserSnapshot, user_cache
+from database import Base
+
+
+class TestVerification(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add(models.User(id=1, email="test@example.com", hashed_password="x"))
+        self.session.commit()
+        self.now = datetime(2024, 5, 1, 12, 0)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def issue(self, now=None) -> str:
+        token = verification.issue(self.session, 1, now=now or self.now)
+        self.session.commit()
+        return token
+
+    def is_verified(self) -> bool:
+        return self.session.scalar(select(models.User.is_verified).where(models.User.id == 1))
+
+    def test_token_is_stored_hashed(self):
+        token = self.issue()
+        stored = self.session.scalar(select(models.EmailVerificationToken.token_hash))
+        self.assertNotEqual(stored, token)
+        self.assertEqual(stored, verification.hash_token(token))
+
+    def test_consume_verifies_once(self):
+        token = self.issue()
+        self.assertFalse(self.is_verified())
+        self.assertEqual(verification.consume(self.session, token, now=self.now), 1)
+        self.assertTrue(self.is_verified())
+        self.assertIsNone(verification.consume(self.session, token, now=self.now))
+
+    def test_consume_drops_cached_user(self):
+        token = self.issue()
+        user_cache.set("test@example.com", UserSnapshot(id=1, email="test@example.com", role="user", avatar_url=None))
+        verification.consume(self.session, token, now=self.now)
+        self.assertIsNone(user_cache.get("test@example.com"))
+
+    def test_unknown_and_expired_tokens_are_rejected(self):
+        token = self.issue()
+        self.assertIsNone(verification.consume(self.session, "unknown", now=self.now))
+        expired = self.now + timedelta(hours=verification.TOKEN_TTL_HOURS, seconds=1)
+        self.assertIsNone(verification.consume(self.session, token, now=expired))
+        self.assertFalse(self.is_verified())
+
+    def test_purge_removes_expired_tokens_in_batches(self):
+        for _ in range(5):
+            self.issue(now=self.now - timedelta(hours=verification.TOKEN_TTL_HOURS + 1))
+        fresh = self.issue()
+        purged = verification.purge_expired(self.session, batch_size=2, now=self.now)
+        self.assertEqual(purged, 5)
+        self.assertEqual(self.session.scalar(select(func.count()).select_from(models.EmailVerificationToken)), 1)
+        self.assertEqual(verification.consume(self.session, fresh, now=self.now), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas, versions
+from database import Base
+
+
+def contact_data(name: str) -> schemas.ContactCreate:
+    return schemas.ContactCreate(first_name=name, last_name="Doe", email=f"{name.lower()}@example.com",
+                                 phone_number="1234567890", birthday=date(1990, 1, 1))
+
+
+class TestVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(bind=self.engine)
+        self.session.add(models.User(id=1, email="test@example.com", hashed_password="x"))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def current(self) -> int:
+        return versions.get_versions(self.session, 1).contacts_version
+
+    def test_writes_bump_version_and_leave_tombstones(self):
+        john = crud.create_contact(self.session, contact_data("John"), user_id=1)
+        jane = crud.create_contact(self.session, contact_data("Jane"), user_id=1)
+        self.assertEqual((john.version, jane.version, self.current()), (1, 2, 2))
+
+        crud.update_contact(self.session, john.id, contact_data("Johnny"), user_id=1)
+        crud.delete_contact(self.session, jane.id, user_id=1)
+        self.assertEqual(self.current(), 4)
+
+        changed = self.session.scalars(versions.changed_statement(1, since=2)).all()
+        self.assertEqual([c.first_name for c in changed], ["Johnny"])
+        self.assertEqual(versions.deleted_ids(self.session, 1, since=2), [jane.id])
+        self.assertEqual(versions.deleted_ids(self.session, 1, since=0), [])
+
+    def test_changes_are_paged_on_version_boundaries(self):
+        john, jane, jim, joe = (crud.create_contact(self.session, contact_data(name), user_id=1)
+                                for name in ("John", "Jane", "Jim", "Joe"))
+        # Like a batch write: two rows share one version.
+        self.session.execute(update(models.Contact).where(models.Contact.id.in_([jim.id, joe.id])).values(version=4))
+        crud.delete_contact(self.session, jane.id, user_id=1)
+
+        self.assertEqual(versions.changes_until(self.session, 1, since=0, limit=2), (1, True))
+        self.assertEqual(versions.changes_until(self.session, 1, since=1, limit=2), (4, True))
+        self.assertEqual(versions.changes_until(self.session, 1, since=1, limit=1), (4, True))
+        self.assertEqual(versions.changes_until(self.session, 1, since=4, limit=2), (None, False))
+        self.assertEqual(versions.changes_until(self.session, 1, since=0, limit=10), (None, False))
+
+        changed = self.session.scalars(versions.changed_statement(1, since=1, until=4)).all()
+        self.assertEqual([c.first_name for c in changed], ["Jim", "Joe"])
+        self.assertEqual(versions.deleted_ids(self.session, 1, since=1, until=4), [])
+        self.assertEqual(versions.deleted_ids(self.session, 1, since=4), [jane.id])
+
+    def test_purge_raises_floor(self):
+        contact = crud.create_contact(self.session, contact_data("John"), user_id=1)
+        crud.delete_contact(self.session, contact.id, user_id=1)
+        self.session.query(models.ContactTombstone).update(
+            {"created_at": datetime.utcnow() - timedelta(days=versions.TOMBSTONE_RETENTION_DAYS + 1)})
+        self.session.commit()
+        self.assertEqual(versions.purge_tombstones(self.session), 1)
+        self.assertEqual(versions.get_versions(self.session, 1).contacts_version_floor, 2)
+
+    def test_etag_matching_is_weak(self):
+        tag = versions.etag(1, 7)
+        self.assertEqual(tag, 'W/"1.7"')
+        self.assertTrue(versions.etag_matches('"1.7"', tag))
+        self.assertTrue(versions.etag_matches('W/"1.6", W/"1.7"', tag))
+        self.assertTrue(versions.etag_matches("*", tag))
+        self.assertFalse(versions.etag_matches('W/"1.6"', tag))
+        self.assertFalse(versions.etag_matches(None, tag))
+
+
+if __name__ == '__main__':
+    unittest.main()